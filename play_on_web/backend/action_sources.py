@@ -0,0 +1,468 @@
+"""
+动作源模块 - 在控制循环中运行遥操作、脚本控制器或本地策略
+
+控制线程每个周期把缓存的观测值（以及动作源声明需要的相机最新帧）交给各个已启用的
+动作源，每个动作源返回一个动作字典，或 None 表示本周期不输出。仲裁按优先级逐字段合并：
+同一字段由优先级最高的动作源决定，其余字段由低优先级的动作源补齐。
+例如策略控制右臂、操作员用键盘控制左臂和底盘。
+
+遥操作本身也是一个动作源（TeleopSource）。它不输出的字段会跟随实际下发的指令，
+因此操作员随时可以从策略手中平滑接管。
+
+计算量大的策略在独立进程中运行（ProcessActionSource）。观测值与相机帧通过共享内存传入，
+动作通过共享内存取回。控制线程只做非阻塞的读写，策略推理再慢也不会拖住控制循环；
+超过 max_age 的动作视为过期（包括策略进程退出）：底盘速度输出 0，机械臂保持在过期时的位置。
+策略工厂只能从白名单中选择（内置的 POLICY_FACTORIES、POLICY_FACTORIES 配置项，
+以及 POLICY_PACKAGE 配置的受信任包），不能通过 API 导入任意模块。
+
+SinusoidSource 让指定关节围绕启用时的位置做正弦运动，用于在没有模型时测试整条链路。
+运动程序（motion_program.ProgramRunner）也作为动作源执行，结束后自动移除。
+"""
+import time
+import math
+import logging
+import importlib
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from config import settings
+
+if TYPE_CHECKING:
+    from robot_controller import RobotController
+
+logger = logging.getLogger(__name__)
+
+TELEOP_SOURCE = "teleop"
+
+
+class ActionSource:
+    """动作源基类"""
+
+    def __init__(self, name: str, priority: int = 0, cameras: Optional[list[str]] = None):
+        """
+        Args:
+            name: 动作源名称（唯一）
+            priority: 仲裁优先级，数值大的优先
+            cameras: 需要的相机（每个周期随观测值传入最新帧）
+        """
+        self.name = name
+        self.priority = priority
+        self.cameras = list(cameras or [])
+        self.ticks = 0  # 输出动作的周期数
+        self.errors = 0  # compute 抛出异常的次数
+
+    @property
+    def needs_observation(self) -> bool:
+        """是否需要控制线程每个周期读取新的观测值"""
+        return True
+
+    @property
+    def done(self) -> bool:
+        """是否已结束（控制线程在本周期之后移除，如执行完毕的运动程序）"""
+        return False
+
+    def start(self, observation: dict[str, Any]):
+        """启用时调用（observation 为当时的观测值）"""
+
+    def stop(self):
+        """移除时调用"""
+
+    def compute(self, t: float, observation: Optional[dict[str, Any]],
+                frames: dict[str, np.ndarray]) -> Optional[dict[str, float]]:
+        """
+        计算本周期的动作
+
+        Args:
+            t: 本周期时刻（time.monotonic()）
+            observation: 缓存的观测值
+            frames: 相机名 → 最新 RGB 图像
+
+        Returns:
+            动作字典，None 表示本周期不输出
+        """
+        raise NotImplementedError
+
+    def get_status(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": type(self).__name__,
+            "priority": self.priority,
+            "cameras": self.cameras,
+            "ticks": self.ticks,
+            "errors": self.errors,
+        }
+
+
+class TeleopSource(ActionSource):
+    """遥操作动作源：输出设定值插值器朝 ArmState.target_positions 推进的结果（只含仍在运动的关节）"""
+
+    def __init__(self, controller: "RobotController", priority: int = 100):
+        super().__init__(TELEOP_SOURCE, priority)
+        self.controller = controller
+        self._index = {f"{key}.pos": i for i, key in enumerate(controller._servo_keys)}
+        self._keys = list(self._index)
+
+    @property
+    def needs_observation(self) -> bool:
+        return False
+
+    def compute(self, t: float, observation: Optional[dict[str, Any]],
+                frames: dict[str, np.ndarray]) -> Optional[dict[str, float]]:
+        interpolator = self.controller.interpolator
+        if interpolator is None:
+            return None  # 未启用插值时由请求处理函数直接下发
+        interpolator.set_target(self.controller._servo_targets())
+        if interpolator.settled:
+            return None
+        # 只输出仍在运动的关节，不占用其他动作源正在控制的字段
+        moving = np.flatnonzero((interpolator.position != interpolator.target) | (interpolator.velocity != 0))
+        setpoint = interpolator.step()
+        return {self._keys[i]: float(setpoint[i]) for i in moving}
+
+    def follow(self, action: dict[str, float]):
+        """让遥操作的设定值和目标跟随其他动作源下发的关节位置（用于平滑接管）"""
+        interpolator = self.controller.interpolator
+        for key, value in action.items():
+            i = self._index.get(key)
+            if i is None:
+                continue
+            if interpolator is not None:
+                interpolator.position[i] = interpolator.target[i] = value
+                interpolator.velocity[i] = 0.0
+            prefix, joint = key[:-len(".pos")].split("_arm_", 1)
+            arm_state = self.controller.left_arm_state if prefix == "left" else self.controller.right_arm_state
+            arm_state.target_positions[joint] = value
+
+
+class SinusoidSource(ActionSource):
+    """测试用动作源：指定关节围绕启用时的位置做正弦运动"""
+
+    def __init__(self, name: str, joints: list[str], amplitude: float = 10.0, frequency: float = 0.2,
+                 phase_step: float = 0.0, priority: int = 0):
+        """
+        Args:
+            joints: 动作字段，如 ["left_arm_wrist_roll.pos"]
+            amplitude: 振幅（度）
+            frequency: 频率（Hz）
+            phase_step: 相邻关节之间的相位差（弧度）
+        """
+        super().__init__(name, priority)
+        if not joints:
+            raise ValueError("至少需要一个关节")
+        self.joints = list(joints)
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.phases = np.arange(len(self.joints)) * phase_step
+        self.center = np.zeros(len(self.joints))
+        self._t0 = 0.0
+
+    @property
+    def needs_observation(self) -> bool:
+        return False
+
+    def start(self, observation: dict[str, Any]):
+        self.center = np.array([observation.get(joint, 0.0) for joint in self.joints], dtype=np.float64)
+        self._t0 = time.monotonic()
+
+    def compute(self, t: float, observation: Optional[dict[str, Any]],
+                frames: dict[str, np.ndarray]) -> Optional[dict[str, float]]:
+        values = self.center + self.amplitude * np.sin(2 * math.pi * self.frequency * (t - self._t0) + self.phases)
+        return dict(zip(self.joints, values.tolist()))
+
+    def get_status(self) -> dict[str, Any]:
+        status = super().get_status()
+        status.update({"joints": self.joints, "amplitude": self.amplitude, "frequency": self.frequency})
+        return status
+
+
+def make_sinusoid_policy(joints: list[str], amplitude: float = 10.0, frequency: float = 0.2) -> Callable:
+    """进程内策略工厂示例：返回 policy(observation, frames) -> action，用于测试 ProcessActionSource"""
+    start = time.monotonic()
+    center: dict[str, float] = {}
+
+    def policy(observation: dict[str, float], frames: dict[str, np.ndarray]) -> dict[str, float]:
+        if not center:
+            center.update({joint: observation.get(joint, 0.0) for joint in joints})
+        phase = 2 * math.pi * frequency * (time.monotonic() - start)
+        return {joint: center[joint] + amplitude * math.sin(phase) for joint in joints}
+
+    return policy
+
+
+# 内置策略工厂（名称 → "module:function"）
+POLICY_FACTORIES = {
+    "sinusoid": "action_sources:make_sinusoid_policy",
+}
+
+
+def get_policy_factories() -> dict[str, str]:
+    """可用的策略工厂：内置 + POLICY_FACTORIES 配置项（"名称=module:function,..."）"""
+    factories = dict(POLICY_FACTORIES)
+    for item in settings.policy_factories.split(","):
+        name, _, path = item.strip().partition("=")
+        if name and path:
+            factories[name.strip()] = path.strip()
+    return factories
+
+
+def resolve_factory(factory: str) -> str:
+    """
+    把 API 传入的策略工厂解析为 "module:function"，不在白名单中的拒绝
+
+    接受工厂名称（见 get_policy_factories），或位于 POLICY_PACKAGE 受信任包内的 "module:function"。
+
+    Raises:
+        ValueError: 工厂不在白名单中
+    """
+    factories = get_policy_factories()
+    if factory in factories:
+        return factories[factory]
+    if factory in factories.values():
+        return factory
+
+    module_name, _, attr = factory.partition(":")
+    package = settings.policy_package.strip()
+    if package and attr and attr.isidentifier() and not attr.startswith("_") and (
+        module_name == package or module_name.startswith(package + ".")
+    ):
+        return factory
+    raise ValueError(f"策略工厂不在白名单中: {factory}（可用: {sorted(factories)}）")
+
+
+def _load_factory(path: str) -> Callable:
+    """"module:function" → 可调用对象（path 已经过 resolve_factory 检查）"""
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError(f"策略工厂格式应为 module:function: {path}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _policy_worker(factory: str, kwargs: dict[str, Any], observation_keys: list[str], action_keys: list[str],
+                   camera_shapes: dict[str, tuple[int, int, int]], shm_names: dict[str, str],
+                   lock, input_ready, stop_event):
+    """
+    策略进程入口
+
+    共享内存布局：
+        obs:     float64 [输入序号, 时刻, 观测值...]
+        action:  float64 [输出序号, 对应的输入序号, 时刻, 动作...]（NaN 表示不输出该字段）
+        cam:<名称>: uint8 (H, W, 3)
+    """
+    blocks = {key: shared_memory.SharedMemory(name=name) for key, name in shm_names.items()}
+    try:
+        obs_buf = np.ndarray((2 + len(observation_keys),), dtype=np.float64, buffer=blocks["obs"].buf)
+        act_buf = np.ndarray((3 + len(action_keys),), dtype=np.float64, buffer=blocks["action"].buf)
+        cam_bufs = {
+            name: np.ndarray(shape, dtype=np.uint8, buffer=blocks[f"cam:{name}"].buf)
+            for name, shape in camera_shapes.items()
+        }
+        policy = _load_factory(factory)(**kwargs)
+        last_seq = 0.0
+        output_seq = 0
+        frames = {name: np.empty(shape, dtype=np.uint8) for name, shape in camera_shapes.items()}
+
+        while not stop_event.is_set():
+            if not input_ready.wait(timeout=0.5):
+                continue
+            input_ready.clear()
+            with lock:
+                obs_row = obs_buf.copy()
+                for name, buf in cam_bufs.items():
+                    np.copyto(frames[name], buf)
+            if obs_row[0] == last_seq:
+                continue
+            last_seq = obs_row[0]
+
+            observation = dict(zip(observation_keys, obs_row[2:].tolist()))
+            action = policy(observation, frames) or {}
+            row = np.full(len(action_keys), np.nan)
+            for i, key in enumerate(action_keys):
+                if key in action:
+                    row[i] = action[key]
+            output_seq += 1
+            with lock:
+                act_buf[3:] = row
+                act_buf[1] = last_seq
+                act_buf[2] = time.monotonic()
+                act_buf[0] = output_seq
+    finally:
+        for block in blocks.values():
+            block.close()
+
+
+class ProcessActionSource(ActionSource):
+    """在独立进程中运行的策略动作源（共享内存传递观测值、相机帧与动作）"""
+
+    def __init__(self, name: str, factory: str, observation_keys: list[str], action_keys: list[str],
+                 cameras: Optional[list[str]] = None, camera_shapes: Optional[dict[str, tuple[int, int, int]]] = None,
+                 factory_kwargs: Optional[dict[str, Any]] = None, max_age: float = 0.5, priority: int = 0):
+        """
+        Args:
+            factory: 策略工厂名称（或受信任包内的 "module:function"，见 resolve_factory），
+                     在子进程中以 factory_kwargs 调用，返回 policy(observation, frames) -> action
+            observation_keys: 传给策略的观测字段
+            action_keys: 策略可以输出的动作字段
+            cameras / camera_shapes: 需要的相机及其图像形状 (H, W, 3)
+            max_age: 动作的最长有效时间（秒），超过后（含子进程退出）底盘速度输出 0，
+                     机械臂保持在过期时观测到的位置
+        """
+        super().__init__(name, priority, cameras)
+        self.factory = resolve_factory(factory)
+        if not isinstance(factory_kwargs or {}, dict):
+            raise ValueError("factory_kwargs 必须是对象")
+        self.factory_kwargs = dict(factory_kwargs or {})
+        self.observation_keys = list(observation_keys)
+        self.action_keys = list(action_keys)
+        self.camera_shapes = {name: tuple(shape) for name, shape in (camera_shapes or {}).items()}
+        missing = [name for name in self.cameras if name not in self.camera_shapes]
+        if missing:
+            raise ValueError(f"缺少相机图像形状: {missing}")
+        self.max_age = max_age
+
+        self.inputs_sent = 0
+        self.inputs_skipped = 0  # 子进程正在拷贝时跳过的写入
+        self.outputs = 0
+        self.stale = 0
+
+        self._seq = 0
+        self._last_output_seq = 0.0
+        self._last_action: Optional[dict[str, float]] = None
+        self._last_action_time = 0.0
+        self._hold: Optional[dict[str, float]] = None  # 动作过期后输出的保持指令
+        self._blocks: dict[str, shared_memory.SharedMemory] = {}
+        self._process: Optional[multiprocessing.Process] = None
+
+    def start(self, observation: dict[str, Any]):
+        # spawn：不把控制进程的线程和设备句柄带进子进程
+        ctx = multiprocessing.get_context("spawn")
+        self._blocks["obs"] = shared_memory.SharedMemory(create=True, size=8 * (2 + len(self.observation_keys)))
+        self._blocks["action"] = shared_memory.SharedMemory(create=True, size=8 * (3 + len(self.action_keys)))
+        for name, shape in self.camera_shapes.items():
+            self._blocks[f"cam:{name}"] = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+
+        self._obs_buf = np.ndarray((2 + len(self.observation_keys),), dtype=np.float64, buffer=self._blocks["obs"].buf)
+        self._act_buf = np.ndarray((3 + len(self.action_keys),), dtype=np.float64, buffer=self._blocks["action"].buf)
+        self._cam_bufs = {
+            name: np.ndarray(shape, dtype=np.uint8, buffer=self._blocks[f"cam:{name}"].buf)
+            for name, shape in self.camera_shapes.items()
+        }
+        self._obs_buf.fill(0.0)
+        self._act_buf.fill(0.0)
+
+        self._lock = ctx.Lock()
+        self._input_ready = ctx.Event()
+        self._stop_event = ctx.Event()
+        self._process = ctx.Process(
+            target=_policy_worker,
+            args=(self.factory, self.factory_kwargs, self.observation_keys, self.action_keys, self.camera_shapes,
+                  {key: block.name for key, block in self._blocks.items()},
+                  self._lock, self._input_ready, self._stop_event),
+            name=f"policy-{self.name}",
+            daemon=True,
+        )
+        self._process.start()
+        logger.info(f"策略进程已启动: {self.name}（{self.factory}，pid {self._process.pid}）")
+
+    def stop(self):
+        if self._process is not None:
+            self._stop_event.set()
+            self._input_ready.set()
+            self._process.join(timeout=2.0)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
+
+    def compute(self, t: float, observation: Optional[dict[str, Any]],
+                frames: dict[str, np.ndarray]) -> Optional[dict[str, float]]:
+        # 子进程正在拷贝输入或写输出时不等待，本周期跳过
+        if self._lock.acquire(block=False):
+            try:
+                if observation is not None:
+                    self._seq += 1
+                    self._obs_buf[2:] = [observation.get(key, np.nan) for key in self.observation_keys]
+                    for name, buf in self._cam_bufs.items():
+                        frame = frames.get(name)
+                        if frame is not None and frame.shape == buf.shape:
+                            np.copyto(buf, frame)
+                    self._obs_buf[1] = t
+                    self._obs_buf[0] = self._seq
+                    self.inputs_sent += 1
+                output_seq, computed_at = self._act_buf[0], self._act_buf[2]
+                if output_seq != self._last_output_seq:
+                    row = self._act_buf[3:].copy()
+                    self._last_output_seq = output_seq
+                    self._last_action = {
+                        key: float(row[i]) for i, key in enumerate(self.action_keys) if not np.isnan(row[i])
+                    }
+                    self._last_action_time = computed_at
+                    self._hold = None
+                    self.outputs += 1
+            finally:
+                self._lock.release()
+            self._input_ready.set()
+        else:
+            self.inputs_skipped += 1
+
+        if self._last_action is None:
+            return None
+        if t - self._last_action_time > self.max_age:
+            self.stale += 1
+            if self._hold is None:
+                self._hold = self._hold_action(observation)
+            return self._hold
+        return self._last_action
+
+    def _hold_action(self, observation: Optional[dict[str, Any]]) -> dict[str, float]:
+        """
+        动作过期时的保持指令：本动作源负责的底盘速度置 0，位置字段保持在当前观测位置
+
+        在过期时锁存一次，避免每个周期跟随观测值导致机械臂在重力下缓慢下垂。
+        """
+        hold = {}
+        for key in self.action_keys:
+            if key.endswith(".vel"):
+                hold[key] = 0.0
+            elif observation is not None and isinstance(observation.get(key), (int, float)):
+                hold[key] = float(observation[key])
+        logger.warning(f"动作源 {self.name} 的动作已过期，停止底盘并保持机械臂位置")
+        return hold
+
+    def get_status(self) -> dict[str, Any]:
+        status = super().get_status()
+        status.update({
+            "factory": self.factory,
+            "alive": bool(self._process and self._process.is_alive()),
+            "inputs_sent": self.inputs_sent,
+            "inputs_skipped": self.inputs_skipped,
+            "outputs": self.outputs,
+            "stale": self.stale,
+            "action_age": round(time.monotonic() - self._last_action_time, 3) if self._last_action else None,
+        })
+        return status
+
+
+def arbitrate(results: list[tuple[ActionSource, dict[str, float]]]) -> tuple[dict[str, float], dict[str, str]]:
+    """
+    按优先级逐字段合并各动作源的输出
+
+    Args:
+        results: (动作源, 动作) 列表
+
+    Returns:
+        (合并后的动作, 字段 → 决定该字段的动作源名称)
+    """
+    action: dict[str, float] = {}
+    owners: dict[str, str] = {}
+    for source, source_action in sorted(results, key=lambda item: item[0].priority, reverse=True):
+        for key, value in source_action.items():
+            if key not in action:
+                action[key] = value
+                owners[key] = source.name
+    return action, owners
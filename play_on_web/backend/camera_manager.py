@@ -1,14 +1,33 @@
 """
 相机管理模块 - 管理多路相机流
+
+每路相机由一个采集线程持续读取，最新帧放入共享缓冲（CameraCapture）；
+每个观看者对应一个独立的 CameraSession（见 camera_stream.py），
+所有会话共享同一份采集和编码结果，增加观看者不会增加设备读取次数。
+
+采集按引用计数按需启动：观看会话、录制、单帧请求等使用者 acquire 后才开始读取，
+全部 release 后空闲 camera_idle_timeout 秒停止采集（设备保持打开，可快速重启），
+再空闲 camera_release_timeout 秒才真正断开设备。
 """
 import sys
-import cv2
+import time
 import asyncio
-import base64
 import logging
+import bisect
+import threading
+import numpy as np
+from collections import Counter, deque
 from pathlib import Path
 from typing import Any, Optional
-from dataclasses import dataclass
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from config import settings
+from camera_stream import CameraSession, RateMeter
+from frame_encoder import FrameEncoder, compute_signature
+from depth_codec import colorize_depth, encode_depth_png
+from video_stream import VideoStream, VideoSubscriber, is_video_codec_available
+from camera_recorder import CameraRecorder
 
 logger = logging.getLogger(__name__)
 
@@ -21,15 +40,285 @@ class CameraConfig:
     width: int = 640
     height: int = 480
     fps: int = 30
+    use_depth: bool = False  # 同时采集深度图（仅 RealSense）
+
+
+@dataclass
+class FramePacket:
+    """共享采集缓冲中的一帧"""
+    seq: int  # 帧序号（每路相机单调递增）
+    timestamp: float  # 采集时刻（time.monotonic()）
+    image: np.ndarray  # RGB 图像
+    depth: Optional[np.ndarray] = None  # uint16 深度图（毫米，仅启用深度的 RealSense）
+    signature: Optional[np.ndarray] = None  # 变化检测签名（未启用时为 None）
+    jpeg_cache: dict[tuple, Future] = field(default_factory=dict)  # (尺寸, 质量) → 编码任务
+    resized: dict[tuple[int, int], np.ndarray] = field(default_factory=dict)  # 尺寸 → 缩小后的图像
+
+
+def _resolve_future(future: asyncio.Future, result: Any):
+    """在事件循环线程中完成 future（可能已被取消）"""
+    if not future.done():
+        future.set_result(result)
+
+
+class CameraCapture:
+    """单路相机的采集线程，持续读取最新帧放入共享缓冲（引用计数按需运行）"""
+
+    def __init__(self, name: str, camera: Any, config: CameraConfig):
+        self.name = name
+        self.camera = camera
+        self.config = config
+        self.latest: Optional[FramePacket] = None
+        self.history: deque[FramePacket] = deque(maxlen=settings.camera_history_size)
+        self.error_count = 0
+        self.rate_meter = RateMeter()
+        # 帧序号只在本采集实例内递增，重建采集（重新初始化相机、服务重启）后从 0 开始，
+        # 因此帧标签带上创建时刻作为纪元
+        self.epoch = time.time_ns() // 1_000_000
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future, int]] = []
+        self._holders: Counter[str] = Counter()
+        self._idle_since: Optional[float] = time.monotonic()
+        self._state_lock = threading.RLock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def frame_tag(self, seq: int) -> str:
+        """帧标签 "<纪元>-<序号>"（用作 ETag 和长轮询的 after 参数）"""
+        return f"{self.epoch:x}-{seq}"
+
+    def parse_frame_tag(self, tag: str) -> int:
+        """
+        解析帧标签，返回可传给 wait_for_frame 的序号
+
+        纪元与当前采集不同（标签来自已重建的采集）时返回 0，即任意最新帧；
+        不带纪元的纯序号按当前采集解释。
+
+        Raises:
+            ValueError: 标签格式无效
+        """
+        epoch, sep, seq = tag.strip().strip('"').rpartition("-")
+        if sep and int(epoch, 16) != self.epoch:
+            return 0
+        return int(seq)
+
+    @property
+    def holders(self) -> dict[str, int]:
+        """当前持有者（使用者 → 引用数）"""
+        with self._state_lock:
+            return dict(self._holders)
+
+    def acquire(self, holder: str):
+        """
+        增加引用，必要时启动采集（设备已关闭时在采集线程中重新连接）
+
+        Args:
+            holder: 使用者标识，如 "session:ab12cd34"、"snapshot"
+        """
+        with self._state_lock:
+            self._holders[holder] += 1
+            self._idle_since = None
+            self.start()
+
+    def release(self, holder: str):
+        """减少引用，引用归零后开始计算空闲时间"""
+        with self._state_lock:
+            if self._holders[holder] > 1:
+                self._holders[holder] -= 1
+            else:
+                self._holders.pop(holder, None)
+            if not self._holders and self._idle_since is None:
+                self._idle_since = time.monotonic()
+
+    def reap(self, now: float, idle_timeout: float, release_timeout: float):
+        """
+        空闲回收：先停止采集（设备保持打开以便快速重启），再断开设备
+
+        Args:
+            now: 当前时刻（time.monotonic()）
+            idle_timeout: 无引用多久后停止采集（秒）
+            release_timeout: 停止采集后再过多久断开设备（秒）
+        """
+        with self._state_lock:
+            if self._holders or self._idle_since is None:
+                return
+            idle = now - self._idle_since
+            if self._running:
+                if idle >= idle_timeout:
+                    logger.info(f"相机 {self.name} 空闲 {idle:.0f} 秒，停止采集")
+                    self.stop()
+            elif idle >= idle_timeout + release_timeout and self.camera.is_connected:
+                try:
+                    self.camera.disconnect()
+                    logger.info(f"相机 {self.name} 空闲 {idle:.0f} 秒，已断开设备")
+                except Exception as e:
+                    logger.error(f"断开相机 {self.name} 时出错: {e}")
+
+    def start(self):
+        """启动采集线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"camera-capture-{self.name}", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"相机 {self.name} 采集线程已启动")
+
+    def stop(self, timeout: float = 2.0):
+        """停止采集线程"""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        with self._cond:
+            # 停止后的旧帧不再代表当前画面（序号保持递增）
+            self.latest = None
+            self.history.clear()
+        logger.info(f"相机 {self.name} 采集线程已停止")
+
+    def _run(self):
+        """采集循环：阻塞读取设备，由设备自身帧率节流"""
+        if not self.camera.is_connected:
+            try:
+                self.camera.connect(warmup=True)
+                logger.info(f"相机 {self.name} 已重新连接")
+            except Exception as e:
+                logger.error(f"重新连接相机 {self.name} 时出错: {e}")
+                self._running = False
+                return
+
+        while self._running:
+            try:
+                image = self.camera.read()
+            except Exception as e:
+                self.error_count += 1
+                if self.error_count % 30 == 1:
+                    logger.error(f"读取相机 {self.name} 帧时出错 (累计 {self.error_count} 次): {e}")
+                time.sleep(0.1)
+                continue
+
+            # 深度图在同一采集线程中读取，与彩色帧共享序号和时间戳
+            depth = None
+            if self.config.use_depth:
+                try:
+                    depth = self.camera.read_depth()
+                except Exception as e:
+                    if self.error_count % 30 == 0:
+                        logger.error(f"读取相机 {self.name} 深度图时出错: {e}")
+                    self.error_count += 1
+
+            now = time.monotonic()
+            self.rate_meter.tick(now)
+
+            signature = None
+            if settings.camera_change_detection:
+                try:
+                    signature = compute_signature(image)
+                except Exception as e:
+                    logger.debug(f"计算相机 {self.name} 变化检测签名失败: {e}")
+
+            with self._cond:
+                self._seq += 1
+                self.latest = FramePacket(
+                    seq=self._seq, timestamp=now, image=image, depth=depth, signature=signature
+                )
+                self.history.append(self.latest)
+                self._cond.notify_all()
+                self._wake_async_waiters(self.latest)
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: float = 1.0) -> Optional[FramePacket]:
+        """
+        阻塞等待序号大于 after_seq 的帧
+
+        Returns:
+            新帧，超时则返回 None
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running and (self.latest is None or self.latest.seq <= after_seq):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self.latest if self.latest and self.latest.seq > after_seq else None
+
+    def nearest_frame(self, t: float) -> Optional[FramePacket]:
+        """获取短历史中采集时刻最接近 t 的帧"""
+        with self._cond:
+            frames = list(self.history)
+        if not frames:
+            return None
+        i = bisect.bisect_left([f.timestamp for f in frames], t)
+        candidates = frames[max(0, i - 1):i + 1]
+        return min(candidates, key=lambda f: abs(f.timestamp - t))
+
+    async def wait_for_frame_async(self, after_seq: int = 0, timeout: float = 1.0) -> Optional[FramePacket]:
+        """
+        在事件循环中等待序号大于 after_seq 的帧（不占用线程）
+
+        Returns:
+            新帧，超时则返回 None
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.latest is not None and self.latest.seq > after_seq:
+                return self.latest
+            waiter = (loop, loop.create_future(), after_seq)
+            self._waiters.append(waiter)
+
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def _wake_async_waiters(self, packet: FramePacket):
+        """唤醒等待新帧的协程（调用时持有 self._cond）"""
+        remaining = []
+        for loop, future, after_seq in self._waiters:
+            if packet.seq > after_seq:
+                loop.call_soon_threadsafe(_resolve_future, future, packet)
+            else:
+                remaining.append((loop, future, after_seq))
+        self._waiters = remaining
 
 
 class CameraManager:
-    """相机管理器"""
+    """
+    相机管理器（相机流中枢）
+
+    - 每路相机一个采集线程（CameraCapture），所有观看者共享
+    - 每帧的 JPEG 编码在多核编码池中进行，结果按质量缓存在帧上，多个会话只编码一次
+    - 每个观看者一个 CameraSession，拥有独立的相机集合、帧率和生命周期
+    - 可选的帧间视频编码（VideoStream），每路相机每种格式只编码一次
+    """
     
     def __init__(self):
         self.cameras: dict[str, Any] = {}
         self.camera_configs: dict[str, CameraConfig] = {}
-        self._streaming = False
+        self.captures: dict[str, CameraCapture] = {}
+        self.sessions: dict[str, CameraSession] = {}
+        self.video_streams: dict[tuple[str, str], VideoStream] = {}  # (相机, 编码格式) → 编码流
+        self.recorders: dict[str, CameraRecorder] = {}
+        self.recording_dir: Optional[Path] = None
+        self.encoder = FrameEncoder(
+            workers=settings.camera_encoder_workers,
+            backend=settings.camera_jpeg_backend
+        )
+        self._encode_lock = threading.Lock()
+        self._reaper_thread: Optional[threading.Thread] = None
+        self._reaper_stop = threading.Event()
     
     def add_camera(self, name: str, config: CameraConfig) -> dict[str, Any]:
         """
@@ -43,6 +332,12 @@ class CameraManager:
             # 动态导入 lerobot 模块
             sys.path.insert(0, str(Path(__file__).parent.parent.parent / "lerobot" / "src"))
             
+            if config.use_depth and config.camera_type != "realsense":
+                return {
+                    "status": "error",
+                    "message": "只有 RealSense 相机支持深度采集"
+                }
+            
             if config.camera_type == "opencv":
                 from lerobot.cameras.opencv.camera_opencv import OpenCVCamera
                 from lerobot.cameras.opencv.configuration_opencv import OpenCVCameraConfig
@@ -65,6 +360,7 @@ class CameraManager:
                 cam_config = RealSenseCameraConfig(
                     serial_number_or_name=config.camera_id,
                     color_mode=ColorMode.RGB,
+                    use_depth=config.use_depth,
                     width=config.width,
                     height=config.height,
                     fps=config.fps
@@ -76,11 +372,13 @@ class CameraManager:
                     "message": f"不支持的相机类型: {config.camera_type}"
                 }
             
-            # 连接相机
+            # 连接相机（验证配置），采集在有使用者时才开始
             camera.connect(warmup=True)
             
             self.cameras[name] = camera
             self.camera_configs[name] = config
+            self.captures[name] = CameraCapture(name, camera, config)
+            self._ensure_reaper()
             
             logger.info(f"相机 {name} 添加成功")
             return {
@@ -98,6 +396,14 @@ class CameraManager:
         """移除相机"""
         try:
             if name in self.cameras:
+                for key in [k for k in self.video_streams if k[0] == name]:
+                    self.video_streams.pop(key).stop()
+                recorder = self.recorders.pop(name, None)
+                if recorder:
+                    recorder.stop()
+                capture = self.captures.pop(name, None)
+                if capture:
+                    capture.stop()
                 camera = self.cameras[name]
                 if camera.is_connected:
                     camera.disconnect()
@@ -121,77 +427,397 @@ class CameraManager:
                 "message": str(e)
             }
     
-    def get_frame(self, name: str) -> Optional[bytes]:
+    def get_latest_packet(self, name: str) -> Optional[FramePacket]:
+        """获取共享缓冲中的最新帧（不触发设备读取）"""
+        capture = self.captures.get(name)
+        return capture.latest if capture else None
+
+    def resolve_size(self, name: str, size: Any) -> Optional[tuple[int, int]]:
+        """
+        将观看者请求的输出尺寸解析为 (宽, 高)
+
+        Args:
+            name: 相机名称
+            size: "full" / None（原始尺寸）、"thumb"（缩略图）、
+                  整数（最大宽度，按比例缩放）或 [宽, 高]
+
+        Returns:
+            (宽, 高)；原始尺寸或请求尺寸不小于原始尺寸时返回 None（不放大）
+        """
+        config = self.camera_configs.get(name)
+        if config is None or size in (None, "full"):
+            return None
+
+        try:
+            if size == "thumb":
+                width = settings.camera_thumbnail_width
+                height = round(config.height * width / config.width)
+            elif isinstance(size, (int, float)):
+                width = int(size)
+                height = round(config.height * width / config.width)
+            else:
+                width, height = int(size[0]), int(size[1])
+        except (TypeError, ValueError, IndexError):
+            logger.warning(f"无效的输出尺寸: {size}，使用原始尺寸")
+            return None
+
+        if width <= 0 or height <= 0 or width >= config.width or height >= config.height:
+            return None
+        # JPEG 按 2 像素对齐，避免色度下采样边缘
+        return (width - width % 2, height - height % 2)
+
+    def _encode_variant(self, packet: FramePacket, size: Optional[tuple[int, int]], quality: int) -> bytes:
+        """在编码池中执行：缩放（同一尺寸每帧只缩放一次）+ 编码"""
+        image = packet.image
+        if size is not None:
+            image = packet.resized.get(size)
+            if image is None:
+                image = self.encoder.resize(packet.image, size)
+                with self._encode_lock:
+                    image = packet.resized.setdefault(size, image)
+        return self.encoder.encode(image, quality)
+
+    def submit_jpeg(self, packet: FramePacket, quality: Optional[int] = None,
+                    size: Optional[tuple[int, int]] = None) -> Future:
+        """
+        提交帧的 JPEG 编码任务
+
+        同一帧的同一 (尺寸, 质量) 变体只会提交一次：并发请求共享同一个编码任务，
+        已完成的结果直接从帧上的缓存返回。
+
+        Args:
+            packet: 共享缓冲中的帧
+            quality: JPEG 质量（默认使用配置值）
+            size: 输出尺寸 (宽, 高)，None 表示原始尺寸（见 resolve_size）
+        """
+        quality = quality or settings.camera_jpeg_quality
+        key = (size, quality)
+        with self._encode_lock:
+            future = packet.jpeg_cache.get(key)
+            if future is None:
+                future = self.encoder.submit(self._encode_variant, packet, size, quality)
+                packet.jpeg_cache[key] = future
+        return future
+
+    def encode_jpeg(self, packet: FramePacket, quality: Optional[int] = None,
+                    size: Optional[tuple[int, int]] = None) -> Optional[bytes]:
+        """将帧编码为 JPEG（阻塞等待编码池结果）"""
+        try:
+            return self.submit_jpeg(packet, quality, size).result()
+        except Exception as e:
+            logger.error(f"编码帧 {packet.seq} 时出错: {e}")
+            return None
+
+    async def encode_jpeg_async(self, packet: FramePacket, quality: Optional[int] = None,
+                                size: Optional[tuple[int, int]] = None) -> Optional[bytes]:
+        """将帧编码为 JPEG（在编码池中执行，不阻塞事件循环）"""
+        try:
+            return await asyncio.wrap_future(self.submit_jpeg(packet, quality, size))
+        except Exception as e:
+            logger.error(f"编码帧 {packet.seq} 时出错: {e}")
+            return None
+
+    # ==================== 深度图 ====================
+
+    DEPTH_FORMATS = ["preview", "png"]
+
+    def _encode_depth(self, packet: FramePacket, fmt: str, size: Optional[tuple[int, int]],
+                      quality: int) -> bytes:
+        """在编码池中执行：深度图编码（preview 为伪彩色 JPEG，png 为无损 16 位 PNG）"""
+        depth = packet.depth
+        if size is not None:
+            # 深度图缩小用最近邻，避免在物体边缘产生不存在的深度
+            depth = self.encoder.resize_nearest(depth, size)
+        if fmt == "png":
+            return encode_depth_png(depth, settings.depth_png_compression)
+        return self.encoder.encode(colorize_depth(depth, settings.depth_preview_max_mm), quality)
+
+    def submit_depth(self, packet: FramePacket, fmt: str = "preview", quality: Optional[int] = None,
+                     size: Optional[tuple[int, int]] = None) -> Optional[Future]:
+        """
+        提交帧的深度图编码任务（结果与 JPEG 一样缓存在帧上）
+
+        Returns:
+            编码任务；该帧没有深度图或格式不支持时返回 None
+        """
+        if packet.depth is None or fmt not in self.DEPTH_FORMATS:
+            return None
+        quality = quality or settings.camera_jpeg_quality
+        key = ("depth", fmt, size, quality if fmt == "preview" else None)
+        with self._encode_lock:
+            future = packet.jpeg_cache.get(key)
+            if future is None:
+                future = self.encoder.submit(self._encode_depth, packet, fmt, size, quality)
+                packet.jpeg_cache[key] = future
+        return future
+
+    async def encode_depth_async(self, packet: FramePacket, fmt: str = "preview",
+                                 quality: Optional[int] = None,
+                                 size: Optional[tuple[int, int]] = None) -> Optional[bytes]:
+        """编码深度图（在编码池中执行，不阻塞事件循环）"""
+        future = self.submit_depth(packet, fmt, quality, size)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.error(f"编码帧 {packet.seq} 的深度图时出错: {e}")
+            return None
+
+    def get_frame(self, name: str, size: Any = None) -> Optional[bytes]:
         """
         获取相机帧（JPEG 编码）
         
         Args:
             name: 相机名称
+            size: 输出尺寸（见 resolve_size）
             
         Returns:
             JPEG 编码的图像数据，如果失败则返回 None
         """
         try:
-            if name not in self.cameras:
+            capture = self.captures.get(name)
+            if capture is None:
                 return None
-            
-            camera = self.cameras[name]
-            frame = camera.read()
-            
-            # 转换为 BGR（OpenCV 格式）
-            if len(frame.shape) == 3 and frame.shape[2] == 3:
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            else:
-                frame_bgr = frame
-            
-            # 编码为 JPEG
-            _, buffer = cv2.imencode('.jpg', frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            return buffer.tobytes()
+
+            capture.acquire("snapshot")
+            try:
+                # 冷启动时需要等待设备重新连接和预热
+                packet = capture.latest or capture.wait_for_frame(0, timeout=5.0)
+            finally:
+                capture.release("snapshot")
+            if packet is None:
+                return None
+            return self.encode_jpeg(packet, size=self.resolve_size(name, size))
         except Exception as e:
             logger.error(f"获取相机 {name} 帧时出错: {e}")
             return None
-    
-    async def stream_frames(self, websocket, camera_names: list[str]):
+
+    async def wait_for_packet(self, name: str, after_seq: int = 0,
+                              timeout: float = 10.0) -> Optional[FramePacket]:
         """
-        通过 WebSocket 流式传输相机帧
-        
+        从共享缓冲获取序号大于 after_seq 的帧，必要时等待（长轮询）
+
+        期间持有相机引用，以保证采集在运行；不会触发额外的设备读取。
+
         Args:
-            websocket: WebSocket 连接
-            camera_names: 相机名称列表
+            name: 相机名称
+            after_seq: 只返回比该序号更新的帧（0 表示任意最新帧）
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            帧，超时或相机不存在时返回 None
         """
-        self._streaming = True
-        
+        capture = self.captures.get(name)
+        if capture is None:
+            return None
+
+        capture.acquire("snapshot")
         try:
-            while self._streaming:
-                frames_data = {}
-                
-                for name in camera_names:
-                    frame_bytes = self.get_frame(name)
-                    if frame_bytes:
-                        # 将帧编码为 base64
-                        frame_base64 = base64.b64encode(frame_bytes).decode('utf-8')
-                        frames_data[name] = frame_base64
-                
-                # 发送帧数据
-                if frames_data:
-                    await websocket.send_json({
-                        "type": "camera_frames",
-                        "data": frames_data
-                    })
-                
-                # 控制帧率（大约 30 FPS）
-                await asyncio.sleep(1.0 / 30.0)
-        except Exception as e:
-            logger.error(f"流式传输相机帧时出错: {e}")
+            return await capture.wait_for_frame_async(after_seq, timeout)
         finally:
-            self._streaming = False
-    
-    def stop_streaming(self):
-        """停止流式传输"""
-        self._streaming = False
+            capture.release("snapshot")
+
+    # ==================== 按需采集 ====================
+
+    def acquire(self, name: str, holder: str) -> bool:
+        """
+        声明使用某路相机（开始或保持采集）
+
+        Returns:
+            False 表示相机不存在
+        """
+        capture = self.captures.get(name)
+        if capture is None:
+            return False
+        capture.acquire(holder)
+        return True
+
+    def release(self, name: str, holder: str):
+        """释放对某路相机的使用"""
+        capture = self.captures.get(name)
+        if capture:
+            capture.release(holder)
+
+    def _ensure_reaper(self):
+        """启动空闲回收线程"""
+        if self._reaper_thread and self._reaper_thread.is_alive():
+            return
+        self._reaper_stop.clear()
+        self._reaper_thread = threading.Thread(
+            target=self._reap_loop, name="camera-idle-reaper", daemon=True
+        )
+        self._reaper_thread.start()
+
+    def _reap_loop(self):
+        """周期性停止空闲相机的采集并释放设备"""
+        while not self._reaper_stop.wait(1.0):
+            now = time.monotonic()
+            for capture in list(self.captures.values()):
+                capture.reap(now, settings.camera_idle_timeout, settings.camera_release_timeout)
+
+    # ==================== 视频编码流 ====================
+
+    def subscribe_video(self, name: str, codec: str, subscriber: VideoSubscriber) -> bool:
+        """
+        订阅某路相机的视频编码流（首个订阅者启动编码线程）
+
+        Returns:
+            False 表示相机不存在或编码格式不可用（调用方应回退到 JPEG）
+        """
+        capture = self.captures.get(name)
+        if capture is None or not is_video_codec_available(codec):
+            return False
+
+        key = (name, codec)
+        stream = self.video_streams.get(key)
+        if stream is None:
+            stream = VideoStream(name, capture, codec)
+            self.video_streams[key] = stream
+        stream.subscribe(subscriber)
+        return True
+
+    def unsubscribe_video(self, name: str, codec: str, subscriber: VideoSubscriber):
+        """取消订阅视频编码流（最后一个订阅者离开时编码线程自动退出）"""
+        stream = self.video_streams.get((name, codec))
+        if stream:
+            stream.unsubscribe(subscriber)
+
+    # ==================== 录制 ====================
+
+    def start_recording(self, output_dir: Path, camera_names: Optional[list[str]] = None,
+                        quality: Optional[int] = None) -> dict[str, Any]:
+        """
+        开始录制相机（每路相机一个 MJPEG 文件 + 时间戳索引）
+
+        Args:
+            output_dir: 输出目录
+            camera_names: 要录制的相机，None 表示全部
+            quality: JPEG 质量（默认与直播相同，以便复用已编码的帧）
+        """
+        try:
+            if self.recorders:
+                return {"status": "error", "message": f"相机正在录制到 {self.recording_dir}"}
+
+            names = camera_names if camera_names is not None else list(self.captures.keys())
+            unknown = [name for name in names if name not in self.captures]
+            if unknown:
+                return {"status": "error", "message": f"相机不存在: {', '.join(unknown)}"}
+            if not names:
+                return {"status": "error", "message": "没有可录制的相机"}
+
+            self.recording_dir = Path(output_dir).expanduser()
+            for name in names:
+                recorder = CameraRecorder(name, self, self.recording_dir, quality)
+                recorder.start()
+                self.recorders[name] = recorder
+
+            return {
+                "status": "success",
+                "message": f"开始录制 {len(names)} 路相机",
+                "output_dir": str(self.recording_dir),
+                "cameras": names,
+            }
+        except Exception as e:
+            logger.error(f"开始相机录制时出错: {e}")
+            self.stop_recording()
+            return {"status": "error", "message": str(e)}
+
+    def stop_recording(self) -> dict[str, Any]:
+        """停止全部相机录制并返回各相机统计"""
+        if not self.recorders:
+            return {"status": "error", "message": "当前没有正在录制的相机"}
+
+        cameras = {}
+        for name, recorder in list(self.recorders.items()):
+            try:
+                cameras[name] = recorder.stop()
+            except Exception as e:
+                logger.error(f"停止相机 {name} 录制时出错: {e}")
+        self.recorders.clear()
+        return {
+            "status": "success",
+            "message": f"{len(cameras)} 路相机录制完成",
+            "output_dir": str(self.recording_dir),
+            "cameras": cameras,
+        }
+
+    def get_recording_status(self) -> dict[str, Any]:
+        """获取相机录制状态"""
+        return {
+            "recording": bool(self.recorders),
+            "output_dir": str(self.recording_dir) if self.recording_dir else None,
+            "cameras": {name: recorder.get_stats() for name, recorder in self.recorders.items()},
+        }
+
+    # ==================== 观看会话 ====================
+
+    def create_session(self, camera_names: list[str], max_fps: Optional[float] = None,
+                       quality: Optional[int] = None,
+                       sizes: Optional[dict[str, Any]] = None,
+                       skip_unchanged: Optional[bool] = None,
+                       codec: str = "jpeg",
+                       depth: Optional[list[str]] = None) -> CameraSession:
+        """
+        创建观看会话
+
+        Args:
+            camera_names: 订阅的相机名称列表
+            max_fps: 该会话的帧率上限（None 表示不限制）
+            quality: 该会话的 JPEG 质量（None 表示使用配置默认值）
+            sizes: 每路相机的输出尺寸（见 resolve_size），未指定的相机使用原始尺寸
+            skip_unchanged: 是否跳过未变化的画面（None 表示跟随变化检测配置）
+            codec: "jpeg"（默认）或视频编码格式 "h264" / "vp8"
+            depth: 需要附带深度预览的相机（仅启用深度的 RealSense）
+        """
+        session = CameraSession(
+            self, camera_names, max_fps=max_fps, quality=quality,
+            sizes=sizes, skip_unchanged=skip_unchanged, codec=codec, depth=depth
+        )
+        self.sessions[session.session_id] = session
+        logger.info(f"相机会话 {session.session_id} 已创建，订阅: {camera_names}，当前会话数: {len(self.sessions)}")
+        return session
+
+    def close_session(self, session_id: str):
+        """关闭观看会话（只影响该会话本身）"""
+        session = self.sessions.pop(session_id, None)
+        if session:
+            session.close()
+            logger.info(f"相机会话 {session_id} 已关闭，当前会话数: {len(self.sessions)}")
+
+    def get_stats(self) -> dict[str, Any]:
+        """获取每路相机的采集帧率（目标 / 实际）以及各会话的发送帧率"""
+        cameras = {}
+        for name, capture in self.captures.items():
+            cameras[name] = {
+                "target_fps": self.camera_configs[name].fps,
+                "use_depth": self.camera_configs[name].use_depth,
+                "achieved_fps": round(capture.rate_meter.rate(), 2),
+                "running": capture.is_running,
+                "device_open": bool(capture.camera.is_connected),
+                "holders": capture.holders,
+                "frame_seq": capture.latest.seq if capture.latest else 0,
+                "errors": capture.error_count,
+            }
+        return {
+            "cameras": cameras,
+            "encoder": self.encoder.get_stats(),
+            "video_streams": [stream.get_stats() for stream in self.video_streams.values()],
+            "recording": self.get_recording_status(),
+            "sessions": self.get_sessions_info(),
+        }
+
+    def get_sessions_info(self) -> list[dict[str, Any]]:
+        """获取所有观看会话的信息"""
+        return [session.get_info() for session in self.sessions.values()]
     
     def disconnect_all(self):
         """断开所有相机"""
+        if self.recorders:
+            self.stop_recording()
+        for session_id in list(self.sessions.keys()):
+            self.close_session(session_id)
         for name in list(self.cameras.keys()):
             self.remove_camera(name)
-
+        self._reaper_stop.set()
+        self.encoder.shutdown()
@@ -0,0 +1,292 @@
+"""
+相机录制模块 - 复用直播已编码的 JPEG，把每路相机写成 MJPEG 文件
+
+录制线程从共享采集缓冲取帧，通过 CameraManager.submit_jpeg 获取全尺寸 JPEG：
+与直播同一 (尺寸, 质量) 的帧直接命中帧上的编码缓存，不会重复编码。
+每路相机输出：
+
+    <output_dir>/
+        <camera>.mjpeg       # 首尾相接的 JPEG 帧（ffmpeg -f mjpeg -i 可直接读取）
+        <camera>.index.npy   # float64 (N, 4)：帧序号、采集时刻、文件偏移、字节数
+        <camera>.json        # 分辨率、帧率、质量、帧数、丢帧数、提前结束的原因
+        <camera>.depth.bin   # 启用深度时：首尾相接的深度差分帧（DepthDeltaEncoder，zstd/zlib，无损）
+        <camera>.depth_index.npy  # float64 (N, 5)：帧序号、采集时刻、文件偏移、字节数、是否关键帧
+
+采集时刻为 time.monotonic()，与回合录制（episode_recorder）的时间戳同源，可直接对齐。
+未使用 AVI 容器：OpenCV 的 VideoWriter 会重新编码，且 AVI 1.0 单文件限制在 1GB 左右；
+裸 MJPEG + 索引既零拷贝又可随机访问。
+
+深度图在录制线程中用一个贯穿整个录制的 DepthDeltaEncoder 编码：每 30 帧一个关键帧，
+其余帧只存与上一帧的差值，静止场景几乎不占空间。read_depth_frame 从最近的关键帧向后解码。
+
+丢帧不会被静默忽略：录制线程没取到的采集帧（帧序号不连续）、
+编码积压超限而放弃的帧、编码失败的帧都分别计数。
+共享采集停止（如重连失败）时该路录制提前结束，原因写入 <camera>.json 的 error 字段。
+"""
+import json
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from config import settings
+from depth_codec import DepthDeltaEncoder, DepthDeltaDecoder, is_depth_keyframe
+from episode_recorder import NpyColumnWriter
+
+if TYPE_CHECKING:
+    from camera_manager import CameraManager, FramePacket
+
+logger = logging.getLogger(__name__)
+
+# 索引列（均以 float64 存储，整数在 2^53 内精确）
+INDEX_COLUMNS = ["seq", "timestamp", "offset", "size"]
+
+DEPTH_INDEX_COLUMNS = ["seq", "timestamp", "offset", "size", "keyframe"]
+
+# 等待编码的最大帧数，超过则丢弃新帧
+MAX_PENDING_FRAMES = 16
+
+
+def load_camera_index(output_dir: Path, camera: str, mmap: bool = True) -> np.ndarray:
+    """读取相机录制索引 (N, 4)，列见 INDEX_COLUMNS"""
+    return np.load(Path(output_dir) / f"{camera}.index.npy", mmap_mode="r" if mmap else None)
+
+
+def read_camera_frame(output_dir: Path, camera: str, index: np.ndarray, i: int) -> bytes:
+    """按索引读取第 i 帧的 JPEG 数据"""
+    offset, size = int(index[i, 2]), int(index[i, 3])
+    with open(Path(output_dir) / f"{camera}.mjpeg", "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def load_depth_index(output_dir: Path, camera: str, mmap: bool = True) -> Optional[np.ndarray]:
+    """读取深度录制索引 (N, 5)，列见 DEPTH_INDEX_COLUMNS；未录制深度时返回 None"""
+    path = Path(output_dir) / f"{camera}.depth_index.npy"
+    if not path.exists():
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def read_depth_frame(output_dir: Path, camera: str, index: np.ndarray, i: int) -> np.ndarray:
+    """按索引读取第 i 帧深度图（uint16 毫米），从之前最近的关键帧开始解码"""
+    start = i
+    while start > 0 and not index[start, 4]:
+        start -= 1
+    decoder = DepthDeltaDecoder()
+    depth = None
+    with open(Path(output_dir) / f"{camera}.depth.bin", "rb") as f:
+        f.seek(int(index[start, 2]))
+        for row in index[start:i + 1]:
+            depth = decoder.decode(f.read(int(row[3])))
+    return depth
+
+
+def iter_depth_frames(output_dir: Path, camera: str):
+    """按顺序逐帧解码深度录制，产出 (帧序号, 采集时刻, 深度图)"""
+    index = load_depth_index(output_dir, camera)
+    if index is None:
+        return
+    decoder = DepthDeltaDecoder()
+    with open(Path(output_dir) / f"{camera}.depth.bin", "rb") as f:
+        for row in index:
+            f.seek(int(row[2]))
+            yield int(row[0]), float(row[1]), decoder.decode(f.read(int(row[3])))
+
+
+class CameraRecorder:
+    """单路相机的录制线程"""
+
+    def __init__(self, name: str, manager: "CameraManager", output_dir: Path,
+                 quality: Optional[int] = None):
+        """
+        初始化录制器
+
+        Args:
+            name: 相机名称
+            manager: 相机管理器（提供采集缓冲与编码缓存）
+            output_dir: 输出目录
+            quality: JPEG 质量（默认与直播相同，以便命中编码缓存）
+        """
+        self.name = name
+        self.manager = manager
+        self.output_dir = Path(output_dir)
+        self.quality = quality or settings.camera_jpeg_quality
+        self.holder_id = f"recording:{name}"
+
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.frames_missed = 0  # 录制线程未取到的采集帧
+        self.frames_dropped = 0  # 编码积压超限而放弃的帧
+        self.encode_errors = 0
+        self.depth_frames_written = 0
+        self.depth_bytes_written = 0
+        self.depth_keyframes = 0
+        self.first_timestamp: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self.error: Optional[str] = None  # 录制提前结束的原因（如采集已停止）
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._pending: deque[tuple["FramePacket", Future]] = deque()
+        self._video_file = None
+        self._index: Optional[NpyColumnWriter] = None
+        self._depth_encoder: Optional[DepthDeltaEncoder] = None  # 首个深度帧到达时创建，整个录制共用
+        self._depth_file = None
+        self._depth_index: Optional[NpyColumnWriter] = None
+
+    @property
+    def is_recording(self) -> bool:
+        return self._running
+
+    def start(self):
+        """开始录制"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._video_file = open(self.output_dir / f"{self.name}.mjpeg", "wb")
+        self._index = NpyColumnWriter(
+            self.output_dir / f"{self.name}.index.npy", np.float64, (len(INDEX_COLUMNS),)
+        )
+        self.manager.acquire(self.name, self.holder_id)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"camera-recorder-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"相机 {self.name} 开始录制: {self.output_dir}")
+
+    def stop(self) -> dict[str, Any]:
+        """停止录制，写完积压的帧并返回统计"""
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+        self.manager.release(self.name, self.holder_id)
+
+        if self._index:
+            self._index.close()
+        if self._video_file:
+            self._video_file.close()
+        if self._depth_index:
+            self._depth_index.close()
+        if self._depth_file:
+            self._depth_file.close()
+
+        stats = self.get_stats()
+        with open(self.output_dir / f"{self.name}.json", "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False)
+        logger.info(
+            f"相机 {self.name} 录制结束: {self.frames_written} 帧，"
+            f"漏帧 {self.frames_missed}，丢帧 {self.frames_dropped}"
+        )
+        return stats
+
+    def _run(self):
+        """录制循环：取新帧 → 提交（或复用）编码 → 按顺序写出已完成的帧"""
+        capture = self.manager.captures.get(self.name)
+        last_seq = capture.latest.seq if capture and capture.latest else 0
+
+        if capture is None:
+            self.error = "相机不存在"
+            self._running = False
+
+        while self._running:
+            packet = capture.wait_for_frame(last_seq, timeout=0.5)
+            if packet is None and not capture.is_running:
+                # 采集已停止（如重连失败）：不会再有新帧，结束本路录制并记录原因
+                self.error = "相机采集已停止"
+                self._running = False
+                logger.error(f"相机 {self.name} 采集已停止，录制提前结束")
+                break
+            if packet is not None:
+                if last_seq and packet.seq > last_seq + 1:
+                    self.frames_missed += packet.seq - last_seq - 1
+                last_seq = packet.seq
+
+                if len(self._pending) >= MAX_PENDING_FRAMES:
+                    self.frames_dropped += 1
+                else:
+                    self._pending.append((packet, self.manager.submit_jpeg(packet, self.quality)))
+                    if packet.depth is not None:
+                        self._write_depth(packet)
+
+            self._write_completed(block=False)
+
+        self._write_completed(block=True)
+
+    def _write_completed(self, block: bool):
+        """按帧序写出已编码完成的帧（block=True 时等待全部完成）"""
+        while self._pending:
+            packet, future = self._pending[0]
+            if not block and not future.done():
+                return
+            self._pending.popleft()
+            try:
+                jpeg = future.result()
+            except Exception as e:
+                self.encode_errors += 1
+                logger.debug(f"相机 {self.name} 帧 {packet.seq} 编码失败: {e}")
+                continue
+
+            offset = self.bytes_written
+            self._video_file.write(jpeg)
+            self._index.append(np.array([[packet.seq, packet.timestamp, offset, len(jpeg)]]))
+            self.bytes_written += len(jpeg)
+            self.frames_written += 1
+            if self.first_timestamp is None:
+                self.first_timestamp = packet.timestamp
+            self.last_timestamp = packet.timestamp
+
+    def _write_depth(self, packet: "FramePacket"):
+        """差分编码并写出一帧深度图（与 JPEG 帧通过帧序号对齐）"""
+        if self._depth_encoder is None:
+            self._depth_encoder = DepthDeltaEncoder()
+            self._depth_file = open(self.output_dir / f"{self.name}.depth.bin", "wb")
+            self._depth_index = NpyColumnWriter(
+                self.output_dir / f"{self.name}.depth_index.npy", np.float64, (len(DEPTH_INDEX_COLUMNS),)
+            )
+        try:
+            data = self._depth_encoder.encode(packet.depth)
+        except Exception as e:
+            self.encode_errors += 1
+            self._depth_encoder.reset()  # 下一帧从关键帧重新开始，保证可解码
+            logger.debug(f"相机 {self.name} 帧 {packet.seq} 深度编码失败: {e}")
+            return
+
+        keyframe = is_depth_keyframe(data)
+        self._depth_file.write(data)
+        self._depth_index.append(np.array([[
+            packet.seq, packet.timestamp, self.depth_bytes_written, len(data), float(keyframe)
+        ]]))
+        self.depth_bytes_written += len(data)
+        self.depth_frames_written += 1
+        self.depth_keyframes += int(keyframe)
+
+    def get_stats(self) -> dict[str, Any]:
+        """获取录制统计"""
+        config = self.manager.camera_configs.get(self.name)
+        duration = (self.last_timestamp - self.first_timestamp) if self.first_timestamp is not None else 0.0
+        return {
+            "camera": self.name,
+            "recording": self._running,
+            "width": config.width if config else None,
+            "height": config.height if config else None,
+            "target_fps": config.fps if config else None,
+            "achieved_fps": round((self.frames_written - 1) / duration, 2) if duration > 0 else 0.0,
+            "quality": self.quality,
+            "frames_written": self.frames_written,
+            "bytes_written": self.bytes_written,
+            "frames_missed": self.frames_missed,
+            "frames_dropped": self.frames_dropped,
+            "encode_errors": self.encode_errors,
+            "error": self.error,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "index_columns": INDEX_COLUMNS,
+            "depth_frames_written": self.depth_frames_written,
+            "depth_bytes_written": self.depth_bytes_written,
+            "depth_keyframes": self.depth_keyframes,
+            "depth_index_columns": DEPTH_INDEX_COLUMNS if self.depth_frames_written else None,
+        }
+
@@ -0,0 +1,474 @@
+"""
+相机流会话模块 - 每个观看者一个独立的订阅会话
+
+会话只从 CameraManager 的共享缓冲中取帧，不直接读取设备，
+因此增加观看者只增加带宽，不增加设备读取；关闭会话也不会影响其他观看者。
+
+发送节奏由 FramePacer 按每路相机的单调时钟截止时间调度：
+目标帧率 = min(CameraConfig.fps, 会话帧率上限)，处理耗时自动从等待时间中扣除。
+
+启用变化检测时，与上次发送帧相比没有明显变化的帧会被跳过，
+但每路相机至少每 camera_keepalive_interval 秒发送一帧作为保活。
+
+会话也可以选择帧间视频编码（codec="h264" / "vp8"，见 video_stream.py），
+此时按采集帧率转发共享编码流的分片；编码不可用时自动回退到 JPEG。
+"""
+import time
+import uuid
+import asyncio
+import base64
+import logging
+from collections import deque
+from typing import Any, Collection, Optional, TYPE_CHECKING
+
+from config import settings
+from frame_encoder import signature_distance
+from video_stream import SUBSCRIBER_QUEUE_SIZE, VideoSubscriber
+
+if TYPE_CHECKING:
+    from camera_manager import CameraManager
+
+logger = logging.getLogger(__name__)
+
+# 会话向客户端推送统计信息的间隔（秒）
+STATS_REPORT_INTERVAL = 2.0
+
+
+class RateMeter:
+    """滑动窗口帧率统计"""
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._stamps: deque[float] = deque()
+
+    def tick(self, now: Optional[float] = None):
+        """记录一次事件"""
+        now = time.monotonic() if now is None else now
+        self._stamps.append(now)
+        self._trim(now)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """窗口内的平均频率（Hz）"""
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        if len(self._stamps) < 2:
+            return 0.0
+        span = now - self._stamps[0]
+        return (len(self._stamps) - 1) / span if span > 0 else 0.0
+
+    def _trim(self, now: float):
+        while self._stamps and now - self._stamps[0] > self.window:
+            self._stamps.popleft()
+
+
+class FramePacer:
+    """
+    基于单调时钟截止时间的多路帧节拍器
+
+    每路相机有独立的发送间隔和下一截止时间。发送后截止时间按固定间隔推进
+    （而不是"处理完再睡一个周期"），因此处理耗时不会拉低实际帧率；
+    落后超过一个周期时直接跳到下一个周期，避免突发补发。
+    """
+
+    def __init__(self):
+        self._intervals: dict[str, float] = {}
+        self._deadlines: dict[str, float] = {}
+        self._targets: dict[str, float] = {}
+        self._meters: dict[str, RateMeter] = {}
+
+    def configure(self, name: str, target_fps: float):
+        """设置（或更新）某路相机的目标帧率"""
+        target_fps = max(float(target_fps), 0.1)
+        self._targets[name] = target_fps
+        self._intervals[name] = 1.0 / target_fps
+        self._deadlines.setdefault(name, time.monotonic())
+        self._meters.setdefault(name, RateMeter())
+
+    def remove(self, name: str):
+        """移除某路相机"""
+        for table in (self._intervals, self._deadlines, self._targets, self._meters):
+            table.pop(name, None)
+
+    def names(self) -> list[str]:
+        return list(self._intervals.keys())
+
+    def due(self, now: float) -> list[str]:
+        """截止时间已到的相机"""
+        return [name for name, deadline in self._deadlines.items() if deadline <= now]
+
+    def next_deadline(self, exclude: Collection[str] = ()) -> Optional[float]:
+        """最近的截止时间（可排除部分相机）"""
+        deadlines = [deadline for name, deadline in self._deadlines.items() if name not in exclude]
+        return min(deadlines) if deadlines else None
+
+    def mark_sent(self, name: str, now: float, sent: bool = True):
+        """
+        记录本周期已处理，并推进截止时间
+
+        Args:
+            sent: False 表示本周期的帧被跳过（不计入实际帧率）
+        """
+        interval = self._intervals[name]
+        deadline = self._deadlines[name] + interval
+        if deadline <= now:
+            # 落后超过一个周期：重新对齐，不补发
+            deadline = now + interval
+        self._deadlines[name] = deadline
+        if sent:
+            self._meters[name].tick(now)
+
+    def wait_deadline(self, name: str) -> float:
+        """截止时间已到时等待新帧的最晚时刻（之后 defer 顺延到下一周期）"""
+        return self._deadlines[name] + self._intervals[name]
+
+    def defer(self, name: str, now: float) -> bool:
+        """
+        截止时间已到但没有新帧可发
+
+        Returns:
+            True 表示继续等待新帧；等待超过一个周期（相机停滞或不可用）
+            则顺延到下一周期并返回 False
+        """
+        interval = self._intervals[name]
+        if now - self._deadlines[name] < interval:
+            return True
+        self._deadlines[name] = now + interval
+        return False
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """每路相机的目标帧率与实际帧率"""
+        now = time.monotonic()
+        return {
+            name: {
+                "target_fps": round(self._targets[name], 2),
+                "achieved_fps": round(self._meters[name].rate(now), 2),
+            }
+            for name in self._intervals
+        }
+
+
+class CameraSession:
+    """单个观看者的相机订阅会话"""
+
+    def __init__(self, manager: "CameraManager", camera_names: list[str],
+                 max_fps: Optional[float] = None, quality: Optional[int] = None,
+                 sizes: Optional[dict[str, Any]] = None,
+                 skip_unchanged: Optional[bool] = None, codec: str = "jpeg",
+                 depth: Optional[list[str]] = None):
+        """
+        初始化会话
+
+        Args:
+            manager: 相机管理器（共享采集缓冲）
+            camera_names: 订阅的相机名称列表
+            max_fps: 帧率上限（None 表示使用相机自身帧率）
+            quality: JPEG 质量（None 表示使用配置默认值）
+            sizes: 每路相机的输出尺寸，如 {"head": "full", "left_wrist": "thumb"}
+            skip_unchanged: 是否跳过未变化的画面（None 表示跟随变化检测配置）
+            codec: "jpeg"（默认）或视频编码格式 "h264" / "vp8"
+            depth: 需要附带深度预览（伪彩色 JPEG）的相机
+        """
+        self.session_id = uuid.uuid4().hex[:8]
+        self.manager = manager
+        self.camera_names = list(camera_names)
+        self.max_fps = max_fps
+        self.quality = quality
+        self.sizes: dict[str, Any] = dict(sizes or {})
+        self.skip_unchanged = settings.camera_change_detection if skip_unchanged is None else skip_unchanged
+        self.codec = codec or "jpeg"
+        self.depth_cameras: list[str] = list(depth or [])
+        self.created_at = time.time()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.pacer = FramePacer()
+        self._last_seq: dict[str, int] = {}
+        self._last_signature: dict[str, Any] = {}
+        self._last_sent_at: dict[str, float] = {}
+        self._acquired: set[str] = set()
+        self._closed = False
+        self._configure_pacer()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def update(self, camera_names: Optional[list[str]] = None, max_fps: Optional[float] = None,
+               quality: Optional[int] = None, sizes: Optional[dict[str, Any]] = None,
+               skip_unchanged: Optional[bool] = None, depth: Optional[list[str]] = None):
+        """更新订阅（相机集合 / 帧率上限 / JPEG 质量 / 输出尺寸 / 静止跳过 / 深度预览），只影响本会话"""
+        if camera_names is not None:
+            self.camera_names = list(camera_names)
+        if max_fps is not None:
+            self.max_fps = max_fps
+        if quality is not None:
+            self.quality = quality
+        if sizes is not None:
+            self.sizes = dict(sizes)
+            # 尺寸变化后立即发送新尺寸的画面
+            self._last_signature.clear()
+        if skip_unchanged is not None:
+            self.skip_unchanged = skip_unchanged
+        if depth is not None:
+            self.depth_cameras = list(depth)
+        self._configure_pacer()
+        logger.info(f"相机会话 {self.session_id} 订阅更新: {self.camera_names}，帧率上限: {self.max_fps}")
+
+    def target_fps(self, name: str) -> float:
+        """某路相机在本会话中的目标帧率: min(CameraConfig.fps, 会话上限)"""
+        config = self.manager.camera_configs.get(name)
+        target = float(config.fps) if config else 30.0
+        if self.max_fps:
+            target = min(target, float(self.max_fps))
+        return target
+
+    @property
+    def holder_id(self) -> str:
+        """本会话在相机引用计数中的标识"""
+        return f"session:{self.session_id}"
+
+    def _configure_pacer(self):
+        """根据订阅同步节拍器与相机引用（订阅即开始采集，取消订阅即释放）"""
+        if self._closed:
+            return
+        for name in self.pacer.names():
+            if name not in self.camera_names:
+                self.pacer.remove(name)
+        for name in list(self._acquired):
+            if name not in self.camera_names:
+                self.manager.release(name, self.holder_id)
+                self._acquired.discard(name)
+        for name in self.camera_names:
+            self.pacer.configure(name, self.target_fps(name))
+            if name not in self._acquired and self.manager.acquire(name, self.holder_id):
+                self._acquired.add(name)
+
+    def _is_unchanged(self, name: str, packet, now: float) -> bool:
+        """与上次发送的帧相比画面没有明显变化，且未到保活时间"""
+        if not self.skip_unchanged or packet.signature is None:
+            return False
+        last_signature = self._last_signature.get(name)
+        if last_signature is None:
+            return False
+        if now - self._last_sent_at.get(name, 0.0) >= settings.camera_keepalive_interval:
+            return False
+        return signature_distance(packet.signature, last_signature) < settings.camera_change_threshold
+
+    def close(self):
+        """关闭会话，释放所有相机引用"""
+        self._closed = True
+        for name in list(self._acquired):
+            self.manager.release(name, self.holder_id)
+        self._acquired.clear()
+
+    async def run(self, websocket):
+        """
+        向 WebSocket 推送订阅相机的新帧，直到会话关闭或连接断开
+
+        Args:
+            websocket: WebSocket 连接
+        """
+        if self.codec != "jpeg" and await self._run_video(websocket):
+            return
+        await self._run_jpeg(websocket)
+
+    async def _run_video(self, websocket) -> bool:
+        """
+        转发共享视频编码流的分片
+
+        Returns:
+            False 表示视频编码不可用，应回退到 JPEG
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE * max(1, len(self.camera_names)))
+        subscribers: dict[str, VideoSubscriber] = {}
+
+        def sync_subscriptions():
+            """根据订阅的相机集合增减视频流订阅"""
+            for name in list(subscribers):
+                if name not in self.camera_names:
+                    self.manager.unsubscribe_video(name, self.codec, subscribers.pop(name))
+            for name in self.camera_names:
+                if name not in subscribers:
+                    subscriber = VideoSubscriber(loop, queue)
+                    if self.manager.subscribe_video(name, self.codec, subscriber):
+                        subscribers[name] = subscriber
+
+        sync_subscriptions()
+        if not subscribers:
+            logger.warning(f"相机会话 {self.session_id}: {self.codec} 编码不可用，回退到 JPEG")
+            requested, self.codec = self.codec, "jpeg"
+            await websocket.send_json({
+                "type": "stream_info",
+                "data": {"codec": "jpeg", "message": f"{requested} 编码不可用，已回退到 JPEG"}
+            })
+            return False
+
+        await websocket.send_json({
+            "type": "stream_info",
+            "data": {
+                "codec": self.codec,
+                "cameras": {
+                    name: {"width": config.width, "height": config.height, "fps": config.fps}
+                    for name, config in self.manager.camera_configs.items()
+                    if name in subscribers
+                }
+            }
+        })
+
+        try:
+            while not self._closed:
+                sync_subscriptions()
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+
+                await websocket.send_json({
+                    "type": "video_chunk",
+                    "data": {
+                        "camera": chunk.camera,
+                        "codec": chunk.codec,
+                        "keyframe": chunk.keyframe,
+                        "pts": chunk.pts,
+                        "seq": chunk.seq,
+                        "payload": base64.b64encode(chunk.data).decode('utf-8'),
+                    }
+                })
+                self.frames_sent += 1
+                self.bytes_sent += len(chunk.data)
+        finally:
+            for name, subscriber in subscribers.items():
+                self.manager.unsubscribe_video(name, self.codec, subscriber)
+        return True
+
+    async def _run_jpeg(self, websocket):
+        """按节拍器推送 JPEG 帧"""
+        next_report = time.monotonic() + STATS_REPORT_INTERVAL
+
+        while not self._closed:
+            now = time.monotonic()
+            frames_data = {}
+            waiting: list[str] = []  # 已到期但共享缓冲中还没有新帧的相机
+
+            due_packets = []
+            for name in self.pacer.due(now):
+                packet = self.manager.get_latest_packet(name)
+                if packet is None or packet.seq == self._last_seq.get(name):
+                    # 截止时间已到但还没有新帧：等待新帧，停滞则顺延
+                    if self.pacer.defer(name, now):
+                        waiting.append(name)
+                    continue
+                if self._is_unchanged(name, packet, now):
+                    self._last_seq[name] = packet.seq
+                    self.frames_skipped += 1
+                    self.pacer.mark_sent(name, now, sent=False)
+                    continue
+                due_packets.append((name, packet))
+
+            # 各路相机（及深度预览）在编码池中并行编码
+            sizes = [self.manager.resolve_size(name, self.sizes.get(name)) for name, _ in due_packets]
+            depth_packets = [
+                (name, packet, size) for (name, packet), size in zip(due_packets, sizes)
+                if name in self.depth_cameras and packet.depth is not None
+            ]
+            encoded = await asyncio.gather(*(
+                self.manager.encode_jpeg_async(packet, self.quality, size)
+                for (_, packet), size in zip(due_packets, sizes)
+            ), *(
+                self.manager.encode_depth_async(packet, "preview", self.quality, size)
+                for _, packet, size in depth_packets
+            ))
+            depth_data = {}
+            for (name, _, _), depth_bytes in zip(depth_packets, encoded[len(due_packets):]):
+                if depth_bytes:
+                    depth_data[name] = base64.b64encode(depth_bytes).decode('utf-8')
+                    self.bytes_sent += len(depth_bytes)
+            for (name, packet), frame_bytes in zip(due_packets, encoded):
+                if frame_bytes:
+                    frames_data[name] = base64.b64encode(frame_bytes).decode('utf-8')
+                    self._last_seq[name] = packet.seq
+                    self._last_signature[name] = packet.signature
+                    self._last_sent_at[name] = now
+                    self.bytes_sent += len(frame_bytes)
+                    self.pacer.mark_sent(name, now)
+                else:
+                    # 编码失败：与未变化的帧一样跳过本周期，等下一帧再试（编码结果已缓存，重试不会成功）
+                    self._last_seq[name] = packet.seq
+                    self.pacer.mark_sent(name, now, sent=False)
+
+            if frames_data:
+                message = {
+                    "type": "camera_frames",
+                    "data": frames_data
+                }
+                if depth_data:
+                    message["depth"] = depth_data
+                await websocket.send_json(message)
+                self.frames_sent += len(frames_data)
+
+            now = time.monotonic()
+            if now >= next_report:
+                # 顺带补上订阅时尚未添加的相机
+                self._configure_pacer()
+                await websocket.send_json({
+                    "type": "camera_stats",
+                    "data": self.pacer.get_stats()
+                })
+                next_report = now + STATS_REPORT_INTERVAL
+
+            # 睡到最近的截止时间（已扣除本轮处理耗时）
+            next_deadline = self.pacer.next_deadline()
+            if waiting:
+                await self._wait_for_frames(waiting)
+            elif next_deadline is None:
+                await asyncio.sleep(STATS_REPORT_INTERVAL)
+            else:
+                await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
+
+    async def _wait_for_frames(self, waiting: list[str]):
+        """
+        等待任一到期相机的新帧：最多等到这些相机的放弃时刻，
+        以及其他相机中最近的截止时间
+        """
+        deadline = min(self.pacer.wait_deadline(name) for name in waiting)
+        other_deadline = self.pacer.next_deadline(exclude=waiting)
+        if other_deadline is not None:
+            deadline = min(deadline, other_deadline)
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return
+
+        tasks = [
+            asyncio.ensure_future(
+                self.manager.captures[name].wait_for_frame_async(self._last_seq.get(name, 0), timeout)
+            )
+            for name in waiting if name in self.manager.captures
+        ]
+        if not tasks:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_info(self) -> dict[str, Any]:
+        """获取会话信息"""
+        return {
+            "session_id": self.session_id,
+            "cameras": self.camera_names,
+            "max_fps": self.max_fps,
+            "codec": self.codec,
+            "depth": self.depth_cameras,
+            "quality": self.quality,
+            "sizes": self.sizes,
+            "skip_unchanged": self.skip_unchanged,
+            "uptime": time.time() - self.created_at,
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "bytes_sent": self.bytes_sent,
+            "fps": self.pacer.get_stats(),
+        }
@@ -19,7 +19,57 @@ class Settings(BaseSettings):
     # 机器人配置
     robot_id: str = "my_xlerobot"
     robot_fps: int = 30
+
+    # 机械臂设定值插值（遥操作目标 → 控制频率下的平滑指令）
+    setpoint_interpolation: bool = True  # 关闭时每次按键直接下发 P 控制指令
+    arm_max_velocity: float = 120.0  # 关节最大速度（度/秒）
+    arm_max_acceleration: float = 600.0  # 关节最大加速度（度/秒²）
+
+    # 策略动作源（/api/sources 的 process 类型只能使用白名单中的工厂）
+    policy_factories: str = ""  # 额外的策略工厂 "名称=module:function,..."
+    policy_package: str = ""  # 受信任的策略包，其中的 "module:function" 均可使用（留空表示不允许）
+
+    # 相机采集与编码配置
+    camera_encoder_workers: int = 0  # JPEG 编码线程数，0 表示使用 CPU 核心数
+    camera_history_size: int = 8  # 每路相机保留的最近帧数（用于时间对齐快照）
+    camera_idle_timeout: float = 10.0  # 无使用者多久后停止采集（秒，设备保持打开）
+    camera_release_timeout: float = 60.0  # 停止采集后再过多久断开设备（秒）
+    camera_jpeg_backend: str = "auto"  # auto / turbojpeg / opencv
+    camera_jpeg_quality: int = 85
+    camera_thumbnail_width: int = 320  # 网格视图缩略图宽度（高度按比例）
+    
+    # 相机画面变化检测（跳过静止画面）
+    camera_change_detection: bool = True  # 在采集阶段计算变化检测签名
+    camera_change_threshold: float = 1.5  # 平均灰度差低于该值视为未变化（0-255）
+    camera_keepalive_interval: float = 1.0  # 画面未变化时的最长发送间隔（秒）
+    
+    # RealSense 深度图
+    depth_preview_max_mm: int = 4000  # 深度预览伪彩色映射的最大深度（毫米）
+    depth_png_compression: int = 1  # 16 位 PNG 压缩等级（0-9）
     
+    # 相机视频编码（H.264 / VP8，需要 PyAV）
+    camera_video_bitrate: int = 1_000_000  # 每路相机码率（bit/s）
+    camera_video_gop_seconds: float = 2.0  # 关键帧间隔（秒）
+
+    # 设备清单（串口 / 相机热插拔检测）
+    device_poll_interval: float = 1.0  # 未安装 pyudev 时扫描 /dev 的间隔（秒）
+
+    # 配置文件（键位、复位位置）持久化
+    config_write_debounce: float = 0.5  # 最后一次修改后多久写盘（秒）
+    config_backups: int = 3  # 保留的备份份数
+    keymap_reload_interval: float = 1.0  # 检查键位配置文件外部修改的间隔（秒）
+
+    # 回合录制
+    recordings_dir: str = "~/.cache/xlerobot_web/episodes"
+    recording_buffer_size: int = 4096  # 环形缓冲行数（写盘线程最多可落后的行数）
+    recording_flush_rows: int = 256  # 累积多少行写一次盘
+
+    # 遥测历史（内存环形缓冲）与故障转储
+    telemetry_history_seconds: float = 60.0  # 保留最近多少秒
+    telemetry_max_rate: float = 200.0  # 每秒最多记录的行数（决定缓冲容量）
+    telemetry_dump_dir: str = "~/.cache/xlerobot_web/crash_dumps"
+    telemetry_dump_min_interval: float = 10.0  # 两次故障转储的最小间隔（秒）
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,554 @@
+"""
+数据集导出模块 - 把录制的回合转换为 LeRobotDataset（v2.1）格式
+
+    <output>/
+        meta/info.json
+        meta/tasks.jsonl
+        meta/episodes.jsonl
+        meta/episodes_stats.jsonl
+        meta/stats.json
+        data/chunk-000/episode_000000.parquet
+        videos/chunk-000/observation.images.<camera>/episode_000000.mp4
+
+每个回合在进程池中独立处理：按数据集帧率重采样观测值与动作（前向填充），
+写 parquet，并把相机录制的 MJPEG 按帧时刻选帧后直接送入 ffmpeg 重新编码
+（JPEG 数据不在 Python 中解码）。各回合的统计量（计数、和、平方和、最值）
+在完成时单次流式合并，内存占用与回合数无关。
+
+命令行用法：
+    python dataset_export.py --output ~/datasets/xlerobot_teleop --workers 8
+"""
+import os
+import json
+import math
+import shutil
+import logging
+import argparse
+import subprocess
+import multiprocessing
+import threading
+from pathlib import Path
+from typing import Any, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from config import settings
+from episode_recorder import load_episode
+from camera_recorder import load_camera_index
+
+logger = logging.getLogger(__name__)
+
+CODEBASE_VERSION = "v2.1"
+CHUNKS_SIZE = 1000
+DATA_PATH = "data/chunk-{episode_chunk:03d}/episode_{episode_index:06d}.parquet"
+VIDEO_PATH = "videos/chunk-{episode_chunk:03d}/{video_key}/episode_{episode_index:06d}.mp4"
+DEFAULT_TASK = "teleoperation"
+
+# 计算图像统计时每个回合采样的帧数
+IMAGE_STATS_SAMPLES = 8
+
+# ffmpeg 编码器名 -> info.json 中记录的编解码器名
+VIDEO_CODEC_NAMES = {
+    "libx264": "h264",
+    "h264_nvenc": "h264",
+    "libx265": "hevc",
+    "hevc_nvenc": "hevc",
+    "libsvtav1": "av1",
+    "libaom-av1": "av1",
+    "librav1e": "av1",
+    "av1_nvenc": "av1",
+    "libvpx-vp9": "vp9",
+    "libvpx": "vp8",
+}
+
+
+def video_codec_name(vcodec: str) -> str:
+    """将 ffmpeg 编码器名换算为编解码器名，未知的编码器原样返回"""
+    return VIDEO_CODEC_NAMES.get(vcodec, vcodec)
+
+
+# ==================== 流式统计 ====================
+
+class RunningStats:
+    """可合并的统计量（计数、和、平方和、最值），按最后一维之外的轴聚合"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum: Optional[np.ndarray] = None
+        self.sumsq: Optional[np.ndarray] = None
+        self.min: Optional[np.ndarray] = None
+        self.max: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_array(cls, values: np.ndarray, axis: Any = 0) -> "RunningStats":
+        values = values.astype(np.float64, copy=False)
+        stats = cls()
+        stats.count = int(np.prod([values.shape[a] for a in np.atleast_1d(axis)]))
+        stats.sum = values.sum(axis=axis)
+        stats.sumsq = np.square(values).sum(axis=axis)
+        stats.min = values.min(axis=axis)
+        stats.max = values.max(axis=axis)
+        return stats
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RunningStats":
+        stats = cls()
+        stats.count = data["count"]
+        for name in ["sum", "sumsq", "min", "max"]:
+            setattr(stats, name, np.asarray(data[name], dtype=np.float64))
+        return stats
+
+    def merge(self, other: "RunningStats"):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.sum, self.sumsq = other.count, other.sum.copy(), other.sumsq.copy()
+            self.min, self.max = other.min.copy(), other.max.copy()
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def to_raw(self) -> dict[str, Any]:
+        """可跨进程传递的原始累计量"""
+        return {
+            "count": self.count,
+            "sum": self.sum.tolist(),
+            "sumsq": self.sumsq.tolist(),
+            "min": self.min.tolist(),
+            "max": self.max.tolist(),
+        }
+
+    def to_lerobot(self) -> dict[str, Any]:
+        """LeRobot 统计格式：min / max / mean / std / count"""
+        mean = self.sum / self.count
+        std = np.sqrt(np.maximum(self.sumsq / self.count - np.square(mean), 0.0))
+        return {
+            "min": self.min.tolist(),
+            "max": self.max.tolist(),
+            "mean": mean.tolist(),
+            "std": std.tolist(),
+            "count": [self.count],
+        }
+
+
+# ==================== 单回合导出（在子进程中运行） ====================
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    """逐列把 NaN 替换为该列上一个有效值（开头的 NaN 保留）"""
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(len(values))[:, None], -1)
+    np.maximum.accumulate(index, axis=0, out=index)
+    filled = values[np.maximum(index, 0), np.arange(values.shape[1])]
+    filled[index < 0] = np.nan
+    return filled
+
+
+def episode_frame_times(timestamps: np.ndarray, fps: int) -> np.ndarray:
+    """回合在数据集帧率下的帧时刻（monotonic 秒，从第一行开始）"""
+    t0, t1 = float(timestamps[0]), float(timestamps[-1])
+    num_frames = int(math.floor((t1 - t0) * fps)) + 1
+    return t0 + np.arange(num_frames) / fps
+
+
+def _encode_camera_video(camera_dir: Path, camera: str, frame_times: np.ndarray, fps: int,
+                         output_path: Path, vcodec: str, crf: int) -> dict[str, Any]:
+    """按帧时刻选取最近的 JPEG 送入 ffmpeg 重新编码，返回图像统计与尺寸"""
+    index = load_camera_index(camera_dir, camera, mmap=False)
+    if len(index) == 0:
+        raise ValueError(f"相机 {camera} 没有录制到帧")
+
+    # 每个数据集帧取时间最近的相机帧
+    cam_times = index[:, 1]
+    pos = np.clip(np.searchsorted(cam_times, frame_times), 1, len(cam_times) - 1)
+    nearer_left = (frame_times - cam_times[pos - 1]) <= (cam_times[pos] - frame_times)
+    chosen = np.where(nearer_left, pos - 1, pos) if len(cam_times) > 1 else np.zeros(len(frame_times), int)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "mjpeg", "-framerate", str(fps), "-i", "-",
+        "-c:v", vcodec, "-pix_fmt", "yuv420p", "-g", "2", "-crf", str(crf),
+        str(output_path),
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    mjpeg = np.memmap(camera_dir / f"{camera}.mjpeg", dtype=np.uint8, mode="r")
+    try:
+        for i in chosen:
+            offset, size = int(index[i, 2]), int(index[i, 3])
+            process.stdin.write(mjpeg[offset:offset + size].tobytes())
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    stderr = process.stderr.read().decode(errors="replace")
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg 编码相机 {camera} 失败: {stderr.strip()}")
+
+    # 采样少量帧计算图像统计（按通道，归一化到 0-1）
+    sample_ids = np.unique(np.linspace(0, len(chosen) - 1, IMAGE_STATS_SAMPLES).astype(int))
+    images = []
+    for i in chosen[sample_ids]:
+        offset, size = int(index[i, 2]), int(index[i, 3])
+        image = cv2.imdecode(np.asarray(mjpeg[offset:offset + size]), cv2.IMREAD_COLOR)
+        images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    stacked = np.stack(images).astype(np.float32) / 255.0  # (S, H, W, 3)
+    height, width = stacked.shape[1:3]
+    stats = RunningStats.from_array(stacked, axis=(0, 1, 2))
+    # LeRobot 的图像统计形状为 (通道, 1, 1)
+    for name in ["sum", "sumsq", "min", "max"]:
+        setattr(stats, name, getattr(stats, name).reshape(3, 1, 1))
+    return {"height": height, "width": width, "stats": stats.to_raw()}
+
+
+def export_episode(job: dict[str, Any]) -> dict[str, Any]:
+    """
+    导出单个回合（进程池任务，参数与返回值均可 pickle）
+
+    Args:
+        job: episode_dir, output_dir, episode_index, index_offset, task_index, fps,
+             observation_keys, action_keys, cameras, vcodec, crf
+
+    Returns:
+        帧数、各特征的原始累计统计、相机尺寸
+    """
+    episode_dir = Path(job["episode_dir"])
+    output_dir = Path(job["output_dir"])
+    episode_index, fps = job["episode_index"], job["fps"]
+    chunk = episode_index // CHUNKS_SIZE
+
+    episode = load_episode(episode_dir, mmap=False)
+    meta = episode["meta"]
+    timestamps = episode["timestamp"]
+    frame_times = episode_frame_times(timestamps, fps)
+    num_frames = len(frame_times)
+
+    # 按字段名对齐到数据集的特征顺序
+    obs_cols = [meta["observation_keys"].index(key) for key in job["observation_keys"]]
+    act_cols = [meta["action_keys"].index(key) for key in job["action_keys"]]
+    observation = _forward_fill(episode["observation"][:, obs_cols].astype(np.float64))
+    action = _forward_fill(episode["action"][:, act_cols].astype(np.float64))
+
+    # 每帧取不晚于帧时刻的最后一行
+    rows = np.clip(np.searchsorted(timestamps, frame_times, side="right") - 1, 0, len(timestamps) - 1)
+    state = observation[rows]
+    action = action[rows]
+
+    # 尚未下发过的字段：位置保持在观测位置，速度为 0
+    for j, key in enumerate(job["action_keys"]):
+        missing = np.isnan(action[:, j])
+        if not missing.any():
+            continue
+        if key.endswith(".pos") and key in job["observation_keys"]:
+            action[missing, j] = state[missing, job["observation_keys"].index(key)]
+        else:
+            action[missing, j] = 0.0
+    state = np.nan_to_num(state)
+
+    frame_index = np.arange(num_frames, dtype=np.int64)
+    columns = {
+        "observation.state": state.astype(np.float32),
+        "action": action.astype(np.float32),
+        "timestamp": (frame_index / fps).astype(np.float32),
+        "frame_index": frame_index,
+        "episode_index": np.full(num_frames, episode_index, dtype=np.int64),
+        "index": frame_index + job["index_offset"],
+        "task_index": np.full(num_frames, job["task_index"], dtype=np.int64),
+    }
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({
+        name: (pa.array(values.tolist(), type=pa.list_(pa.float32())) if values.ndim == 2 else values)
+        for name, values in columns.items()
+    })
+    data_path = output_dir / DATA_PATH.format(episode_chunk=chunk, episode_index=episode_index)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, data_path)
+
+    stats = {
+        name: RunningStats.from_array(values.reshape(num_frames, -1)).to_raw()
+        for name, values in columns.items()
+    }
+
+    videos = {}
+    for camera in job["cameras"]:
+        video_key = f"observation.images.{camera}"
+        video_path = output_dir / VIDEO_PATH.format(
+            episode_chunk=chunk, video_key=video_key, episode_index=episode_index
+        )
+        result = _encode_camera_video(
+            episode_dir / "cameras", camera, frame_times, fps, video_path, job["vcodec"], job["crf"]
+        )
+        stats[video_key] = result.pop("stats")
+        videos[video_key] = result
+
+    return {
+        "episode_index": episode_index,
+        "episode_id": meta.get("episode_id", episode_dir.name),
+        "length": num_frames,
+        "task": job["task"],
+        "stats": stats,
+        "videos": videos,
+    }
+
+
+# ==================== 导出任务 ====================
+
+def _episode_cameras(episode_dir: Path) -> list[str]:
+    camera_dir = episode_dir / "cameras"
+    if not camera_dir.exists():
+        return []
+    return sorted(path.name[:-len(".index.npy")] for path in camera_dir.glob("*.index.npy"))
+
+
+class DatasetExporter:
+    """把多个回合导出为一个 LeRobotDataset（可在后台线程中运行并查询进度）"""
+
+    def __init__(self, episode_dirs: list[Path], output_dir: Path, fps: Optional[int] = None,
+                 workers: int = 0, vcodec: str = "libx264", crf: int = 23,
+                 robot_type: str = "xlerobot"):
+        """
+        Args:
+            episode_dirs: 要导出的回合目录（按此顺序编号）
+            output_dir: 数据集输出目录（不能已存在）
+            fps: 数据集帧率，默认 robot_fps
+            workers: 进程数，0 表示 CPU 核心数
+            vcodec: ffmpeg 视频编码器
+            crf: 视频质量（越小越好）
+            robot_type: 写入 info.json 的机器人类型
+        """
+        self.episode_dirs = [Path(d).expanduser() for d in episode_dirs]
+        self.output_dir = Path(output_dir).expanduser()
+        self.fps = fps or settings.robot_fps
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.vcodec = vcodec
+        self.crf = crf
+        self.robot_type = robot_type
+
+        self.state = "idle"  # idle / running / finished / error
+        self.error: Optional[str] = None
+        self.completed = 0
+        self.failed: dict[str, str] = {}
+        self.total_episodes = len(self.episode_dirs)
+        self.total_frames = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """在后台线程中运行导出"""
+        self._thread = threading.Thread(target=self.run, name="dataset-export", daemon=True)
+        self._thread.start()
+
+    def _plan(self) -> list[dict[str, Any]]:
+        """确定特征、任务编号和每个回合的全局帧偏移（只读元数据和时间戳首尾）"""
+        first = load_episode(self.episode_dirs[0], mmap=True)["meta"]
+        self.observation_keys = first["observation_keys"]
+        self.action_keys = first["action_keys"]
+        self.cameras = _episode_cameras(self.episode_dirs[0])
+        self.tasks: dict[str, int] = {}
+
+        jobs = []
+        index_offset = 0
+        for episode_dir in self.episode_dirs:
+            episode = load_episode(episode_dir, mmap=True)
+            meta = episode["meta"]
+            missing = (
+                set(self.observation_keys) - set(meta["observation_keys"])
+                | set(self.action_keys) - set(meta["action_keys"])
+                | set(self.cameras) - set(_episode_cameras(episode_dir))
+            )
+            if missing or len(episode["timestamp"]) == 0:
+                reason = f"缺少字段或相机: {sorted(missing)}" if missing else "没有数据"
+                self.failed[episode_dir.name] = reason
+                continue
+
+            task = meta.get("task") or DEFAULT_TASK
+            task_index = self.tasks.setdefault(task, len(self.tasks))
+            jobs.append({
+                "episode_dir": str(episode_dir),
+                "output_dir": str(self.output_dir),
+                "episode_index": len(jobs),
+                "index_offset": index_offset,
+                "task": task,
+                "task_index": task_index,
+                "fps": self.fps,
+                "observation_keys": self.observation_keys,
+                "action_keys": self.action_keys,
+                "cameras": self.cameras,
+                "vcodec": self.vcodec,
+                "crf": self.crf,
+            })
+            index_offset += len(episode_frame_times(episode["timestamp"], self.fps))
+        return jobs
+
+    def run(self) -> dict[str, Any]:
+        """执行导出（阻塞）"""
+        self.state = "running"
+        try:
+            if not self.episode_dirs:
+                raise ValueError("没有要导出的回合")
+            if self.output_dir.exists():
+                raise FileExistsError(f"输出目录已存在: {self.output_dir}")
+
+            jobs = self._plan()
+            if self.cameras and shutil.which("ffmpeg") is None:
+                raise RuntimeError("导出视频需要 ffmpeg")
+            (self.output_dir / "meta").mkdir(parents=True)
+            self.total_episodes = len(jobs)
+
+            dataset_stats: dict[str, RunningStats] = {}
+            results: dict[int, dict[str, Any]] = {}
+            job_failures = 0
+            episodes_stats_file = open(self.output_dir / "meta" / "episodes_stats.jsonl", "w", encoding="utf-8")
+            # 服务进程内有多个线程（控制循环、相机采集等），fork 出的子进程可能继承被持有的锁，
+            # 因此使用 spawn 启动工作进程
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            with episodes_stats_file, pool:
+                futures = {pool.submit(export_episode, job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"导出回合 {job['episode_dir']} 失败: {e}")
+                        self.failed[Path(job["episode_dir"]).name] = str(e)
+                        job_failures += 1
+                        continue
+
+                    episode_stats = {}
+                    for name, raw in result.pop("stats").items():
+                        stats = RunningStats.from_dict(raw)
+                        episode_stats[name] = stats.to_lerobot()
+                        dataset_stats.setdefault(name, RunningStats()).merge(stats)
+                    episodes_stats_file.write(json.dumps(
+                        {"episode_index": result["episode_index"], "stats": episode_stats}
+                    ) + "\n")
+                    results[result["episode_index"]] = result
+                    self.completed += 1
+                    self.total_frames += result["length"]
+
+            if job_failures:
+                # 全局帧编号在规划时已确定，有回合失败时数据集不完整
+                raise RuntimeError(f"{job_failures} 个回合导出失败: {self.failed}")
+
+            self._write_meta(results, dataset_stats)
+            self.state = "finished"
+            logger.info(f"数据集导出完成: {self.output_dir}（{self.completed} 个回合，{self.total_frames} 帧）")
+        except Exception as e:
+            logger.error(f"导出数据集时出错: {e}")
+            self.state = "error"
+            self.error = str(e)
+        return self.get_status()
+
+    def _write_meta(self, results: dict[int, dict[str, Any]], dataset_stats: dict[str, RunningStats]):
+        meta_dir = self.output_dir / "meta"
+        with open(meta_dir / "episodes.jsonl", "w", encoding="utf-8") as f:
+            for i in sorted(results):
+                f.write(json.dumps({
+                    "episode_index": i, "tasks": [results[i]["task"]], "length": results[i]["length"]
+                }, ensure_ascii=False) + "\n")
+        with open(meta_dir / "tasks.jsonl", "w", encoding="utf-8") as f:
+            for task, task_index in self.tasks.items():
+                f.write(json.dumps({"task_index": task_index, "task": task}, ensure_ascii=False) + "\n")
+        with open(meta_dir / "stats.json", "w", encoding="utf-8") as f:
+            json.dump({name: stats.to_lerobot() for name, stats in dataset_stats.items()}, f, indent=2)
+
+        features: dict[str, Any] = {
+            "action": {"dtype": "float32", "shape": [len(self.action_keys)], "names": self.action_keys},
+            "observation.state": {
+                "dtype": "float32", "shape": [len(self.observation_keys)], "names": self.observation_keys
+            },
+        }
+        first_videos = results[min(results)]["videos"] if results else {}
+        for video_key, video in first_videos.items():
+            features[video_key] = {
+                "dtype": "video",
+                "shape": [video["height"], video["width"], 3],
+                "names": ["height", "width", "channels"],
+                "info": {
+                    "video.fps": self.fps,
+                    "video.height": video["height"],
+                    "video.width": video["width"],
+                    "video.channels": 3,
+                    "video.codec": video_codec_name(self.vcodec),
+                    "video.pix_fmt": "yuv420p",
+                    "video.is_depth_map": False,
+                    "has_audio": False,
+                },
+            }
+        features["timestamp"] = {"dtype": "float32", "shape": [1], "names": None}
+        for name in ["frame_index", "episode_index", "index", "task_index"]:
+            features[name] = {"dtype": "int64", "shape": [1], "names": None}
+
+        num_episodes = len(results)
+        info = {
+            "codebase_version": CODEBASE_VERSION,
+            "robot_type": self.robot_type,
+            "total_episodes": num_episodes,
+            "total_frames": self.total_frames,
+            "total_tasks": len(self.tasks),
+            "total_videos": num_episodes * len(first_videos),
+            "total_chunks": math.ceil(num_episodes / CHUNKS_SIZE),
+            "chunks_size": CHUNKS_SIZE,
+            "fps": self.fps,
+            "splits": {"train": f"0:{num_episodes}"},
+            "data_path": DATA_PATH,
+            "video_path": VIDEO_PATH if first_videos else None,
+            "features": features,
+        }
+        with open(meta_dir / "info.json", "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=4, ensure_ascii=False)
+
+    def get_status(self) -> dict[str, Any]:
+        """获取导出进度"""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "output_dir": str(self.output_dir),
+            "total_episodes": self.total_episodes,
+            "completed": self.completed,
+            "failed": self.failed,
+            "total_frames": self.total_frames,
+            "workers": self.workers,
+        }
+
+
+def list_episode_dirs(recordings_dir: Optional[Path] = None) -> list[Path]:
+    """列出录制目录下所有已完成的回合（按回合 ID 即时间排序）"""
+    root = Path(recordings_dir or settings.recordings_dir).expanduser()
+    if not root.exists():
+        return []
+    return sorted(
+        path for path in root.iterdir()
+        if (path / "meta.json").exists() and "ended_at" in json.loads((path / "meta.json").read_text("utf-8"))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把录制的回合导出为 LeRobotDataset")
+    parser.add_argument("--output", required=True, help="数据集输出目录")
+    parser.add_argument("--recordings-dir", default=None, help="回合录制目录（默认使用配置）")
+    parser.add_argument("--episodes", nargs="*", default=None, help="要导出的回合 ID（默认全部）")
+    parser.add_argument("--fps", type=int, default=None, help="数据集帧率（默认 robot_fps）")
+    parser.add_argument("--workers", type=int, default=0, help="进程数（默认 CPU 核心数）")
+    parser.add_argument("--vcodec", default="libx264", help="ffmpeg 视频编码器")
+    parser.add_argument("--crf", type=int, default=23, help="视频质量")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    episode_dirs = list_episode_dirs(args.recordings_dir)
+    if args.episodes:
+        episode_dirs = [d for d in episode_dirs if d.name in set(args.episodes)]
+
+    exporter = DatasetExporter(episode_dirs, Path(args.output), fps=args.fps, workers=args.workers,
+                               vcodec=args.vcodec, crf=args.crf)
+    status = exporter.run()
+    print(json.dumps(status, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
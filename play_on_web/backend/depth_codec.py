@@ -0,0 +1,153 @@
+"""
+深度图编码模块 - RealSense 16 位深度图的紧凑传输格式
+
+- 录制 / 分析：无损 16 位 PNG，或 zstd 压缩的帧间差分（DepthDeltaEncoder）
+- 预览：量化到 8 位并伪彩色映射后按普通图像编码（有损，体积与彩色帧相当）
+
+深度单位为毫米（uint16），0 表示无效深度。
+"""
+import zlib
+import struct
+import logging
+from typing import Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 差分帧格式头：魔数(2) + 帧类型(1) + 压缩算法(1) + 宽(2) + 高(2)
+_DELTA_HEADER = struct.Struct("<2sBBHH")
+_DELTA_MAGIC = b"DZ"
+FRAME_KEY = 0
+FRAME_DELTA = 1
+COMPRESSION_ZLIB = 0
+COMPRESSION_ZSTD = 1
+
+
+def encode_depth_png(depth: np.ndarray, compression: int = 1) -> bytes:
+    """
+    将深度图编码为无损 16 位 PNG
+
+    Args:
+        depth: uint16 深度图（毫米）
+        compression: PNG 压缩等级（0-9，越低越快）
+    """
+    ok, buffer = cv2.imencode('.png', depth.astype(np.uint16, copy=False),
+                              [cv2.IMWRITE_PNG_COMPRESSION, compression])
+    if not ok:
+        raise RuntimeError("深度图 PNG 编码失败")
+    return buffer.tobytes()
+
+
+def decode_depth_png(data: bytes) -> np.ndarray:
+    """解码 16 位 PNG 深度图"""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def colorize_depth(depth: np.ndarray, max_mm: int = 4000) -> np.ndarray:
+    """
+    将深度图量化为 8 位并伪彩色映射（用于预览）
+
+    Args:
+        depth: uint16 深度图（毫米）
+        max_mm: 映射的最大深度，超出部分饱和
+
+    Returns:
+        RGB 图像，无效深度（0）显示为黑色
+    """
+    scaled = np.clip(depth.astype(np.float32) * (255.0 / max_mm), 0, 255).astype(np.uint8)
+    colored = cv2.applyColorMap(scaled, cv2.COLORMAP_JET)
+    colored[depth == 0] = 0
+    return cv2.cvtColor(colored, cv2.COLOR_BGR2RGB)
+
+
+class DepthDeltaEncoder:
+    """
+    深度图帧间差分编码（无损）
+
+    每 keyframe_interval 帧一个关键帧，其余帧只存与上一帧的差值
+    （按 uint16 回绕相减，可逆），静止场景的差值几乎全为 0，压缩率很高。
+    安装了 zstandard 时使用 zstd，否则回退到 zlib。
+    """
+
+    def __init__(self, keyframe_interval: int = 30, level: int = 3):
+        self.keyframe_interval = keyframe_interval
+        self._previous: Optional[np.ndarray] = None
+        self._count = 0
+        if zstandard is not None:
+            self._compression = COMPRESSION_ZSTD
+            self._compressor = zstandard.ZstdCompressor(level=level)
+        else:
+            self._compression = COMPRESSION_ZLIB
+            self._compressor = None
+            self._level = min(level, 9)
+
+    def reset(self):
+        """下一帧强制为关键帧"""
+        self._previous = None
+
+    def encode(self, depth: np.ndarray) -> bytes:
+        """编码一帧深度图"""
+        depth = np.ascontiguousarray(depth, dtype=np.uint16)
+        is_key = (
+            self._previous is None
+            or self._previous.shape != depth.shape
+            or self._count % self.keyframe_interval == 0
+        )
+        payload = depth if is_key else depth - self._previous  # uint16 回绕相减
+        self._previous = depth
+        self._count += 1
+
+        raw = payload.tobytes()
+        if self._compressor is not None:
+            compressed = self._compressor.compress(raw)
+        else:
+            compressed = zlib.compress(raw, self._level)
+
+        height, width = depth.shape
+        header = _DELTA_HEADER.pack(_DELTA_MAGIC, FRAME_KEY if is_key else FRAME_DELTA,
+                                    self._compression, width, height)
+        return header + compressed
+
+
+def is_depth_keyframe(data: bytes) -> bool:
+    """差分编码的一帧是否为关键帧（可从该帧开始解码）"""
+    return _DELTA_HEADER.unpack_from(data)[1] == FRAME_KEY
+
+
+class DepthDeltaDecoder:
+    """DepthDeltaEncoder 的解码器"""
+
+    def __init__(self):
+        self._previous: Optional[np.ndarray] = None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """解码一帧，差分帧必须按顺序从关键帧开始解码"""
+        magic, frame_type, compression, width, height = _DELTA_HEADER.unpack_from(data)
+        if magic != _DELTA_MAGIC:
+            raise ValueError("不是深度差分帧")
+
+        body = data[_DELTA_HEADER.size:]
+        if compression == COMPRESSION_ZSTD:
+            if self._decompressor is None:
+                raise RuntimeError("解码需要 zstandard")
+            raw = self._decompressor.decompress(body, max_output_size=width * height * 2)
+        else:
+            raw = zlib.decompress(body)
+
+        payload = np.frombuffer(raw, dtype=np.uint16).reshape(height, width)
+        if frame_type == FRAME_KEY:
+            depth = payload.copy()
+        else:
+            if self._previous is None:
+                raise ValueError("差分帧之前缺少关键帧")
+            depth = self._previous + payload  # uint16 回绕相加
+        self._previous = depth
+        return depth
@@ -0,0 +1,396 @@
+"""
+设备清单模块 - 在后台维护串口与相机列表，热插拔时增量更新
+
+/api/devices/* 直接返回缓存结果（附带更新时间），请求中不再探测设备：
+- 监听 /dev 下串口（ttyUSB* / ttyACM*，macOS 为 tty.usb* / cu.usb*）和相机（video*）节点的变化。
+  Linux 上安装了 pyudev 时由 udev 事件唤醒，否则每 poll_interval 秒扫描一次 /dev（一次 scandir）
+- 串口列表直接由节点集合得到；只有新出现或被重新创建（inode 变化）的相机节点才用 OpenCV 探测，
+  多个新节点并行探测（见 DeviceScanner.probe_opencv_cameras），探测不会拖慢串口变化的检测；
+  相机节点有变化时重新枚举 RealSense
+- 非 Linux 平台上相机不以设备节点出现，启动时和 refresh() 时完整扫描
+
+热插拔事件通过 subscribe() 投递到事件循环中的 asyncio.Queue（见 /ws/devices）：
+{"type": "device_added" | "device_removed", "data": {"kind": "port" | "camera", "device": ..., "timestamp": ...}}
+identify_port() 基于这些事件识别用户拔出（或插入）的串口，端口一变化就返回。
+"""
+import os
+import time
+import asyncio
+import logging
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from device_scanner import DeviceScanner, natural_key
+
+logger = logging.getLogger(__name__)
+
+DEV_DIR = "/dev"
+CAMERA_NODE_PREFIX = "video"
+UDEV_RESCAN_INTERVAL = 5.0  # 使用 udev 事件时的兜底扫描间隔（秒）
+UDEV_SETTLE_TIME = 0.1  # 收到事件后等待同一批事件结束的时间（秒）
+SUBSCRIBER_QUEUE_SIZE = 64
+IDENTIFY_CHECK_INTERVAL = 0.5  # 识别端口时检查客户端是否已断开的间隔（秒）
+
+NodeId = tuple[int, int]  # (st_ino, st_rdev)：同名节点被重新创建时会变化
+
+
+def _offer(queue: asyncio.Queue, events: list[dict[str, Any]]):
+    """在事件循环线程中一次投递一批事件，队列已满时丢弃（客户端可重新获取完整列表）"""
+    for event in events:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return
+
+
+class DeviceInventory:
+    """串口与相机清单（后台线程维护）"""
+
+    def __init__(self, poll_interval: float = 1.0):
+        """
+        Args:
+            poll_interval: 没有 udev 事件源时扫描 /dev 的间隔（秒）
+        """
+        self.poll_interval = poll_interval
+        self.watcher = "poll"  # poll / udev
+        self.is_linux = platform.system() == "Linux"
+
+        self.ports_updated_at: Optional[float] = None  # time.time()
+        self.cameras_updated_at: Optional[float] = None
+        self.scans = 0  # 节点扫描次数
+        self.probes = 0  # 单个相机探测次数
+
+        self._ports: dict[str, Optional[NodeId]] = {}  # 包含 macOS 的 cu.* 设备
+        self._camera_nodes: dict[str, NodeId] = {}
+        self._opencv: dict[str, Optional[dict[str, Any]]] = {}  # 节点 → 探测结果（None 表示不是可用相机）
+        self._realsense: list[dict[str, Any]] = []
+        self._other_cameras: list[dict[str, Any]] = []  # 非 Linux 平台的完整扫描结果
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._probe_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="device-probe")
+        self._subscribers: list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+
+    # ==================== 生命周期 ====================
+
+    def start(self):
+        """启动后台监听线程（首次扫描在线程中进行）"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device-inventory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听线程"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self._probe_pool.shutdown(wait=False, cancel_futures=True)
+
+    def wait_ready(self, timeout: float = 10.0) -> bool:
+        """等待首次串口扫描完成"""
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        monitor = self._open_udev_monitor()
+        try:
+            self._rescan()
+        except Exception as e:
+            logger.error(f"扫描设备时出错: {e}")
+        self._ready.set()
+        if not self.is_linux:
+            self._probe_pool.submit(self._scan_other_cameras)
+
+        while not self._stop.is_set():
+            if monitor is not None:
+                # 有事件时稍等同一批事件（tty 与 video 节点常常一起出现）结束再扫描
+                if monitor.poll(timeout=UDEV_RESCAN_INTERVAL) is not None:
+                    while monitor.poll(timeout=UDEV_SETTLE_TIME) is not None:
+                        pass
+            elif self._stop.wait(self.poll_interval):
+                break
+            try:
+                self._rescan()
+            except Exception as e:
+                logger.error(f"扫描设备时出错: {e}")
+
+    def _open_udev_monitor(self):
+        """Linux 上安装了 pyudev 时返回 udev 事件监听器，否则返回 None（使用轮询）"""
+        if not self.is_linux:
+            return None
+        try:
+            import pyudev
+        except ImportError:
+            logger.info(f"pyudev 未安装，每 {self.poll_interval}s 扫描一次 /dev")
+            return None
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            monitor.filter_by("video4linux")
+            monitor.start()
+            self.watcher = "udev"
+            logger.info("使用 udev 事件监听设备热插拔")
+            return monitor
+        except Exception as e:
+            logger.warning(f"无法监听 udev 事件，改为轮询: {e}")
+            return None
+
+    # ==================== 扫描 ====================
+
+    def _scan_nodes(self) -> tuple[dict[str, Optional[NodeId]], dict[str, NodeId]]:
+        """扫描串口与相机设备节点"""
+        ports: dict[str, Optional[NodeId]] = {}
+        cameras: dict[str, NodeId] = {}
+
+        if platform.system() == "Windows":
+            from serial.tools import list_ports
+            return {port.device: None for port in list_ports.comports()}, cameras
+
+        port_prefixes = DeviceScanner.port_name_prefixes(include_cu=True)
+        with os.scandir(DEV_DIR) as entries:
+            for entry in entries:
+                is_port = entry.name.startswith(port_prefixes)
+                is_camera = self.is_linux and entry.name.startswith(CAMERA_NODE_PREFIX)
+                if not (is_port or is_camera):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # 扫描过程中被移除
+                node_id = (stat.st_ino, stat.st_rdev)
+                if is_port:
+                    ports[entry.path] = node_id
+                else:
+                    cameras[entry.path] = node_id
+        return ports, cameras
+
+    def _rescan(self):
+        """扫描节点并与上次结果比较，串口变化立即生效，新相机节点交给探测线程"""
+        ports, camera_nodes = self._scan_nodes()
+        now = time.time()
+        events = []
+
+        with self._lock:
+            self.scans += 1
+            old_ports, self._ports = self._ports, ports
+            old_cameras, self._camera_nodes = self._camera_nodes, camera_nodes
+
+            # 同名节点被重新创建（快速拔插）视为先移除再添加
+            for port in sorted(old_ports, key=natural_key):
+                if ports.get(port, -1) != old_ports[port]:
+                    events.append(self._event("device_removed", "port", port, now))
+            for port in sorted(ports, key=natural_key):
+                if old_ports.get(port, -1) != ports[port]:
+                    events.append(self._event("device_added", "port", port, now))
+            if events or self.ports_updated_at is None:
+                self.ports_updated_at = now
+
+            changed = [node for node in camera_nodes if old_cameras.get(node) != camera_nodes[node]]
+            removed = [node for node in old_cameras if camera_nodes.get(node) != old_cameras[node]]
+            for node in removed:
+                info = self._opencv.pop(node, None)
+                if info is not None:
+                    events.append(self._event("device_removed", "camera", info, now))
+            if removed and not changed:
+                self.cameras_updated_at = now
+
+        self._publish(events)
+
+        if changed:
+            nodes = {node: camera_nodes[node] for node in sorted(changed, key=natural_key)}
+            self._probe_pool.submit(self._probe_nodes, nodes)
+            self._probe_pool.submit(self._scan_realsense)
+        elif removed:
+            self._probe_pool.submit(self._scan_realsense)
+        elif self.is_linux and self.cameras_updated_at is None and not camera_nodes:
+            self.cameras_updated_at = now  # 没有相机节点
+
+    def _probe_nodes(self, nodes: dict[str, NodeId]):
+        """并行探测新的相机节点，每个节点探测完成即更新清单（探测线程）"""
+        if self._stop.is_set():
+            return
+        with self._lock:
+            # 探测前已被移除或重新创建的节点由之后的任务处理
+            targets = [node for node, node_id in nodes.items() if self._camera_nodes.get(node) == node_id]
+
+        for node, info in DeviceScanner.probe_opencv_cameras(targets):
+            now = time.time()
+            with self._lock:
+                self.probes += 1
+                if self._camera_nodes.get(node) != nodes[node]:
+                    continue
+                self._opencv[node] = info
+                self.cameras_updated_at = now
+            if info is not None:
+                logger.info(f"检测到相机: {node}")
+                self._publish([self._event("device_added", "camera", info, now)])
+
+    def _scan_realsense(self):
+        """重新枚举 RealSense 相机并与上次结果比较（探测线程）"""
+        if self._stop.is_set():
+            return
+        cameras = DeviceScanner.find_realsense_cameras()
+        self._replace_cameras("_realsense", cameras)
+
+    def _scan_other_cameras(self):
+        """非 Linux 平台：完整扫描相机（探测线程）"""
+        if self._stop.is_set():
+            return
+        cameras = DeviceScanner.find_all_cameras()
+        self._replace_cameras("_other_cameras", cameras)
+
+    def _replace_cameras(self, attr: str, cameras: list[dict[str, Any]]):
+        now = time.time()
+        with self._lock:
+            old = {camera["id"]: camera for camera in getattr(self, attr)}
+            new = {camera["id"]: camera for camera in cameras}
+            setattr(self, attr, cameras)
+            self.cameras_updated_at = now
+        events = [self._event("device_removed", "camera", old[cid], now) for cid in old if cid not in new]
+        events += [self._event("device_added", "camera", new[cid], now) for cid in new if cid not in old]
+        self._publish(events)
+
+    def refresh(self, cameras: bool = True):
+        """
+        立即重新扫描（阻塞，供 ?refresh=true 使用）
+
+        Args:
+            cameras: 是否丢弃已缓存的相机探测结果并重新探测所有相机
+        """
+        if cameras:
+            now = time.time()
+            with self._lock:
+                # 清空节点记录后，下次扫描会把所有相机节点当作新节点探测
+                events = [
+                    self._event("device_removed", "camera", info, now)
+                    for info in self._opencv.values() if info is not None
+                ]
+                self._opencv.clear()
+                self._camera_nodes = {}
+            self._publish(events)
+        self._rescan()
+        if cameras:
+            if not self.is_linux:
+                self._probe_pool.submit(self._scan_other_cameras)
+            # 等待探测线程处理完本次提交的任务
+            self._probe_pool.submit(lambda: None).result()
+
+    # ==================== 查询 ====================
+
+    def get_ports(self, include_cu: bool = False) -> list[str]:
+        """缓存的串口列表（macOS 默认只返回 tty.* 设备，与 DeviceScanner.find_available_ports 一致）"""
+        with self._lock:
+            ports = list(self._ports)
+        if not include_cu:
+            ports = [port for port in ports if "/cu." not in port]
+        return sorted(ports, key=natural_key)
+
+    def get_cameras(self) -> list[dict[str, Any]]:
+        """缓存的相机列表（OpenCV + RealSense）"""
+        with self._lock:
+            opencv = [self._opencv[node] for node in sorted(self._opencv, key=natural_key)]
+            return [info for info in opencv if info is not None] + self._realsense + self._other_cameras
+
+    def get_status(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "watcher": self.watcher,
+                "ports_updated_at": self.ports_updated_at,
+                "cameras_updated_at": self.cameras_updated_at,
+                "scans": self.scans,
+                "probes": self.probes,
+                "probing": any(node not in self._opencv for node in self._camera_nodes),
+            }
+
+    # ==================== 事件订阅 ====================
+
+    def subscribe(self) -> asyncio.Queue:
+        """在事件循环中订阅热插拔事件"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = [(loop, q) for loop, q in self._subscribers if q is not queue]
+
+    async def identify_port(
+        self,
+        timeout: float = 30.0,
+        mode: str = "disconnect",
+        cancelled: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> dict[str, Any]:
+        """
+        等待用户拔出（或插入）一个 USB 串口并返回该端口
+
+        订阅热插拔事件，第一个匹配的端口事件到达时，连同同一次扫描产生的其他端口事件一起交给
+        DeviceScanner.identify_port 判断（macOS 的 tty/cu 成对设备归并为 tty）。
+
+        Args:
+            timeout: 最长等待时间（秒）
+            mode: disconnect（识别被拔出的端口）/ connect（识别新插入的端口）
+            cancelled: 返回 True 时提前结束等待（如客户端已断开）
+
+        Returns:
+            {"status": "success", "port": ...}、{"status": "timeout", ...} 或 {"status": "error", ...}
+        """
+        if mode not in ("disconnect", "connect"):
+            return {"status": "error", "message": f"未知的检测模式: {mode}"}
+        wanted = "device_removed" if mode == "disconnect" else "device_added"
+
+        loop = asyncio.get_running_loop()
+        queue = self.subscribe()
+        try:
+            await asyncio.to_thread(self.wait_ready, 5.0)
+            deadline = loop.time() + timeout
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    action = "拔出" if mode == "disconnect" else "插入"
+                    return {"status": "timeout", "message": f"{timeout:.0f} 秒内未检测到 USB 设备{action}"}
+                try:
+                    event = await asyncio.wait_for(queue.get(), min(remaining, IDENTIFY_CHECK_INTERVAL))
+                except asyncio.TimeoutError:
+                    if cancelled and await cancelled():
+                        return {"status": "error", "message": "检测已取消"}
+                    continue
+                if event["type"] != wanted or event["data"]["kind"] != "port":
+                    continue
+
+                # 同一次扫描的事件是连续投递的，此时已全部在队列中
+                ports = [event["data"]["device"]]
+                while not queue.empty():
+                    other = queue.get_nowait()
+                    if other["type"] == wanted and other["data"]["kind"] == "port":
+                        ports.append(other["data"]["device"])
+                logger.info(f"检测到端口{'断开' if mode == 'disconnect' else '接入'}: {ports}")
+                return DeviceScanner.identify_port(ports)
+        finally:
+            self.unsubscribe(queue)
+
+    @staticmethod
+    def _event(event_type: str, kind: str, device: Any, timestamp: float) -> dict[str, Any]:
+        return {"type": event_type, "data": {"kind": kind, "device": device, "timestamp": timestamp}}
+
+    def _publish(self, events: list[dict[str, Any]]):
+        if not events:
+            return
+        for event in events:
+            data = event["data"]
+            name = data["device"] if data["kind"] == "port" else data["device"].get("id")
+            logger.info(f"设备{'接入' if event['type'] == 'device_added' else '移除'}: {name}")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            # 同一次扫描的事件在一个回调中投递，订阅者收到第一个事件时其余事件已在队列中
+            try:
+                loop.call_soon_threadsafe(_offer, queue, events)
+            except RuntimeError:
+                pass  # 事件循环已关闭
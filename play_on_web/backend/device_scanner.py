@@ -1,19 +1,121 @@
 """
 设备扫描模块 - 扫描串口和相机设备
+
+相机探测在多个线程中并行进行（每个设备单独计时），总耗时接近最慢的单个设备而不是所有设备之和；
+卡住的设备超时后被跳过，不影响其他设备的结果。
 """
+import re
 import sys
+import queue
 import platform
+import threading
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
 import logging
 
 logger = logging.getLogger(__name__)
 
+CAMERA_PROBE_TIMEOUT = 5.0  # 单个相机探测的最长等待时间（秒）
+CAMERA_PROBE_WORKERS = 8  # 同时探测的设备数
+CAMERA_ENUMERATE_TIMEOUT = 20.0  # 一次枚举多个设备的任务（RealSense、按索引枚举）的最长等待时间（秒）
+
+
+def natural_key(name: str) -> tuple:
+    """按数字大小排序设备名（video2 在 video10 之前）"""
+    return tuple(int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name))
+
+
+def run_parallel(
+    tasks: list[tuple[Any, Callable, tuple]],
+    timeout: float = CAMERA_PROBE_TIMEOUT,
+    max_workers: int = CAMERA_PROBE_WORKERS,
+    task_timeouts: dict[Any, float] | None = None,
+) -> Iterator[tuple[Any, Any]]:
+    """
+    并行执行任务，按完成顺序产出 (标签, 结果)
+
+    每个任务从开始执行起计时，超时的任务产出 (标签, TimeoutError)，出错的任务产出
+    (标签, 异常)。任务在守护线程中执行（最多 max_workers 个同时运行），卡住的设备打开调用
+    无法中断：超时后它占用的名额立即让给排队的任务，卡住的线程之后即使返回也不再归还名额，
+    因此不会阻塞其他任务、调用方或进程退出。
+
+    Args:
+        tasks: [(标签, 函数, 参数元组)]
+        timeout: 每个任务的默认超时（秒）
+        task_timeouts: 个别任务的超时（标签 → 秒）
+    """
+    task_timeouts = task_timeouts or {}
+    if not tasks:
+        return
+
+    results: queue.Queue = queue.Queue()
+    slots = threading.Semaphore(max(1, max_workers))
+    state_lock = threading.Lock()
+    started: dict[Any, float] = {}
+    finished: set = set()
+    timed_out: set = set()
+
+    def worker(label, func, args):
+        slots.acquire()
+        with state_lock:
+            started[label] = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as e:
+            result = e
+        with state_lock:
+            finished.add(label)
+            # 已超时的任务的名额已经让出
+            if label not in timed_out:
+                slots.release()
+        results.put((label, result))
+
+    for label, func, args in tasks:
+        threading.Thread(target=worker, args=(label, func, args), name=f"probe-{label}", daemon=True).start()
+
+    pending = {label for label, _, _ in tasks}
+    while pending:
+        # 等到最早开始的未完成任务超时为止（尚未开始的任务不计时）
+        now = time.monotonic()
+        with state_lock:
+            deadlines = {
+                label: started[label] + task_timeouts.get(label, timeout) for label in pending if label in started
+            }
+        wait = min(deadlines.values()) - now if deadlines else timeout
+        try:
+            label, result = results.get(timeout=max(0.0, wait))
+        except queue.Empty:
+            now = time.monotonic()
+            for label, deadline in deadlines.items():
+                if now < deadline:
+                    continue
+                with state_lock:
+                    if label in finished:
+                        continue  # 刚好完成，结果已在队列中
+                    timed_out.add(label)
+                    slots.release()
+                pending.discard(label)
+                yield label, TimeoutError(f"{label} 超过 {task_timeouts.get(label, timeout)}s 未响应")
+            continue
+        if label in pending:
+            pending.discard(label)
+            yield label, result
+
 
 class DeviceScanner:
     """设备扫描器"""
     
+    @staticmethod
+    def port_name_prefixes(include_cu: bool = False) -> tuple[str, ...]:
+        """/dev 下串口设备名的前缀（Windows 的 COM 端口不在 /dev 中，返回空）"""
+        system = platform.system()
+        if system == "Windows":
+            return ()
+        if system == "Darwin":
+            return ("tty.usb", "cu.usb") if include_cu else ("tty.usb",)
+        return ("ttyUSB", "ttyACM")
+
     @staticmethod
     def find_available_ports(include_cu: bool = False) -> list[str]:
         """
@@ -36,23 +138,11 @@ class DeviceScanner:
             if platform.system() == "Windows":
                 # Windows: 使用 pyserial 扫描 COM 端口
                 ports = [port.device for port in list_ports.comports()]
-            elif platform.system() == "Darwin":  # macOS
-                # macOS: 扫描 USB 串口设备
-                usb_ports = []
-                
-                # 总是包含 tty.usb* 设备（推荐使用）
-                usb_ports.extend(Path("/dev").glob("tty.usb*"))
-                
-                # 可选包含 cu.usb* 设备
-                if include_cu:
-                    usb_ports.extend(Path("/dev").glob("cu.usb*"))
-                
-                ports = sorted([str(path) for path in usb_ports])
-            else:  # Linux
-                # Linux: 扫描 ttyUSB* 和 ttyACM* 设备
+            else:
+                # macOS: tty.usb*（推荐使用）及可选的 cu.usb*；Linux: ttyUSB* 和 ttyACM*
                 usb_ports = []
-                usb_ports.extend(Path("/dev").glob("ttyUSB*"))
-                usb_ports.extend(Path("/dev").glob("ttyACM*"))
+                for prefix in DeviceScanner.port_name_prefixes(include_cu):
+                    usb_ports.extend(Path("/dev").glob(f"{prefix}*"))
                 ports = sorted([str(path) for path in usb_ports])
             
             logger.info(f"找到 {len(ports)} 个串口: {ports}")
@@ -122,43 +212,7 @@ class DeviceScanner:
                     "message": f"未检测到端口变化。断开前: {len(ports_before)} 个，断开后: {len(ports_after)} 个"
                 }
             
-            # 在 macOS 上，处理 tty 和 cu 设备对
-            # 如果检测到成对的 tty/cu 设备，只返回 tty 设备
-            if platform.system() == "Darwin" and len(ports_diff) == 2:
-                # 检查是否是成对的 tty/cu 设备
-                tty_ports = [p for p in ports_diff if '/tty.' in p]
-                cu_ports = [p for p in ports_diff if '/cu.' in p]
-                
-                if len(tty_ports) == 1 and len(cu_ports) == 1:
-                    # 提取设备名称（去掉 tty. 或 cu. 前缀）
-                    tty_name = tty_ports[0].split('/tty.')[1]
-                    cu_name = cu_ports[0].split('/cu.')[1]
-                    
-                    if tty_name == cu_name:
-                        # 确认是同一个物理设备，返回 tty 版本
-                        port = tty_ports[0]
-                        logger.info(f"检测到成对的 tty/cu 设备，使用: {port}")
-                        return {
-                            "status": "success",
-                            "message": f"成功识别端口: {port}",
-                            "port": port
-                        }
-            
-            # 其他情况
-            if len(ports_diff) == 1:
-                port = ports_diff[0]
-                logger.info(f"成功识别端口: {port}")
-                return {
-                    "status": "success",
-                    "message": f"成功识别端口: {port}",
-                    "port": port
-                }
-            else:
-                logger.warning(f"检测到多个端口变化: {ports_diff}")
-                return {
-                    "status": "error",
-                    "message": f"检测到多个端口变化: {ports_diff}。请只拔出一个 USB 设备。"
-                }
+            return DeviceScanner.identify_port(ports_diff)
         except Exception as e:
             logger.error(f"识别端口时出错: {e}")
             return {
@@ -167,11 +221,84 @@ class DeviceScanner:
             }
     
     @staticmethod
-    def find_opencv_cameras() -> list[dict[str, Any]]:
+    def identify_port(changed_ports: list[str]) -> dict[str, Any]:
+        """
+        根据发生变化（消失或出现）的端口确定唯一的物理端口
+
+        在 macOS 上，每个 USB 串口同时有 /dev/tty.* 和 /dev/cu.* 两个设备文件，指向同一个物理设备，
+        拔出时两者都会消失。这里把 cu.* 归并到对应的 tty.*（推荐使用），只看到其中一个时也能识别。
+
+        Returns:
+            {"status": "success", "port": ...} 或 {"status": "error", "message": ...}
+        """
+        ports = []
+        for port in changed_ports:
+            if platform.system() == "Darwin" and "/cu." in port:
+                port = port.replace("/cu.", "/tty.", 1)
+                logger.info(f"检测到 cu 设备，使用对应的 tty 设备: {port}")
+            if port not in ports:
+                ports.append(port)
+
+        if len(ports) == 1:
+            port = ports[0]
+            logger.info(f"成功识别端口: {port}")
+            return {
+                "status": "success",
+                "message": f"成功识别端口: {port}",
+                "port": port
+            }
+        if not ports:
+            return {"status": "error", "message": "未检测到端口变化"}
+
+        logger.warning(f"检测到多个端口变化: {ports}")
+        return {
+            "status": "error",
+            "message": f"检测到多个端口变化: {ports}。请只拔出一个 USB 设备。"
+        }
+
+    @staticmethod
+    def opencv_camera_nodes() -> list[str]:
+        """Linux 上的 /dev/video* 节点（按编号排序），其他平台返回空列表"""
+        if platform.system() != "Linux":
+            return []
+        return sorted((str(path) for path in Path("/dev").glob("video*")), key=natural_key)
+
+    @staticmethod
+    def probe_opencv_cameras(targets: list[str], timeout: float = CAMERA_PROBE_TIMEOUT) -> Iterator[tuple[str, dict[str, Any] | None]]:
+        """
+        并行探测多个 OpenCV 相机，按完成顺序产出 (设备, 信息)
+
+        无法打开、出错或超时的设备信息为 None。
+        """
+        tasks = [(target, DeviceScanner.probe_opencv_camera, (target,)) for target in targets]
+        for target, result in run_parallel(tasks, timeout=timeout):
+            if isinstance(result, Exception):
+                logger.warning(f"探测相机 {target} 失败: {result}")
+                result = None
+            yield target, result
+
+    @staticmethod
+    def find_opencv_cameras(timeout: float = CAMERA_PROBE_TIMEOUT) -> list[dict[str, Any]]:
         """
         查找所有 OpenCV 相机
         参考：lerobot_find_cameras.py
+
+        Linux 上并行探测每个 /dev/video* 节点；其他平台按索引枚举，使用 lerobot 的 find_cameras。
         """
+        if platform.system() != "Linux":
+            return DeviceScanner._find_opencv_cameras_by_index()
+
+        all_cameras = [
+            info for _, info in DeviceScanner.probe_opencv_cameras(DeviceScanner.opencv_camera_nodes(), timeout)
+            if info is not None
+        ]
+        all_cameras.sort(key=lambda camera: natural_key(camera["id"]))
+        logger.info(f"找到 {len(all_cameras)} 个 OpenCV 相机")
+        return all_cameras
+
+    @staticmethod
+    def _find_opencv_cameras_by_index() -> list[dict[str, Any]]:
+        """按索引枚举 OpenCV 相机（macOS / Windows）"""
         all_cameras = []
         
         try:
@@ -199,6 +326,37 @@ class DeviceScanner:
         
         return all_cameras
     
+    @staticmethod
+    def probe_opencv_camera(target: str | int) -> dict[str, Any] | None:
+        """
+        探测单个 OpenCV 相机（设备路径或索引），无法打开时返回 None
+
+        返回格式与 find_opencv_cameras 相同，用于只探测新出现的设备。
+        """
+        try:
+            import cv2
+        except ImportError as e:
+            logger.warning(f"无法导入 OpenCV: {e}")
+            return None
+
+        cap = cv2.VideoCapture(target)
+        try:
+            if not cap.isOpened():
+                return None
+            return {
+                "type": "opencv",
+                "id": target,
+                "name": f"OpenCV Camera @ {target}",
+                "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                "fps": cap.get(cv2.CAP_PROP_FPS),
+            }
+        except Exception as e:
+            logger.error(f"探测相机 {target} 时出错: {e}")
+            return None
+        finally:
+            cap.release()
+
     @staticmethod
     def find_realsense_cameras() -> list[dict[str, Any]]:
         """
@@ -240,12 +398,35 @@ class DeviceScanner:
         return all_cameras
     
     @staticmethod
-    def find_all_cameras() -> list[dict[str, Any]]:
+    def iter_cameras(timeout: float = CAMERA_PROBE_TIMEOUT) -> Iterator[dict[str, Any]]:
         """
-        查找所有相机（OpenCV + RealSense）
+        并行查找所有相机，按完成顺序逐个产出（OpenCV 每个设备节点一个任务，RealSense 枚举一个任务）
         """
-        all_cameras = []
-        all_cameras.extend(DeviceScanner.find_opencv_cameras())
-        all_cameras.extend(DeviceScanner.find_realsense_cameras())
-        return all_cameras
+        tasks: list[tuple[Any, Callable, tuple]] = [
+            (node, DeviceScanner.probe_opencv_camera, (node,)) for node in DeviceScanner.opencv_camera_nodes()
+        ]
+        if platform.system() != "Linux":
+            tasks.append(("opencv", DeviceScanner._find_opencv_cameras_by_index, ()))
+        tasks.append(("realsense", DeviceScanner.find_realsense_cameras, ()))
 
+        # 按索引枚举与 RealSense 枚举各自包含多个设备，给予更长的等待时间
+        enumerate_timeouts = {"opencv": CAMERA_ENUMERATE_TIMEOUT, "realsense": CAMERA_ENUMERATE_TIMEOUT}
+        for label, result in run_parallel(tasks, timeout=timeout, task_timeouts=enumerate_timeouts):
+            if isinstance(result, Exception):
+                logger.warning(f"探测相机 {label} 失败: {result}")
+            elif isinstance(result, list):
+                yield from result
+            elif result is not None:
+                yield result
+
+    @staticmethod
+    def find_all_cameras(timeout: float = CAMERA_PROBE_TIMEOUT) -> list[dict[str, Any]]:
+        """
+        查找所有相机（OpenCV + RealSense，并行探测）
+
+        超时的设备被跳过，返回其余设备的结果。
+        """
+        all_cameras = list(DeviceScanner.iter_cameras(timeout))
+        all_cameras.sort(key=lambda camera: (camera["type"], natural_key(str(camera["id"]))))
+        logger.info(f"共找到 {len(all_cameras)} 个相机")
+        return all_cameras
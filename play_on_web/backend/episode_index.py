@@ -0,0 +1,244 @@
+"""
+回合索引模块 - 用 SQLite 记录每个回合的摘要，支持按条件快速筛选和分页
+
+回合结束（机器人与相机录制都停止）后写入一行摘要：机器人、操作员、任务、
+键位预设、开始 / 结束时间、时长、帧数、各关节范围、相机及各相机帧数。
+常用筛选字段均有索引，按开始时间分页列出数万个回合只需毫秒级。
+
+数据库位于录制目录下（index.sqlite3），可随时用 rebuild() 从各回合的
+meta.json 和 cameras/*.json 重建。
+"""
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    episode_id     TEXT PRIMARY KEY,
+    path           TEXT NOT NULL,
+    robot_id       TEXT,
+    operator       TEXT,
+    task           TEXT,
+    keymap_profile TEXT,
+    started_at     TEXT,
+    ended_at       TEXT,
+    duration       REAL,
+    num_frames     INTEGER,
+    dropped        INTEGER,
+    cameras        TEXT,
+    camera_frames  INTEGER,
+    summary        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_started_at ON episodes(started_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_robot ON episodes(robot_id, started_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_operator ON episodes(operator, started_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_keymap ON episodes(keymap_profile, started_at);
+CREATE INDEX IF NOT EXISTS idx_episodes_duration ON episodes(duration);
+"""
+
+# 列表接口返回的列（summary 只在详情中返回）
+_LIST_COLUMNS = [
+    "episode_id", "robot_id", "operator", "task", "keymap_profile",
+    "started_at", "ended_at", "duration", "num_frames", "dropped", "cameras", "camera_frames",
+]
+
+
+class EpisodeIndex:
+    """回合索引（SQLite）"""
+
+    def __init__(self, recordings_dir: Path):
+        """
+        打开（必要时创建）索引
+
+        Args:
+            recordings_dir: 回合录制根目录，数据库文件位于其中
+        """
+        self.recordings_dir = Path(recordings_dir).expanduser()
+        self.recordings_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.recordings_dir / INDEX_FILENAME
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ==================== 写入 ====================
+
+    @staticmethod
+    def summarize(episode_dir: Path) -> Optional[dict[str, Any]]:
+        """
+        从回合目录读取摘要（meta.json + cameras/*.json）
+
+        Returns:
+            摘要字典；回合未结束（没有 ended_at）时返回 None
+        """
+        meta_path = episode_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if "ended_at" not in meta:
+            return None
+
+        cameras = {}
+        camera_dir = episode_dir / "cameras"
+        if camera_dir.exists():
+            for path in sorted(camera_dir.glob("*.json")):
+                stats = json.loads(path.read_text(encoding="utf-8"))
+                cameras[stats.get("camera", path.stem)] = {
+                    key: stats.get(key)
+                    for key in ["width", "height", "frames_written", "frames_missed",
+                                "frames_dropped", "achieved_fps"]
+                }
+
+        return {
+            "episode_id": meta.get("episode_id", episode_dir.name),
+            "path": str(episode_dir),
+            "robot_id": meta.get("robot_id"),
+            "operator": meta.get("operator"),
+            "task": meta.get("task"),
+            "keymap_profile": meta.get("keymap_profile"),
+            "started_at": meta.get("started_at"),
+            "ended_at": meta.get("ended_at"),
+            "duration": meta.get("duration"),
+            "num_frames": meta.get("num_frames"),
+            "dropped": meta.get("dropped"),
+            "cameras": sorted(cameras),
+            "camera_frames": sum(c["frames_written"] or 0 for c in cameras.values()),
+            "summary": {
+                "joint_ranges": meta.get("joint_ranges", {}),
+                "cameras": cameras,
+                "step_levels": meta.get("step_levels"),
+                "input_vocab": meta.get("input_vocab", {}),
+            },
+        }
+
+    def add_episode(self, episode_dir: Path) -> Optional[dict[str, Any]]:
+        """写入（或更新）一个已结束回合的摘要"""
+        row = self.summarize(Path(episode_dir))
+        if row is None:
+            return None
+        self._upsert([row])
+        return row
+
+    def _upsert(self, rows: list[dict[str, Any]]):
+        columns = ["episode_id", "path"] + _LIST_COLUMNS[1:] + ["summary"]
+        placeholders = ", ".join("?" for _ in columns)
+        values = [
+            [
+                json.dumps(row[c], ensure_ascii=False) if c in ["cameras", "summary"] else row[c]
+                for c in columns
+            ]
+            for row in rows
+        ]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO episodes ({', '.join(columns)}) VALUES ({placeholders})", values
+            )
+            self._conn.commit()
+
+    def remove_episode(self, episode_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM episodes WHERE episode_id = ?", (episode_id,))
+            self._conn.commit()
+
+    def rebuild(self) -> int:
+        """扫描录制目录重建索引（删除已不存在的回合），返回回合数"""
+        rows = []
+        for episode_dir in sorted(self.recordings_dir.iterdir()):
+            if not episode_dir.is_dir():
+                continue
+            try:
+                row = self.summarize(episode_dir)
+            except Exception as e:
+                logger.warning(f"读取回合 {episode_dir.name} 摘要失败: {e}")
+                continue
+            if row:
+                rows.append(row)
+
+        with self._lock:
+            self._conn.execute("DELETE FROM episodes")
+            self._conn.commit()
+        self._upsert(rows)
+        logger.info(f"回合索引已重建: {len(rows)} 个回合")
+        return len(rows)
+
+    # ==================== 查询 ====================
+
+    def list_episodes(self, robot_id: Optional[str] = None, operator: Optional[str] = None,
+                      task: Optional[str] = None, keymap_profile: Optional[str] = None,
+                      min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      limit: int = 50, offset: int = 0, descending: bool = True) -> dict[str, Any]:
+        """
+        按条件分页列出回合（按开始时间排序）
+
+        Args:
+            since / until: ISO 格式时间（或日期前缀，如 "2025-01-31"）
+            limit / offset: 分页参数
+
+        Returns:
+            {"total": 满足条件的总数, "episodes": [...]}
+        """
+        conditions, params = [], []
+        for column, value in [("robot_id", robot_id), ("operator", operator),
+                              ("task", task), ("keymap_profile", keymap_profile)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_duration is not None:
+            conditions.append("duration >= ?")
+            params.append(min_duration)
+        if max_duration is not None:
+            conditions.append("duration <= ?")
+            params.append(max_duration)
+        if since is not None:
+            conditions.append("started_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("started_at < ?")
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "DESC" if descending else "ASC"
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM episodes {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_LIST_COLUMNS)} FROM episodes {where} "
+                f"ORDER BY started_at {order} LIMIT ? OFFSET ?",
+                params + [max(1, min(limit, 1000)), max(0, offset)],
+            ).fetchall()
+
+        episodes = []
+        for row in rows:
+            episode = dict(row)
+            episode["cameras"] = json.loads(episode["cameras"] or "[]")
+            episodes.append(episode)
+        return {"total": total, "limit": limit, "offset": offset, "episodes": episodes}
+
+    def get_episode(self, episode_id: str) -> Optional[dict[str, Any]]:
+        """获取单个回合的完整摘要"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM episodes WHERE episode_id = ?", (episode_id,)).fetchone()
+        if row is None:
+            return None
+        episode = dict(row)
+        episode["cameras"] = json.loads(episode["cameras"] or "[]")
+        episode["summary"] = json.loads(episode["summary"] or "{}")
+        return episode
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
@@ -0,0 +1,345 @@
+"""
+回合录制模块 - 按控制周期记录观测值、该周期下发的动作及触发它的遥操作输入
+
+控制路径只把一行数据写入预分配的 NumPy 环形缓冲（几微秒，无内存分配），
+后台写入线程按块把缓冲追加到每个回合目录下的列式 .npy 文件中：
+
+    <recordings_dir>/<episode_id>/
+        meta.json          # 字段名、输入词表、时长等元数据
+        timestamp.npy      # float64 (N,)        time.monotonic() 秒
+        observation.npy    # float32 (N, 观测维度)
+        action.npy         # float32 (N, 动作维度)，该周期未下发的字段为 NaN
+        input_id.npy       # int16   (N,)        遥操作输入在词表中的编号，0 表示无
+        input_value.npy    # float32 (N,)
+
+.npy 文件预留定长文件头，每次刷盘后回填行数，因此录制中途崩溃也能直接
+np.load(..., mmap_mode="r") 读取已写入的部分。缓冲容量固定，长时间录制内存不增长；
+写入线程跟不上时丢弃新行并计数，绝不阻塞控制路径。
+"""
+import json
+import time
+import uuid
+import struct
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 底盘速度动作字段
+BASE_ACTION_KEYS = ["x.vel", "y.vel", "theta.vel"]
+
+
+class NpyColumnWriter:
+    """可追加写入的 .npy 列文件：预留定长文件头，追加后回填实际行数"""
+
+    HEADER_SIZE = 128
+    MAGIC = b"\x93NUMPY\x01\x00"
+
+    def __init__(self, path: Path, dtype: Any, row_shape: tuple[int, ...] = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self.rows, *self.row_shape),
+        }
+        body = repr(header).encode("latin1")
+        padding = self.HEADER_SIZE - len(self.MAGIC) - 2 - len(body) - 1
+        self._file.seek(0)
+        self._file.write(self.MAGIC + struct.pack("<H", self.HEADER_SIZE - len(self.MAGIC) - 2))
+        self._file.write(body + b" " * padding + b"\n")
+
+    def append(self, rows: np.ndarray):
+        """追加若干行并回填文件头"""
+        self._file.seek(0, 2)
+        self._file.write(np.ascontiguousarray(rows, dtype=self.dtype).tobytes())
+        self.rows += len(rows)
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        self._write_header()
+        self._file.close()
+
+
+def load_episode(episode_dir: Path, mmap: bool = True) -> dict[str, Any]:
+    """
+    读取回合数据
+
+    Args:
+        episode_dir: 回合目录
+        mmap: 是否以内存映射方式打开列文件（不预先加载到内存）
+
+    Returns:
+        {"meta": 元数据, 列名: 数组, ...}
+    """
+    episode_dir = Path(episode_dir)
+    with open(episode_dir / "meta.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    data: dict[str, Any] = {"meta": meta}
+    for column in EpisodeRecorder.COLUMNS:
+        data[column] = np.load(episode_dir / f"{column}.npy", mmap_mode="r" if mmap else None)
+    return data
+
+
+class EpisodeRecorder:
+    """回合录制器（环形缓冲 + 后台写入线程）"""
+
+    COLUMNS = ["timestamp", "observation", "action", "input_id", "input_value"]
+
+    def __init__(self, root_dir: Path, capacity: int = 4096, flush_rows: int = 256):
+        """
+        初始化录制器
+
+        Args:
+            root_dir: 回合存储根目录
+            capacity: 环形缓冲行数（写入线程最多可落后的行数）
+            flush_rows: 累积多少行唤醒一次写入线程
+        """
+        self.root_dir = Path(root_dir).expanduser()
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+
+        self.episode_id: Optional[str] = None
+        self.episode_dir: Optional[Path] = None
+        self.meta: dict[str, Any] = {}
+        self.dropped = 0
+
+        self._recording = False
+        self._lock = threading.Lock()
+        self._written = 0  # 生产者已写入的总行数
+        self._flushed = 0  # 写入线程已落盘的总行数
+        self._wakeup = threading.Event()
+        self._writer_thread: Optional[threading.Thread] = None
+        self._columns: dict[str, NpyColumnWriter] = {}
+        self._buffers: dict[str, np.ndarray] = {}
+        self._obs_index: dict[str, int] = {}
+        self._action_index: dict[str, int] = {}
+        self._input_vocab: dict[str, int] = {}
+        self._start_time = 0.0
+        self._last_time = 0.0
+        self._obs_min: Optional[np.ndarray] = None
+        self._obs_max: Optional[np.ndarray] = None
+
+    @property
+    def is_recording(self) -> bool:
+        return self._recording
+
+    def start(self, observation_keys: list[str], action_keys: list[str],
+              metadata: Optional[dict[str, Any]] = None) -> str:
+        """
+        开始录制新回合
+
+        Args:
+            observation_keys: 观测值字段（数值型）
+            action_keys: 动作字段
+            metadata: 附加元数据（机器人、操作员、键位预设等）
+
+        Returns:
+            回合 ID
+        """
+        if self._recording:
+            raise RuntimeError(f"正在录制回合 {self.episode_id}")
+
+        self.episode_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.episode_dir = self.root_dir / self.episode_id
+        self.episode_dir.mkdir(parents=True, exist_ok=True)
+
+        n_obs, n_act = len(observation_keys), len(action_keys)
+        self._obs_index = {key: i for i, key in enumerate(observation_keys)}
+        self._action_index = {key: i for i, key in enumerate(action_keys)}
+        self._input_vocab = {}
+        self._buffers = {
+            "timestamp": np.zeros(self.capacity, dtype=np.float64),
+            "observation": np.full((self.capacity, n_obs), np.nan, dtype=np.float32),
+            "action": np.full((self.capacity, n_act), np.nan, dtype=np.float32),
+            "input_id": np.zeros(self.capacity, dtype=np.int16),
+            "input_value": np.zeros(self.capacity, dtype=np.float32),
+        }
+        self._columns = {
+            "timestamp": NpyColumnWriter(self.episode_dir / "timestamp.npy", np.float64),
+            "observation": NpyColumnWriter(self.episode_dir / "observation.npy", np.float32, (n_obs,)),
+            "action": NpyColumnWriter(self.episode_dir / "action.npy", np.float32, (n_act,)),
+            "input_id": NpyColumnWriter(self.episode_dir / "input_id.npy", np.int16),
+            "input_value": NpyColumnWriter(self.episode_dir / "input_value.npy", np.float32),
+        }
+
+        self._written = 0
+        self._flushed = 0
+        self.dropped = 0
+        self._obs_min = np.full(n_obs, np.nan)
+        self._obs_max = np.full(n_obs, np.nan)
+        self._start_time = time.monotonic()
+        self._last_time = self._start_time
+        self.meta = {
+            "episode_id": self.episode_id,
+            "format": "columnar-npy",
+            "started_at": datetime.now().isoformat(),
+            "start_monotonic": self._start_time,
+            "observation_keys": list(observation_keys),
+            "action_keys": list(action_keys),
+            "input_vocab": {},
+            **(metadata or {}),
+        }
+        self._write_meta()
+
+        self._recording = True
+        self._wakeup.clear()
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name=f"episode-writer-{self.episode_id}", daemon=True
+        )
+        self._writer_thread.start()
+        logger.info(f"开始录制回合: {self.episode_id}")
+        return self.episode_id
+
+    def record(self, timestamp: float, observation: Optional[dict[str, Any]],
+               action: Optional[dict[str, Any]], teleop_input: Optional[str] = None,
+               input_value: float = 0.0):
+        """
+        记录一行（控制路径调用，不分配内存、不做 I/O）
+
+        Args:
+            timestamp: time.monotonic() 时刻
+            observation: 观测值（只记录开始时确定的数值字段）
+            action: 下发的动作字典
+            teleop_input: 触发该动作的遥操作输入标签，如 "left:x+"、"base:forward"
+            input_value: 输入的数值（如按键力度）
+        """
+        if not self._recording:
+            return
+
+        with self._lock:
+            # 在锁内再判断一次，避免与 stop() 的最后一次刷盘交错
+            if not self._recording:
+                return
+            if self._written - self._flushed >= self.capacity:
+                self.dropped += 1
+                return
+            row = self._written % self.capacity
+
+            buffers = self._buffers
+            buffers["timestamp"][row] = timestamp
+            obs_row = buffers["observation"][row]
+            obs_row.fill(np.nan)
+            if observation:
+                for key, i in self._obs_index.items():
+                    value = observation.get(key)
+                    if value is not None:
+                        obs_row[i] = value
+            act_row = buffers["action"][row]
+            act_row.fill(np.nan)
+            if action:
+                for key, value in action.items():
+                    i = self._action_index.get(key)
+                    if i is not None:
+                        act_row[i] = value
+            buffers["input_id"][row] = self._input_id(teleop_input)
+            buffers["input_value"][row] = input_value
+
+            self._written += 1
+            self._last_time = timestamp
+            pending = self._written - self._flushed
+
+        if pending >= self.flush_rows:
+            self._wakeup.set()
+
+    def _input_id(self, label: Optional[str]) -> int:
+        """遥操作输入标签 → 编号（词表按需增长，调用时持有 self._lock）"""
+        if not label:
+            return 0
+        input_id = self._input_vocab.get(label)
+        if input_id is None:
+            input_id = len(self._input_vocab) + 1
+            self._input_vocab[label] = input_id
+        return input_id
+
+    def stop(self) -> dict[str, Any]:
+        """停止录制，写完剩余数据并返回回合摘要"""
+        if not self._recording:
+            return {}
+
+        self._recording = False
+        self._wakeup.set()
+        if self._writer_thread:
+            self._writer_thread.join()
+        self._writer_thread = None
+
+        for column in self._columns.values():
+            column.close()
+        self._columns = {}
+
+        self.meta.update(self.get_status())
+        self.meta["ended_at"] = datetime.now().isoformat()
+        self.meta["joint_ranges"] = {
+            key: [float(self._obs_min[i]), float(self._obs_max[i])]
+            for key, i in self._obs_index.items()
+            if not np.isnan(self._obs_min[i])
+        }
+        self._write_meta()
+        summary = dict(self.meta)
+        self._buffers = {}
+        logger.info(f"回合 {self.episode_id} 录制结束: {summary['num_frames']} 帧，丢弃 {self.dropped} 帧")
+        return summary
+
+    def _writer_loop(self):
+        """后台写入：把环形缓冲中未落盘的行追加到列文件"""
+        while True:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"写入回合 {self.episode_id} 数据时出错: {e}")
+            if not self._recording:
+                self._flush()
+                return
+
+    def _flush(self):
+        with self._lock:
+            start, end = self._flushed, self._written
+        if end <= start:
+            return
+
+        # 按环形缓冲的回绕位置拆成至多两段
+        first, last = start % self.capacity, (end - 1) % self.capacity + 1
+        segments = [(first, last)] if first < last else [(first, self.capacity), (0, last)]
+        for name, column in self._columns.items():
+            for a, b in segments:
+                column.append(self._buffers[name][a:b])
+
+        # 顺带更新观测值的范围（fmin / fmax 忽略 NaN）
+        for a, b in segments:
+            block = self._buffers["observation"][a:b]
+            if len(block) and block.shape[1]:
+                self._obs_min = np.fmin(self._obs_min, np.fmin.reduce(block, axis=0))
+                self._obs_max = np.fmax(self._obs_max, np.fmax.reduce(block, axis=0))
+
+        with self._lock:
+            self._flushed = end
+            self.meta["input_vocab"] = dict(self._input_vocab)
+
+    def _write_meta(self):
+        with open(self.episode_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+
+    def get_status(self) -> dict[str, Any]:
+        """获取录制状态"""
+        return {
+            "recording": self._recording,
+            "episode_id": self.episode_id,
+            "num_frames": self._written,
+            "flushed_frames": self._flushed,
+            "dropped": self.dropped,
+            "duration": self._last_time - self._start_time if self.episode_id else 0.0,
+        }
@@ -0,0 +1,138 @@
+"""
+帧编码模块 - 多核 JPEG 编码池
+
+cv2.imencode 在编码期间释放 GIL，因此用线程池即可让不同相机、
+不同质量的编码任务在多个核心上并行，且帧数据无需跨进程拷贝。
+安装了 PyTurboJPEG（libjpeg-turbo 绑定）时优先使用它：
+可直接编码 RGB 图像，省去颜色转换。
+
+另提供廉价的画面变化检测：每帧缩小为 32x24 灰度签名，
+与上次发送帧的签名做平均绝对差，用于跳过静止画面。
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 变化检测签名尺寸（宽, 高）
+SIGNATURE_SIZE = (32, 24)
+
+
+def compute_signature(image: np.ndarray) -> np.ndarray:
+    """计算帧的变化检测签名（缩小后的灰度图）"""
+    small = cv2.resize(image, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    return small
+
+
+def signature_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名的平均绝对差（0-255）"""
+    return float(cv2.absdiff(a, b).mean())
+
+
+class FrameEncoder:
+    """JPEG 编码池"""
+
+    BACKENDS = ["auto", "turbojpeg", "opencv"]
+
+    def __init__(self, workers: int = 0, backend: str = "auto"):
+        """
+        初始化编码池
+
+        Args:
+            workers: 编码线程数，0 表示使用 CPU 核心数
+            backend: "auto"（优先 turbojpeg）、"turbojpeg" 或 "opencv"
+        """
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self._turbo = None
+        self._turbo_rgb = None
+        self.backend = self._select_backend(backend)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="jpeg-encoder"
+        )
+        self._stats_lock = threading.Lock()
+        self.frames_encoded = 0
+        self.encode_time_total = 0.0
+        logger.info(f"JPEG 编码池已初始化: 后端={self.backend}, 线程数={self.workers}")
+
+    def _select_backend(self, backend: str) -> str:
+        """选择编码后端，turbojpeg 不可用时回退到 opencv"""
+        if backend not in self.BACKENDS:
+            logger.warning(f"未知的 JPEG 编码后端: {backend}，使用 auto")
+            backend = "auto"
+
+        if backend in ["auto", "turbojpeg"]:
+            try:
+                from turbojpeg import TurboJPEG, TJPF_RGB
+                self._turbo = TurboJPEG()
+                self._turbo_rgb = TJPF_RGB
+                return "turbojpeg"
+            except Exception as e:
+                if backend == "turbojpeg":
+                    logger.warning(f"无法加载 libjpeg-turbo ({e})，回退到 OpenCV 编码")
+
+        return "opencv"
+
+    def encode(self, image: np.ndarray, quality: int = 85) -> bytes:
+        """
+        在当前线程中将 RGB 图像编码为 JPEG
+
+        Args:
+            image: RGB（或单通道）图像
+            quality: JPEG 质量
+        """
+        start = time.perf_counter()
+
+        if self._turbo is not None and image.ndim == 3 and image.shape[2] == 3:
+            jpeg = self._turbo.encode(image, quality=quality, pixel_format=self._turbo_rgb)
+        else:
+            # 转换为 BGR（OpenCV 格式）
+            if image.ndim == 3 and image.shape[2] == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise RuntimeError("cv2.imencode 编码失败")
+            jpeg = buffer.tobytes()
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.frames_encoded += 1
+            self.encode_time_total += elapsed
+        return jpeg
+
+    @staticmethod
+    def resize(image: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+        """缩小图像（区域插值，缩小时质量好且速度快）"""
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def resize_nearest(image: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+        """缩小图像（最近邻，不混合相邻像素，用于深度图）"""
+        return cv2.resize(image, size, interpolation=cv2.INTER_NEAREST)
+
+    def submit(self, fn, *args) -> Future:
+        """提交任务到编码池（如缩放 + 编码）"""
+        return self._executor.submit(fn, *args)
+
+    def get_stats(self) -> dict[str, Any]:
+        """获取编码统计"""
+        with self._stats_lock:
+            avg_ms = self.encode_time_total / self.frames_encoded * 1000 if self.frames_encoded else 0.0
+            return {
+                "backend": self.backend,
+                "workers": self.workers,
+                "frames_encoded": self.frames_encoded,
+                "avg_encode_ms": round(avg_ms, 2),
+            }
+
+    def shutdown(self):
+        """关闭编码池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
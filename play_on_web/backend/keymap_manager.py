@@ -6,13 +6,20 @@
 - 管理多个配置预设
 - 配置验证
 - 构建反向键位映射（Key → Action）
+- 配置版本号（ETag）与外部修改检测（热重载）
+
+进程内通过 get_keymap_manager() 共用一个实例，与机器人是否连接无关。
 """
 
-import json
-import shutil
 from pathlib import Path
 from typing import Dict, Any, Tuple, Optional
+import json
 import logging
+import threading
+import time
+
+from config import settings
+from persistence import get_store
 
 logger = logging.getLogger(__name__)
 
@@ -51,12 +58,30 @@ class KeymapManager:
     def __init__(self):
         """初始化配置管理器"""
         self.config_path = Path.home() / ".cache" / "xlerobot_web" / "keymap_config.json"
-        self.backup_path = self.config_path.with_suffix('.backup.json')
+        self._store = get_store(
+            self.config_path, debounce=settings.config_write_debounce, backups=settings.config_backups
+        )
+        self.backup_path = self._store.backup_path()
+
+        # 配置版本号：每次修改或重新加载后递增；ETag 附带实例创建时间，重启后不会与旧缓存混淆
+        self.version = 0
+        self._epoch = time.time_ns() // 1_000_000
+        self._lock = threading.RLock()
+        self._file_stamp = self._stat_file()
+        self._watch_stop = threading.Event()
+        self._watch_thread: Optional[threading.Thread] = None
+
         self.config = self._load_config()
         self.current_profile = self.config["current_profile"]
         self.reverse_keymap = {}  # Key → (category, action) 映射
+        self.key_action_ids: Dict[str, int] = {}  # Key → 动作编号
         self._build_reverse_keymap()
 
+    @property
+    def etag(self) -> str:
+        """当前配置版本对应的 ETag"""
+        return f'"{self._epoch:x}-{self.version}"'
+
     def _get_default_config(self) -> Dict[str, Any]:
         """获取默认配置（包含3个内置预设）"""
         return {
@@ -155,10 +180,9 @@ class KeymapManager:
 
     def _load_config(self) -> Dict[str, Any]:
         """加载配置文件，失败则使用默认配置"""
-        if self.config_path.exists():
+        if self.config_path.exists() or self._store.dirty:
             try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
+                config = self._store.load()
                 logger.info(f"成功加载键位配置: {self.config_path}")
                 return config
             except Exception as e:
@@ -171,35 +195,28 @@ class KeymapManager:
             return config
 
     def _save_config(self, config: Optional[Dict[str, Any]] = None) -> bool:
-        """保存配置文件，先备份旧配置"""
+        """登记保存配置（后台去抖写入，原子替换并轮转备份，不等待磁盘）"""
         if config is None:
             config = self.config
 
         try:
-            # 确保目录存在
-            self.config_path.parent.mkdir(parents=True, exist_ok=True)
-
-            # 备份旧配置
-            if self.config_path.exists():
-                shutil.copy(self.config_path, self.backup_path)
-                logger.info(f"已备份旧配置到: {self.backup_path}")
-
-            # 保存新配置
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-
-            logger.info(f"成功保存键位配置: {self.config_path}")
+            with self._lock:
+                self._store.save(config)
+                self.version += 1
             return True
         except Exception as e:
             logger.error(f"保存键位配置失败: {e}")
             return False
 
     def _build_reverse_keymap(self):
-        """构建反向键位映射（Key → (category, action)）"""
-        self.reverse_keymap = {}
+        """构建反向键位映射（Key → (category, action)）及 Key → 动作编号"""
+        # 先构建新表再整体替换，热重载线程与请求处理并发时读取方不会看到半成品
+        reverse_keymap = {}
+        key_action_ids: Dict[str, int] = {}
 
         current_keymap = self.get_current_keymap()
         if not current_keymap:
+            self.reverse_keymap, self.key_action_ids = reverse_keymap, key_action_ids
             logger.warning("无法构建反向映射：当前配置无效")
             return
 
@@ -210,8 +227,12 @@ class KeymapManager:
             category_map = keyboard.get(category, {})
             for action, key in category_map.items():
                 key_upper = key.upper()
-                self.reverse_keymap[key_upper] = (category, action)
+                reverse_keymap[key_upper] = (category, action)
+                action_id = ACTION_IDS.get((category, action))
+                if action_id is not None:
+                    key_action_ids[key_upper] = action_id
 
+        self.reverse_keymap, self.key_action_ids = reverse_keymap, key_action_ids
         logger.info(f"已构建反向键位映射，共 {len(self.reverse_keymap)} 个按键")
 
     def get_key_action(self, key: str) -> Optional[Tuple[str, str]]:
@@ -228,6 +249,18 @@ class KeymapManager:
         key_upper = key.upper()
         return self.reverse_keymap.get(key_upper)
 
+    def get_key_action_id(self, key: str) -> Optional[int]:
+        """根据按键获取动作编号（未映射时返回 None）"""
+        return self.key_action_ids.get(key.upper())
+
+    @staticmethod
+    def get_action_ids() -> Dict[str, Dict[str, int]]:
+        """动作编号表 {category: {action: id}}（与预设无关，客户端可缓存）"""
+        table: Dict[str, Dict[str, int]] = {}
+        for (category, action), action_id in ACTION_IDS.items():
+            table.setdefault(category, {})[action] = action_id
+        return table
+
     def get_all_profiles(self) -> Dict[str, Any]:
         """获取所有配置预设"""
         return self.config.get("profiles", {})
@@ -407,3 +440,115 @@ class KeymapManager:
     def get_full_config(self) -> Dict[str, Any]:
         """获取完整的配置对象"""
         return self.config.copy()
+
+    # ==================== 外部修改检测 ====================
+
+    def _stat_file(self) -> Optional[Tuple[int, int]]:
+        """配置文件的 (mtime_ns, size)，文件不存在时返回 None"""
+        try:
+            stat = self.config_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check_for_changes(self) -> bool:
+        """
+        检查配置文件是否被外部修改，是则重新加载
+
+        只比较 mtime 和大小（一次 stat）；变化时读取内容，与本进程最近一次写入的内容相同则忽略。
+        有尚未落盘的修改时不重新加载（本进程的内容较新，随后会覆盖文件）。
+
+        Returns:
+            是否重新加载了配置
+        """
+        stamp = self._stat_file()
+        if stamp == self._file_stamp or stamp is None or self._store.dirty:
+            return False
+
+        try:
+            text = self.config_path.read_text(encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"读取键位配置失败: {e}")
+            return False
+
+        self._file_stamp = stamp
+        if text == self._store.last_written:
+            return False
+
+        try:
+            config = json.loads(text)
+        except ValueError as e:
+            logger.warning(f"外部修改的键位配置不是有效的 JSON，忽略: {e}")
+            return False
+
+        valid, message = self._validate_config(config)
+        if not valid:
+            logger.warning(f"外部修改的键位配置无效，忽略: {message}")
+            return False
+
+        with self._lock:
+            if self._store.dirty:
+                return False
+            self.config = config
+            self.current_profile = config["current_profile"]
+            self._build_reverse_keymap()
+            self.version += 1
+
+        logger.info(f"检测到键位配置文件被修改，已重新加载（当前预设: {self.current_profile}）")
+        return True
+
+    def _validate_config(self, config: Any) -> Tuple[bool, str]:
+        """验证完整配置对象（预设表与当前预设的键位）"""
+        if not isinstance(config, dict) or not isinstance(config.get("profiles"), dict):
+            return False, "缺少 profiles"
+        current = config.get("current_profile")
+        profile = config["profiles"].get(current)
+        if not isinstance(profile, dict) or not isinstance(profile.get("keyboard"), dict):
+            return False, f"当前预设 '{current}' 不存在或缺少 keyboard"
+        return self.validate_keymap(profile["keyboard"])
+
+    def start_watching(self, interval: float = 1.0):
+        """启动后台线程定期检查配置文件的外部修改"""
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(
+            target=self._watch_loop, args=(interval,), name="keymap-watch", daemon=True
+        )
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        """停止外部修改检测线程"""
+        self._watch_stop.set()
+        if self._watch_thread:
+            self._watch_thread.join(timeout=2.0)
+            self._watch_thread = None
+
+    def _watch_loop(self, interval: float):
+        while not self._watch_stop.wait(interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                logger.error(f"检查键位配置修改时出错: {e}")
+
+
+_manager: Optional[KeymapManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_keymap_manager() -> KeymapManager:
+    """进程内共享的键位映射管理器（首次调用时加载配置）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = KeymapManager()
+        return _manager
+
+
+# 动作编号：按 REQUIRED_ACTIONS 的顺序从 1 开始编号（0 保留为无效），与预设无关
+ACTION_LIST: list[Tuple[str, str]] = [
+    (category, action)
+    for category, actions in KeymapManager.REQUIRED_ACTIONS.items()
+    for action in actions
+]
+ACTION_IDS: Dict[Tuple[str, str], int] = {item: i + 1 for i, item in enumerate(ACTION_LIST)}
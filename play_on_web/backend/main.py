@@ -3,18 +3,26 @@ FastAPI 主应用 - Web 遥操作服务
 """
 import asyncio
 import logging
+from datetime import datetime
 from typing import Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
 from pathlib import Path
 
 from config import settings
 from device_scanner import DeviceScanner
+from device_inventory import DeviceInventory
 from robot_controller import RobotController
 from camera_manager import CameraManager, CameraConfig
+from snapshot import capture_snapshot
+from depth_codec import DepthDeltaEncoder
+from dataset_export import DatasetExporter, list_episode_dirs
+from episode_index import EpisodeIndex
+from persistence import flush_all
+from keymap_manager import get_keymap_manager
 
 # 配置日志
 logging.basicConfig(
@@ -41,9 +49,18 @@ app.add_middleware(
 
 # 全局状态
 robot_controller: RobotController | None = None
+dataset_exporter: DatasetExporter | None = None
+episode_index: EpisodeIndex | None = None
 camera_manager = CameraManager()
+keymap_manager = get_keymap_manager()
+device_inventory = DeviceInventory(poll_interval=settings.device_poll_interval)
 active_websockets: set[WebSocket] = set()
 
+# 单帧长轮询的最长等待时间（秒）
+MAX_FRAME_LONG_POLL_TIMEOUT = 30.0
+# 串口识别长轮询的最长等待时间（秒）
+MAX_PORT_IDENTIFY_TIMEOUT = 120.0
+
 
 # ==================== Pydantic 模型 ====================
 
@@ -66,6 +83,7 @@ class CameraAddRequest(BaseModel):
     width: int = 640
     height: int = 480
     fps: int = 30
+    use_depth: bool = False  # 同时采集深度图（仅 RealSense）
 
 
 class KeyboardActionRequest(BaseModel):
@@ -96,6 +114,63 @@ class StepLevelRequest(BaseModel):
     level: str = "normal"  # "slow", "normal", "fast"
 
 
+class RecordingStartRequest(BaseModel):
+    """回合录制开始请求"""
+    task: str | None = None  # 任务描述
+    operator: str | None = None  # 操作员
+    record_cameras: bool = True  # 同时录制相机（写入回合目录下的 cameras/）
+    cameras: list[str] | None = None  # 要录制的相机，None 表示全部
+
+
+class ReplayStartRequest(BaseModel):
+    """回合回放请求"""
+    episode_id: str
+    speed: float = 1.0  # 速度倍率
+    loop: bool = False
+    position: float = 0.0  # 起始位置（秒）
+
+
+class ReplayControlRequest(BaseModel):
+    """回放控制请求"""
+    command: str  # "pause", "resume", "seek", "speed", "stop"
+    value: float | None = None  # seek 的位置（秒）或 speed 的倍率
+
+
+class ProgramUploadRequest(BaseModel):
+    """运动程序上传请求（路点格式见 motion_program 模块）"""
+    name: str
+    arm: str  # "left" 或 "right"
+    repeat: int = 1
+    waypoints: list[dict[str, Any]]
+
+
+class ActionSourceRequest(BaseModel):
+    """动作源启用请求"""
+    type: str  # "sinusoid" 或 "process"
+    name: str
+    priority: int = 0  # 遥操作为 100，数值大的优先
+    params: dict[str, Any] = {}
+
+
+class SourcePriorityRequest(BaseModel):
+    """动作源优先级调整请求"""
+    priority: int
+
+
+class DatasetExportRequest(BaseModel):
+    """数据集导出请求"""
+    output_dir: str
+    episode_ids: list[str] | None = None  # None 表示全部已完成的回合
+    fps: int | None = None  # 默认 robot_fps
+    workers: int = 0  # 0 表示 CPU 核心数
+
+
+class CameraRecordingRequest(BaseModel):
+    """相机录制请求"""
+    cameras: list[str] | None = None  # None 表示全部
+    quality: int | None = None  # 默认与直播相同，以便复用已编码的帧
+
+
 class KeymapProfileSwitchRequest(BaseModel):
     """键位配置预设切换请求"""
     profile: str
@@ -144,52 +219,108 @@ async def health_check():
 # ==================== 设备扫描端点 ====================
 
 @app.get("/api/devices/ports")
-async def get_ports():
-    """获取所有可用串口"""
-    ports = DeviceScanner.find_available_ports()
+async def get_ports(refresh: bool = False):
+    """
+    获取所有可用串口（来自后台维护的设备清单，不在请求中扫描）
+
+    - refresh=true: 立即重新扫描 /dev
+    """
+    if refresh:
+        await asyncio.to_thread(device_inventory.refresh, False)
+    else:
+        await asyncio.to_thread(device_inventory.wait_ready, 5.0)
     return {
         "status": "success",
-        "ports": ports
+        "ports": device_inventory.get_ports(),
+        "updated_at": device_inventory.ports_updated_at
     }
 
 
+@app.get("/api/devices/ports/identify")
+async def identify_port(request: Request, timeout: float = 30.0, mode: str = "disconnect"):
+    """
+    识别串口（长轮询）：请求发出后让用户拔出（mode=connect 时为插入）USB 线缆，
+    端口一变化立即返回识别结果，timeout 秒内没有变化返回 status=timeout
+    """
+    timeout = max(1.0, min(timeout, MAX_PORT_IDENTIFY_TIMEOUT))
+    return await device_inventory.identify_port(timeout, mode, cancelled=request.is_disconnected)
+
+
 @app.get("/api/devices/ports/detect/start")
 async def start_port_detection():
-    """开始端口检测（第一步：记录当前端口）"""
-    result = DeviceScanner.find_port_by_disconnect()
-    return result
+    """开始端口检测（第一步：记录当前端口，推荐改用 /api/devices/ports/identify）"""
+    await asyncio.to_thread(device_inventory.wait_ready, 5.0)
+    return {
+        "status": "waiting_disconnect",
+        "message": "请拔出 USB 线缆",
+        # macOS 上同时记录 tty 和 cu 设备以便正确检测断开
+        "ports_before": device_inventory.get_ports(include_cu=True),
+        "timeout": 30.0
+    }
 
 
 @app.post("/api/devices/ports/detect/complete")
 async def complete_port_detection(request: PortDetectRequest):
-    """完成端口检测（第二步：检测断开后的端口）"""
-    result = DeviceScanner.find_port_after_disconnect(request.ports_before)
-    return result
+    """完成端口检测（第二步：立即重新扫描并比较断开前后的端口）"""
+    await asyncio.to_thread(device_inventory.refresh, False)
+    ports_diff = sorted(set(request.ports_before) - set(device_inventory.get_ports(include_cu=True)))
+    if not ports_diff:
+        return {"status": "error", "message": "未检测到端口变化"}
+    return DeviceScanner.identify_port(ports_diff)
 
 
 @app.get("/api/devices/cameras")
-async def get_cameras():
-    """获取所有可用相机"""
-    cameras = DeviceScanner.find_all_cameras()
+async def get_cameras(refresh: bool = False):
+    """
+    获取所有可用相机（来自设备清单，只有新接入的相机会被探测）
+
+    - refresh=true: 丢弃缓存并重新探测所有相机（耗时数秒）
+    - probing=true 表示仍有新接入的相机正在探测，结果会通过 /ws/devices 推送
+    """
+    if refresh:
+        await asyncio.to_thread(device_inventory.refresh)
+    status = device_inventory.get_status()
     return {
         "status": "success",
-        "cameras": cameras
+        "cameras": device_inventory.get_cameras(),
+        "updated_at": status["cameras_updated_at"],
+        "probing": status["probing"]
     }
 
 
 # ==================== 机器人控制端点 ====================
 
+async def _release_robot_controller() -> dict[str, Any] | None:
+    """
+    断开并丢弃当前的机器人控制器（停止其控制线程，不再占用舵机总线）
+
+    Returns:
+        disconnect() 的结果，没有控制器时返回 None
+    """
+    global robot_controller
+
+    controller, robot_controller = robot_controller, None
+    if controller is None:
+        return None
+    if controller.recorder.is_recording:
+        # 录制中断开：同样结束相机录制并写入回合索引
+        await _finish_recording(controller)
+    return await asyncio.to_thread(controller.disconnect)
+
+
 @app.post("/api/robot/connect")
 async def connect_robot(request: RobotConnectRequest):
-    """连接机器人"""
+    """连接机器人（已有连接时先断开旧的控制器）"""
     global robot_controller
-    
+
+    await _release_robot_controller()
     try:
         config = {
             "port1": request.port1,
             "port2": request.port2
         }
         robot_controller = RobotController(config)
+        robot_controller.camera_manager = camera_manager
         result = robot_controller.connect()
         return result
     except Exception as e:
@@ -200,14 +331,10 @@ async def connect_robot(request: RobotConnectRequest):
 @app.post("/api/robot/disconnect")
 async def disconnect_robot():
     """断开机器人连接"""
-    global robot_controller
-    
-    if robot_controller:
-        result = robot_controller.disconnect()
-        robot_controller = None
-        return result
-    else:
+    result = await _release_robot_controller()
+    if result is None:
         return {"status": "error", "message": "机器人未连接"}
+    return result
 
 
 @app.post("/api/robot/zero")
@@ -280,91 +407,388 @@ async def get_observation():
     return result
 
 
-# ==================== 键位配置管理端点 ====================
+@app.get("/api/robot/history")
+async def get_robot_history(since: float | None = None, fields: str | None = None,
+                            decimate: int | None = Query(None, ge=1)):
+    """
+    获取最近的观测与指令历史（列式数组）
 
-@app.get("/api/keymap/profiles")
-async def get_keymap_profiles():
-    """获取所有键位配置预设"""
+    - since: 负数表示最近多少秒（默认全部缓冲），正数为上次返回的 t_end（增量轮询）
+    - fields: 逗号分隔的字段名，指令字段加 "cmd:" 前缀
+    - decimate: 降采样桶数（≥ 1，每桶返回 mean / min / max）
+    """
     if not robot_controller:
         raise HTTPException(status_code=400, detail="机器人未连接")
 
-    result = robot_controller.get_all_keymap_profiles()
-    return result
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    return robot_controller.get_telemetry_history(since, field_list, decimate)
 
 
-@app.get("/api/keymap/current")
-async def get_current_keymap():
-    """获取当前激活的键位配置"""
+# ==================== 回合录制端点 ====================
+
+@app.post("/api/recording/start")
+async def start_recording(request: RecordingStartRequest):
+    """开始录制回合（观测值、动作、遥操作输入）"""
     if not robot_controller:
         raise HTTPException(status_code=400, detail="机器人未连接")
 
-    result = robot_controller.get_current_keymap()
+    metadata = request.model_dump(include={"task", "operator"}, exclude_none=True)
+    result = robot_controller.start_recording(metadata)
+    if result["status"] == "success" and request.record_cameras and camera_manager.captures:
+        result["camera_recording"] = camera_manager.start_recording(
+            Path(result["episode_dir"]) / "cameras", request.cameras
+        )
     return result
 
 
-@app.get("/api/keymap/config")
-async def get_keymap_config():
-    """获取完整的键位配置"""
+@app.post("/api/recording/stop")
+async def stop_recording():
+    """停止录制回合"""
     if not robot_controller:
         raise HTTPException(status_code=400, detail="机器人未连接")
 
-    result = robot_controller.get_keymap_config()
+    return await _finish_recording(robot_controller)
+
+
+async def _finish_recording(controller: RobotController) -> dict[str, Any]:
+    """结束回合录制：停止机器人与相机录制，都结束后写入回合索引（停止录制与断开连接共用）"""
+    # 等待写盘线程写完剩余数据，放到线程池中避免阻塞事件循环
+    result = await asyncio.to_thread(controller.stop_recording)
+    if camera_manager.recorders:
+        result["camera_recording"] = await asyncio.to_thread(camera_manager.stop_recording)
+
+    # 机器人与相机录制都结束后写入回合索引
+    if result["status"] == "success" and episode_index:
+        try:
+            await asyncio.to_thread(episode_index.add_episode, Path(result["episode_dir"]))
+        except Exception as e:
+            logger.error(f"写入回合索引时出错: {e}")
     return result
 
 
-@app.post("/api/keymap/profile/switch")
-async def switch_keymap_profile(request: KeymapProfileSwitchRequest):
-    """切换键位配置预设"""
+@app.get("/api/recording/status")
+async def get_recording_status():
+    """获取录制状态"""
     if not robot_controller:
         raise HTTPException(status_code=400, detail="机器人未连接")
 
-    result = robot_controller.switch_keymap_profile(request.profile)
-    return result
+    return {
+        **robot_controller.get_recording_status(),
+        "camera_recording": camera_manager.get_recording_status(),
+    }
 
 
-@app.post("/api/keymap/profile/create")
-async def create_keymap_profile(request: KeymapProfileCreateRequest):
-    """创建新的键位配置预设"""
+# ==================== 回合索引端点 ====================
+
+@app.get("/api/episodes")
+async def list_episodes(
+    robot_id: str | None = None,
+    operator: str | None = None,
+    task: str | None = None,
+    keymap_profile: str | None = None,
+    min_duration: float | None = None,
+    max_duration: float | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    order: str = "desc",
+):
+    """分页筛选回合（since / until 为 ISO 时间或日期前缀）"""
+    if not episode_index:
+        raise HTTPException(status_code=503, detail="回合索引未初始化")
+
+    result = episode_index.list_episodes(
+        robot_id=robot_id, operator=operator, task=task, keymap_profile=keymap_profile,
+        min_duration=min_duration, max_duration=max_duration, since=since, until=until,
+        limit=limit, offset=offset, descending=order != "asc",
+    )
+    return {"status": "success", **result}
+
+
+@app.get("/api/episodes/{episode_id}")
+async def get_episode(episode_id: str):
+    """获取回合摘要（关节范围、各相机帧数等）"""
+    if not episode_index:
+        raise HTTPException(status_code=503, detail="回合索引未初始化")
+
+    episode = episode_index.get_episode(episode_id)
+    if episode is None:
+        raise HTTPException(status_code=404, detail=f"回合不存在: {episode_id}")
+    return {"status": "success", "episode": episode}
+
+
+@app.post("/api/episodes/reindex")
+async def reindex_episodes():
+    """扫描录制目录重建回合索引"""
+    if not episode_index:
+        raise HTTPException(status_code=503, detail="回合索引未初始化")
+
+    count = await asyncio.to_thread(episode_index.rebuild)
+    return {"status": "success", "message": f"已索引 {count} 个回合", "count": count}
+
+
+# ==================== 回合回放端点 ====================
+
+@app.post("/api/replay/start")
+async def start_replay(request: ReplayStartRequest):
+    """按原始时间戳回放录制的回合"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.start_replay(request.episode_id, request.speed, request.loop, request.position)
+
+
+@app.post("/api/replay/control")
+async def control_replay(request: ReplayControlRequest):
+    """暂停 / 继续 / 跳转 / 变速 / 停止回放"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return await asyncio.to_thread(robot_controller.control_replay, request.command, request.value)
+
+
+@app.get("/api/replay/status")
+async def get_replay_status():
+    """获取回放进度与跟踪误差"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.get_replay_status()
+
+
+# ==================== 运动程序端点 ====================
+
+@app.post("/api/programs")
+async def upload_program(request: ProgramUploadRequest):
+    """上传运动程序（校验并预插值，执行与控制通过 /ws/teleop）"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return await asyncio.to_thread(robot_controller.upload_program, request.model_dump())
+
+
+@app.get("/api/programs")
+async def list_programs():
+    """列出已上传的运动程序"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.list_programs()
+
+
+@app.delete("/api/programs/{name}")
+async def delete_program(name: str):
+    """删除运动程序"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.delete_program(name)
+
+
+@app.get("/api/programs/status")
+async def get_program_status():
+    """获取运动程序执行进度"""
     if not robot_controller:
         raise HTTPException(status_code=400, detail="机器人未连接")
 
-    result = robot_controller.create_keymap_profile(
+    return robot_controller.get_program_status()
+
+
+# ==================== 动作源端点 ====================
+
+@app.get("/api/sources")
+async def list_action_sources():
+    """列出控制循环中的动作源（遥操作、脚本、策略）"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.list_action_sources()
+
+
+@app.post("/api/sources")
+async def create_action_source(request: ActionSourceRequest):
+    """启用动作源"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return await asyncio.to_thread(
+        robot_controller.create_action_source, request.type, request.name, request.priority, request.params
+    )
+
+
+@app.post("/api/sources/{name}/priority")
+async def set_source_priority(name: str, request: SourcePriorityRequest):
+    """调整动作源优先级"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return robot_controller.set_source_priority(name, request.priority)
+
+
+@app.delete("/api/sources/{name}")
+async def remove_action_source(name: str):
+    """停用动作源"""
+    if not robot_controller:
+        raise HTTPException(status_code=400, detail="机器人未连接")
+
+    return await asyncio.to_thread(robot_controller.remove_action_source, name)
+
+
+# ==================== 数据集导出端点 ====================
+
+@app.post("/api/datasets/export")
+async def start_dataset_export(request: DatasetExportRequest):
+    """把录制的回合导出为 LeRobotDataset（后台多进程执行）"""
+    global dataset_exporter
+
+    if dataset_exporter and dataset_exporter.state == "running":
+        return {"status": "error", "message": "已有导出任务在运行"}
+
+    episode_dirs = list_episode_dirs()
+    if request.episode_ids is not None:
+        wanted = set(request.episode_ids)
+        episode_dirs = [d for d in episode_dirs if d.name in wanted]
+    if not episode_dirs:
+        return {"status": "error", "message": "没有可导出的回合"}
+
+    dataset_exporter = DatasetExporter(
+        episode_dirs, Path(request.output_dir), fps=request.fps, workers=request.workers
+    )
+    dataset_exporter.start()
+    return {"status": "success", "export": dataset_exporter.get_status()}
+
+
+@app.get("/api/datasets/export/status")
+async def get_dataset_export_status():
+    """获取导出进度"""
+    return {
+        "status": "success",
+        "export": dataset_exporter.get_status() if dataset_exporter else None
+    }
+
+
+# ==================== 键位配置管理端点 ====================
+# 键位配置与机器人连接无关，直接使用进程内共享的 KeymapManager。
+# GET 端点返回 ETag（配置版本号），客户端带 If-None-Match 重新验证时未修改则返回 304。
+
+def _keymap_not_modified(request: Request, response: Response) -> Response | None:
+    """为键位 GET 响应设置 ETag，If-None-Match 命中时返回 304 响应"""
+    headers = {"ETag": keymap_manager.etag, "Cache-Control": "no-cache"}
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+@app.get("/api/keymap/profiles")
+async def get_keymap_profiles(request: Request, response: Response):
+    """获取所有键位配置预设"""
+    not_modified = _keymap_not_modified(request, response)
+    if not_modified:
+        return not_modified
+
+    return {
+        "status": "success",
+        "profiles": keymap_manager.get_all_profiles(),
+        "current_profile": keymap_manager.current_profile,
+        "version": keymap_manager.version
+    }
+
+
+@app.get("/api/keymap/current")
+async def get_current_keymap(request: Request, response: Response):
+    """获取当前激活的键位配置"""
+    not_modified = _keymap_not_modified(request, response)
+    if not_modified:
+        return not_modified
+
+    keymap = keymap_manager.get_current_keymap()
+    if not keymap:
+        return {"status": "error", "message": "无法获取当前键位配置"}
+    return {
+        "status": "success",
+        "keymap": keymap,
+        "profile": keymap_manager.current_profile,
+        "action_ids": keymap_manager.get_action_ids(),
+        "version": keymap_manager.version
+    }
+
+
+@app.get("/api/keymap/config")
+async def get_keymap_config(request: Request, response: Response):
+    """获取完整的键位配置"""
+    not_modified = _keymap_not_modified(request, response)
+    if not_modified:
+        return not_modified
+
+    return {
+        "status": "success",
+        "config": keymap_manager.get_full_config(),
+        "version": keymap_manager.version
+    }
+
+
+@app.post("/api/keymap/profile/switch")
+async def switch_keymap_profile(request: KeymapProfileSwitchRequest):
+    """切换键位配置预设"""
+    success, message = keymap_manager.switch_profile(request.profile)
+    return {
+        "status": "success" if success else "error",
+        "message": message,
+        "current_profile": keymap_manager.current_profile if success else None,
+        "version": keymap_manager.version
+    }
+
+
+@app.post("/api/keymap/profile/create")
+async def create_keymap_profile(request: KeymapProfileCreateRequest):
+    """创建新的键位配置预设"""
+    success, message = keymap_manager.create_profile(
         request.profile_name,
         request.name,
         request.description,
         request.keymap
     )
-    return result
+    return {
+        "status": "success" if success else "error",
+        "message": message,
+        "version": keymap_manager.version
+    }
 
 
 @app.put("/api/keymap/profile/{profile_name}")
 async def update_keymap_profile(profile_name: str, request: KeymapProfileUpdateRequest):
     """更新指定的键位配置预设"""
-    if not robot_controller:
-        raise HTTPException(status_code=400, detail="机器人未连接")
-
-    result = robot_controller.update_keymap_profile(profile_name, request.keymap)
-    return result
+    success, message = keymap_manager.update_profile(profile_name, request.keymap)
+    return {
+        "status": "success" if success else "error",
+        "message": message,
+        "version": keymap_manager.version
+    }
 
 
 @app.delete("/api/keymap/profile/{profile_name}")
 async def delete_keymap_profile(profile_name: str):
     """删除键位配置预设"""
-    if not robot_controller:
-        raise HTTPException(status_code=400, detail="机器人未连接")
-
-    result = robot_controller.delete_keymap_profile(profile_name)
-    return result
+    success, message = keymap_manager.delete_profile(profile_name)
+    return {
+        "status": "success" if success else "error",
+        "message": message,
+        "version": keymap_manager.version
+    }
 
 
 @app.post("/api/keymap/validate")
 async def validate_keymap(request: KeymapValidateRequest):
     """验证键位配置"""
-    if not robot_controller:
-        raise HTTPException(status_code=400, detail="机器人未连接")
-
-    result = robot_controller.validate_keymap(request.keymap)
-    return result
+    valid, message = keymap_manager.validate_keymap(request.keymap)
+    return {
+        "status": "success" if valid else "error",
+        "message": message,
+        "valid": valid
+    }
 
 
 # ==================== 相机管理端点 ====================
@@ -377,7 +801,8 @@ async def add_camera(request: CameraAddRequest):
         camera_type=request.camera_type,
         width=request.width,
         height=request.height,
-        fps=request.fps
+        fps=request.fps,
+        use_depth=request.use_depth
     )
     result = camera_manager.add_camera(request.name, config)
     return result
@@ -390,17 +815,148 @@ async def remove_camera(camera_name: str):
     return result
 
 
+@app.get("/api/cameras/sessions")
+async def get_camera_sessions():
+    """获取当前所有相机观看会话"""
+    return {
+        "status": "success",
+        "sessions": camera_manager.get_sessions_info()
+    }
+
+
+@app.get("/api/cameras/stats")
+async def get_camera_stats():
+    """获取相机采集与发送帧率统计（目标 vs 实际）"""
+    return {
+        "status": "success",
+        **camera_manager.get_stats()
+    }
+
+
+@app.post("/api/cameras/recording/start")
+async def start_camera_recording(request: CameraRecordingRequest):
+    """开始录制相机（MJPEG + 时间戳索引，复用直播已编码的帧）"""
+    output_dir = Path(settings.recordings_dir) / f"cameras_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return camera_manager.start_recording(output_dir, request.cameras, request.quality)
+
+
+@app.post("/api/cameras/recording/stop")
+async def stop_camera_recording():
+    """停止相机录制"""
+    return await asyncio.to_thread(camera_manager.stop_recording)
+
+
+@app.get("/api/cameras/recording/status")
+async def get_camera_recording_status():
+    """获取相机录制状态"""
+    return {
+        "status": "success",
+        **camera_manager.get_recording_status()
+    }
+
+
 @app.get("/api/cameras/{camera_name}/frame")
-async def get_camera_frame(camera_name: str):
-    """获取单帧图像"""
-    frame_bytes = camera_manager.get_frame(camera_name)
-    if frame_bytes:
-        return StreamingResponse(
-            iter([frame_bytes]),
-            media_type="image/jpeg"
+async def get_camera_frame(
+    camera_name: str,
+    request: Request,
+    width: int | None = None,
+    after: str | None = None,
+    timeout: float = 10.0
+):
+    """
+    获取单帧图像（来自共享采集缓冲，不触发额外的设备读取）
+
+    - 响应头 ETag 为帧标签 "<纪元>-<序号>"，If-None-Match 命中时返回 304
+    - after=<帧标签>&timeout=<秒>: 长轮询，等待比该帧更新的帧，超时返回 304；
+      标签来自已重建的采集（纪元不同）时立即返回最新帧
+    - width: 可选缩略图宽度
+    """
+    capture = camera_manager.captures.get(camera_name)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="相机不存在")
+    try:
+        after_seq = capture.parse_frame_tag(after) if after is not None else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的帧标签: {after}")
+
+    timeout = max(0.0, min(timeout, MAX_FRAME_LONG_POLL_TIMEOUT))
+    # 首帧可能需要等待设备冷启动
+    wait = timeout if after is not None else max(timeout, 5.0)
+    packet = await camera_manager.wait_for_packet(camera_name, after_seq, wait)
+
+    if packet is None:
+        if after is None:
+            raise HTTPException(status_code=404, detail="相机无法获取帧")
+        # 长轮询超时：没有新帧
+        return Response(
+            status_code=304, headers={"ETag": f'"{capture.frame_tag(after_seq)}"', "Cache-Control": "no-cache"}
         )
-    else:
-        raise HTTPException(status_code=404, detail="相机不存在或无法获取帧")
+
+    etag = f'"{capture.frame_tag(packet.seq)}"'
+    headers = {
+        "ETag": etag,
+        "X-Frame-Seq": str(packet.seq),
+        "X-Frame-Timestamp": f"{packet.timestamp:.6f}",
+        "Cache-Control": "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    frame_bytes = await camera_manager.encode_jpeg_async(
+        packet, size=camera_manager.resolve_size(camera_name, width)
+    )
+    if not frame_bytes:
+        raise HTTPException(status_code=500, detail="编码帧失败")
+    return Response(content=frame_bytes, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/cameras/{camera_name}/depth")
+async def get_camera_depth(camera_name: str, format: str = "preview", width: int | None = None):
+    """
+    获取深度图（仅启用深度的 RealSense）
+
+    Args:
+        format: "preview"（伪彩色 JPEG）、"png"（无损 16 位 PNG）
+                或 "zstd"（zstd/zlib 压缩的 16 位原始数据，单个关键帧）
+    """
+    config = camera_manager.camera_configs.get(camera_name)
+    if config is None or not config.use_depth:
+        raise HTTPException(status_code=404, detail="相机不存在或未启用深度")
+
+    packet = await camera_manager.wait_for_packet(camera_name, 0, 5.0)
+    if packet is None or packet.depth is None:
+        raise HTTPException(status_code=404, detail="无法获取深度图")
+
+    headers = {"ETag": f'"{packet.seq}"', "X-Frame-Seq": str(packet.seq), "Cache-Control": "no-cache"}
+    if format == "zstd":
+        data = DepthDeltaEncoder().encode(packet.depth)
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+    size = camera_manager.resolve_size(camera_name, width)
+    data = await camera_manager.encode_depth_async(packet, format, size=size)
+    if not data:
+        raise HTTPException(status_code=400, detail=f"不支持的深度格式: {format}")
+    media_type = "image/png" if format == "png" else "image/jpeg"
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
+# ==================== 快照端点 ====================
+
+@app.get("/api/snapshot")
+async def get_snapshot(
+    cameras: str | None = None,
+    width: int | None = None,
+    quality: int | None = None
+):
+    """
+    获取时间对齐的快照：多路相机帧 + 插值后的机器人观测值（含各自的时间偏差）
+
+    Args:
+        cameras: 逗号分隔的相机名称（默认所有相机）
+    """
+    camera_names = [name.strip() for name in cameras.split(",") if name.strip()] if cameras else None
+    return await capture_snapshot(camera_manager, robot_controller, camera_names, width, quality)
 
 
 # ==================== WebSocket 端点 ====================
@@ -414,6 +970,7 @@ async def websocket_teleop(websocket: WebSocket):
     await websocket.accept()
     active_websockets.add(websocket)
     logger.info(f"WebSocket 连接建立，当前活跃连接数: {len(active_websockets)}")
+    progress_task: asyncio.Task | None = None
     
     try:
         while True:
@@ -431,6 +988,15 @@ async def websocket_teleop(websocket: WebSocket):
                         "data": result
                     })
             
+            elif message_type == "key":
+                # 紧凑按键消息：{"id": 动作编号} 或 {"key": 按键}，松开时带 "up": true
+                if robot_controller:
+                    result = robot_controller.handle_key_event(data.get("data") or {})
+                    await websocket.send_json({
+                        "type": "action_result",
+                        "data": result
+                    })
+            
             elif message_type == "base_action":
                 # 底盘动作
                 if robot_controller:
@@ -458,6 +1024,51 @@ async def websocket_teleop(websocket: WebSocket):
                         "data": result
                     })
             
+            elif message_type == "get_snapshot":
+                # 时间对齐快照
+                params = data.get("data") or {}
+                result = await capture_snapshot(
+                    camera_manager,
+                    robot_controller,
+                    params.get("cameras"),
+                    params.get("width"),
+                    params.get("quality")
+                )
+                await websocket.send_json({
+                    "type": "snapshot",
+                    "data": result
+                })
+            
+            elif message_type == "program_run":
+                # 执行运动程序，执行期间推送 program_progress
+                if robot_controller:
+                    name = (data.get("data") or {}).get("name")
+                    result = await asyncio.to_thread(robot_controller.run_program, name)
+                    await websocket.send_json({
+                        "type": "program_result",
+                        "data": result
+                    })
+                    if result["status"] == "success" and (progress_task is None or progress_task.done()):
+                        progress_task = asyncio.create_task(_stream_program_progress(websocket))
+            
+            elif message_type == "program_control":
+                # 暂停 / 继续 / 中止运动程序
+                if robot_controller:
+                    command = (data.get("data") or {}).get("command")
+                    result = await asyncio.to_thread(robot_controller.control_program, command)
+                    await websocket.send_json({
+                        "type": "program_result",
+                        "data": result
+                    })
+            
+            elif message_type == "program_status":
+                # 运动程序进度
+                if robot_controller:
+                    await websocket.send_json({
+                        "type": "program_progress",
+                        "data": robot_controller.get_program_status().get("program")
+                    })
+            
             elif message_type == "ping":
                 # 心跳
                 await websocket.send_json({
@@ -475,18 +1086,47 @@ async def websocket_teleop(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket 错误: {e}")
     finally:
+        if progress_task:
+            progress_task.cancel()
         active_websockets.discard(websocket)
         logger.info(f"WebSocket 连接关闭，当前活跃连接数: {len(active_websockets)}")
 
 
+async def _stream_program_progress(websocket: WebSocket, interval: float = 0.1):
+    """运动程序执行期间定期推送进度，结束时推送最终状态"""
+    try:
+        while robot_controller and robot_controller.program_runner:
+            runner = robot_controller.program_runner
+            await websocket.send_json({
+                "type": "program_progress",
+                "data": runner.get_progress()
+            })
+            if not runner.is_active:
+                break
+            await asyncio.sleep(interval)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
 @app.websocket("/ws/camera")
 async def websocket_camera(websocket: WebSocket):
     """
     WebSocket 相机流端点
     实时传输多路相机画面
+
+    每个连接对应一个独立的相机会话，连接关闭只结束本会话。
+    首条消息: {"cameras": [...], "fps": 可选帧率上限, "quality": 可选 JPEG 质量,
+              "sizes": {相机名: "full" | "thumb" | 最大宽度 | [宽, 高]},
+              "skip_unchanged": 可选，是否跳过静止画面,
+              "codec": "jpeg"（默认）| "h264" | "vp8",
+              "depth": [需要附带深度预览的相机]}
+    视频编码模式下推送 video_chunk 消息（关键帧起始），编码不可用时回退到 JPEG。
+    之后可发送: {"type": "subscribe", ...同上字段} 更新订阅
     """
     await websocket.accept()
     logger.info("相机流 WebSocket 连接建立")
+    session = None
+    receiver = None
     
     try:
         # 等待客户端发送相机列表
@@ -494,19 +1134,99 @@ async def websocket_camera(websocket: WebSocket):
         camera_names = data.get("cameras", [])
         
         logger.info(f"开始流式传输相机: {camera_names}")
+        session = camera_manager.create_session(
+            camera_names,
+            max_fps=data.get("fps"),
+            quality=data.get("quality"),
+            sizes=data.get("sizes"),
+            skip_unchanged=data.get("skip_unchanged"),
+            codec=data.get("codec", "jpeg"),
+            depth=data.get("depth")
+        )
+        receiver = asyncio.create_task(_receive_camera_messages(websocket, session))
         
         # 开始流式传输
-        await camera_manager.stream_frames(websocket, camera_names)
+        await session.run(websocket)
     
     except WebSocketDisconnect:
         logger.info("相机流 WebSocket 连接断开")
     except Exception as e:
         logger.error(f"相机流 WebSocket 错误: {e}")
     finally:
-        camera_manager.stop_streaming()
+        if receiver:
+            receiver.cancel()
+        if session:
+            camera_manager.close_session(session.session_id)
         logger.info("相机流 WebSocket 连接关闭")
 
 
+async def _receive_camera_messages(websocket: WebSocket, session):
+    """接收相机流客户端的订阅更新消息，连接断开时关闭会话"""
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if data.get("type") == "subscribe":
+                session.update(
+                    camera_names=data.get("cameras"),
+                    max_fps=data.get("fps"),
+                    quality=data.get("quality"),
+                    sizes=data.get("sizes"),
+                    skip_unchanged=data.get("skip_unchanged"),
+                    depth=data.get("depth")
+                )
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"接收相机流消息时出错: {e}")
+    finally:
+        session.close()
+
+
+@app.websocket("/ws/devices")
+async def websocket_devices(websocket: WebSocket):
+    """
+    设备热插拔 WebSocket
+
+    连接后先推送 {"type": "inventory", "data": {"ports", "cameras", ...}}，
+    之后推送 device_added / device_removed 事件（data.kind 为 port 或 camera）。
+    """
+    await websocket.accept()
+    queue = device_inventory.subscribe()
+    receiver = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.to_thread(device_inventory.wait_ready, 5.0)
+        await websocket.send_json({
+            "type": "inventory",
+            "data": {
+                "ports": device_inventory.get_ports(),
+                "cameras": device_inventory.get_cameras(),
+                **device_inventory.get_status()
+            }
+        })
+        while not receiver.done():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"设备 WebSocket 错误: {e}")
+    finally:
+        receiver.cancel()
+        device_inventory.unsubscribe(queue)
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    """读取并丢弃客户端消息，连接断开时返回"""
+    try:
+        while True:
+            await websocket.receive_text()
+    except Exception:
+        pass
+
+
 # ==================== 启动和关闭事件 ====================
 
 @app.on_event("startup")
@@ -515,6 +1235,21 @@ async def startup_event():
     logger.info("XLerobot Web Teleop 服务启动")
     logger.info(f"CORS 允许的源: {settings.cors_origins_list}")
 
+    # 检测键位配置文件的外部修改
+    keymap_manager.start_watching(settings.keymap_reload_interval)
+
+    # 后台维护设备清单（首次扫描在后台线程中进行）
+    device_inventory.start()
+
+    # 打开回合索引，首次使用时从录制目录建立
+    global episode_index
+    try:
+        episode_index = EpisodeIndex(Path(settings.recordings_dir))
+        if episode_index.count() == 0:
+            await asyncio.to_thread(episode_index.rebuild)
+    except Exception as e:
+        logger.error(f"打开回合索引时出错: {e}")
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -522,11 +1257,18 @@ async def shutdown_event():
     logger.info("XLerobot Web Teleop 服务关闭")
     
     # 断开机器人
-    if robot_controller:
-        robot_controller.disconnect()
+    await _release_robot_controller()
     
     # 断开所有相机
     camera_manager.disconnect_all()
+    device_inventory.stop()
+
+    if episode_index:
+        episode_index.close()
+
+    # 写入尚未落盘的配置
+    keymap_manager.stop_watching()
+    flush_all()
     
     # 关闭所有 WebSocket 连接
     for ws in active_websockets:
@@ -0,0 +1,391 @@
+"""
+运动程序模块 - 上传关节空间 / 笛卡尔空间路点程序，由后端按控制频率执行
+
+程序格式（JSON）：
+
+    {
+        "name": "wave",
+        "arm": "left",                  # "left" 或 "right"
+        "repeat": 1,                    # 重复次数
+        "waypoints": [
+            {"type": "joint", "duration": 1.5,
+             "positions": {"shoulder_pan": 20, "gripper": 30}},   # 未指定的关节保持不变
+            {"type": "cartesian", "duration": 1.0,
+             "x": 0.18, "y": 0.10, "pitch": 10},                 # 末端平面位置（米）+ 俯仰（度）
+            {"type": "hold", "duration": 0.5}
+        ]
+    }
+
+上传时一次性校验并预插值：按 robot_fps 生成每个控制周期的关节目标（最小加加速度时间律），
+笛卡尔段在 (x, y, pitch) 中直线插值，每个采样点用 SO101Kinematics 求逆解。
+执行时程序作为动作源（ProgramRunner）参与控制线程的仲裁：每个控制周期取出一行，
+只占用所控制机械臂的关节字段，另一只机械臂和底盘仍可遥操作或由其他动作源控制；
+网络抖动不影响轨迹。第一个路点之前的接近段从执行开始时的实际位置出发，在启动时补算。
+"""
+import math
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from config import settings
+from action_sources import ActionSource
+
+if TYPE_CHECKING:
+    from robot_controller import RobotController
+
+logger = logging.getLogger(__name__)
+
+# 机械臂关节顺序（与 ArmState.target_positions 一致）
+ARM_JOINTS = ["shoulder_pan", "shoulder_lift", "elbow_flex", "wrist_flex", "wrist_roll", "gripper"]
+WAYPOINT_TYPES = ["joint", "cartesian", "hold"]
+
+# 校验范围
+JOINT_LIMIT_DEG = 180.0
+GRIPPER_RANGE = (0.0, 100.0)
+MAX_SEGMENT_DURATION = 60.0
+MAX_PROGRAM_DURATION = 600.0
+
+# 程序动作源的仲裁优先级（高于遥操作，执行期间所控制的机械臂不响应键盘）
+PROGRAM_PRIORITY = 200
+
+
+def min_jerk(s: np.ndarray) -> np.ndarray:
+    """最小加加速度时间律：0→1，起止速度和加速度为 0"""
+    return s * s * s * (10 - 15 * s + 6 * s * s)
+
+
+def wrist_flex_for(shoulder_lift: float, elbow_flex: float, pitch: float) -> float:
+    """与键盘遥操作相同的腕关节耦合关系"""
+    return -shoulder_lift - elbow_flex + pitch
+
+
+@dataclass
+class CompiledProgram:
+    """预插值后的程序"""
+    name: str
+    arm: str
+    repeat: int
+    first_target: np.ndarray  # 第一个路点的关节目标
+    first_duration: float  # 接近段时长
+    trajectory: np.ndarray  # (周期数, 6) 第一个路点之后的关节目标
+    segment_index: np.ndarray  # (周期数,) 每个周期所属的路点编号
+    num_waypoints: int
+    fps: int
+    final_cartesian: Optional[tuple[float, float, float]]  # 最后一个笛卡尔路点的 (x, y, pitch)
+
+    @property
+    def duration(self) -> float:
+        return self.first_duration + len(self.trajectory) / self.fps
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "arm": self.arm,
+            "repeat": self.repeat,
+            "waypoints": self.num_waypoints,
+            "duration": round(self.duration, 3),
+            "ticks": int(round(self.first_duration * self.fps)) + len(self.trajectory),
+            "fps": self.fps,
+        }
+
+
+class ProgramError(ValueError):
+    """程序校验失败"""
+
+
+def _check_joint(name: str, value: Any, where: str) -> float:
+    if name not in ARM_JOINTS:
+        raise ProgramError(f"{where}: 未知关节 {name}")
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ProgramError(f"{where}: 关节 {name} 的值无效: {value}")
+    low, high = GRIPPER_RANGE if name == "gripper" else (-JOINT_LIMIT_DEG, JOINT_LIMIT_DEG)
+    if not low <= value <= high:
+        raise ProgramError(f"{where}: 关节 {name}={value} 超出范围 [{low}, {high}]")
+    return float(value)
+
+
+def _solve_cartesian(kinematics, x: float, y: float, pitch: float, base: np.ndarray, where: str) -> np.ndarray:
+    """求笛卡尔目标对应的关节目标（shoulder_pan、wrist_roll、gripper 沿用 base）"""
+    try:
+        shoulder_lift, elbow_flex = kinematics.inverse_kinematics(x, y)
+    except Exception as e:
+        raise ProgramError(f"{where}: ({x:.4f}, {y:.4f}) 逆解失败: {e}")
+    if not (math.isfinite(shoulder_lift) and math.isfinite(elbow_flex)):
+        raise ProgramError(f"{where}: ({x:.4f}, {y:.4f}) 不可达")
+    target = base.copy()
+    target[1] = shoulder_lift
+    target[2] = elbow_flex
+    target[3] = wrist_flex_for(shoulder_lift, elbow_flex, pitch)
+    for i in [1, 2, 3]:
+        _check_joint(ARM_JOINTS[i], float(target[i]), where)
+    return target
+
+
+def compile_program(spec: dict[str, Any], kinematics, fps: Optional[int] = None) -> CompiledProgram:
+    """
+    校验并预插值程序
+
+    Args:
+        spec: 程序定义（见模块文档）
+        kinematics: SO101Kinematics 实例（笛卡尔路点需要）
+        fps: 控制频率，默认 robot_fps
+
+    Raises:
+        ProgramError: 程序无效
+    """
+    fps = fps or settings.robot_fps
+    name = spec.get("name")
+    if not name or not isinstance(name, str):
+        raise ProgramError("程序缺少 name")
+    arm = spec.get("arm")
+    if arm not in ["left", "right"]:
+        raise ProgramError(f"无效的机械臂: {arm}")
+    repeat = spec.get("repeat", 1)
+    if not isinstance(repeat, int) or repeat < 1:
+        raise ProgramError(f"无效的重复次数: {repeat}")
+    waypoints = spec.get("waypoints")
+    if not isinstance(waypoints, list) or not waypoints:
+        raise ProgramError("程序至少需要一个路点")
+
+    # 第一遍：把每个路点解析为关节目标（未指定的关节沿用上一个路点；
+    # 从未指定过的关节为 NaN，执行时保持当时的实际位置）
+    targets: list[np.ndarray] = []
+    cartesian: list[Optional[tuple[float, float, float]]] = []
+    durations: list[float] = []
+    previous = np.full(len(ARM_JOINTS), np.nan)
+    for i, waypoint in enumerate(waypoints):
+        where = f"路点 {i}"
+        kind = waypoint.get("type", "joint")
+        if kind not in WAYPOINT_TYPES:
+            raise ProgramError(f"{where}: 未知类型 {kind}")
+        duration = waypoint.get("duration")
+        if not isinstance(duration, (int, float)) or not 0 < duration <= MAX_SEGMENT_DURATION:
+            raise ProgramError(f"{where}: 时长必须在 (0, {MAX_SEGMENT_DURATION}] 秒内")
+
+        target = previous.copy()
+        pose = None
+        if kind == "joint":
+            positions = waypoint.get("positions") or {}
+            if not positions:
+                raise ProgramError(f"{where}: 关节路点缺少 positions")
+            for joint, value in positions.items():
+                value = _check_joint(joint, value, where)
+                target[ARM_JOINTS.index(joint)] = value
+        elif kind == "cartesian":
+            if kinematics is None:
+                raise ProgramError(f"{where}: 笛卡尔路点需要运动学模型（请先连接机器人）")
+            try:
+                pose = (float(waypoint["x"]), float(waypoint["y"]), float(waypoint.get("pitch", 0.0)))
+            except (KeyError, TypeError, ValueError):
+                raise ProgramError(f"{where}: 笛卡尔路点需要数值 x、y（pitch 可选）")
+            for joint in ["shoulder_pan", "wrist_roll", "gripper"]:
+                if joint in waypoint:
+                    target[ARM_JOINTS.index(joint)] = _check_joint(joint, waypoint[joint], where)
+            target = _solve_cartesian(kinematics, *pose, target, where)
+        elif i == 0:
+            raise ProgramError("第一个路点不能是 hold")
+
+        if i > 0:
+            missing = np.isnan(previous) & ~np.isnan(target)
+            if missing.any():
+                joints = [ARM_JOINTS[j] for j in np.flatnonzero(missing)]
+                raise ProgramError(f"{where}: 关节 {joints} 在后续路点中有目标，需在第一个路点中指定")
+        targets.append(target)
+        cartesian.append(pose)
+        durations.append(float(duration))
+        previous = target
+
+    total = sum(durations) * repeat
+    if total > MAX_PROGRAM_DURATION:
+        raise ProgramError(f"程序总时长 {total:.1f} 秒超过上限 {MAX_PROGRAM_DURATION} 秒")
+
+    # 第二遍：预插值第一个路点之后的各段
+    rows, segments = [], []
+    for i in range(1, len(targets)):
+        n = max(1, int(round(durations[i] * fps)))
+        s = min_jerk(np.arange(1, n + 1) / n)
+        if cartesian[i] is not None and cartesian[i - 1] is not None:
+            # 笛卡尔段：末端沿直线运动，每个采样点求逆解
+            start, end = np.array(cartesian[i - 1]), np.array(cartesian[i])
+            other = targets[i - 1] + (targets[i] - targets[i - 1]) * s[:, None]
+            segment = np.empty((n, len(ARM_JOINTS)))
+            for k in range(n):
+                x, y, pitch = start + (end - start) * s[k]
+                segment[k] = _solve_cartesian(kinematics, x, y, pitch, other[k], f"路点 {i}")
+        else:
+            segment = targets[i - 1] + (targets[i] - targets[i - 1]) * s[:, None]
+        rows.append(segment)
+        segments.append(np.full(n, i, dtype=np.int32))
+
+    trajectory = np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, len(ARM_JOINTS)), np.float32)
+    segment_index = np.concatenate(segments) if segments else np.zeros(0, dtype=np.int32)
+    final_cartesian = next((pose for pose in reversed(cartesian) if pose is not None), None)
+    return CompiledProgram(
+        name=name,
+        arm=arm,
+        repeat=repeat,
+        first_target=targets[0],
+        first_duration=durations[0],
+        trajectory=trajectory,
+        segment_index=segment_index,
+        num_waypoints=len(waypoints),
+        fps=fps,
+        final_cartesian=final_cartesian,
+    )
+
+
+class ProgramRunner(ActionSource):
+    """
+    运动程序动作源：控制线程每个周期取出预插值轨迹的一行
+
+    只输出 {arm}_arm_* 字段；暂停时保持在最后下发的位置。
+    结束（完成、中止或出错）后 done 为 True，由控制线程移除。
+    """
+
+    def __init__(self, controller: "RobotController", program: CompiledProgram,
+                 on_finish: Optional[Callable[["ProgramRunner"], None]] = None,
+                 priority: int = PROGRAM_PRIORITY):
+        super().__init__(f"program:{program.name}", priority)
+        self.controller = controller
+        self.program = program
+        self.on_finish = on_finish
+        self.prefix = program.arm
+        self.keys = [f"{self.prefix}_arm_{joint}.pos" for joint in ARM_JOINTS]
+
+        self.state = "idle"  # idle / running / paused / finished / aborted / error
+        self.error: Optional[str] = None
+        self.tick = 0  # 当前这一遍已执行的周期数
+        self.iteration = 0
+        self.last_target: Optional[np.ndarray] = None
+
+        self._approach: Optional[np.ndarray] = None
+        self._trajectory = program.trajectory
+        self._late_ticks_at_start = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_active(self) -> bool:
+        return self.state in ["running", "paused"]
+
+    @property
+    def done(self) -> bool:
+        return self.state in ["finished", "aborted", "error"]
+
+    @property
+    def needs_observation(self) -> bool:
+        return False
+
+    @property
+    def total_ticks(self) -> int:
+        return len(self._approach if self._approach is not None else []) + len(self.program.trajectory)
+
+    def start(self, observation: dict[str, Any]):
+        """从当前关节位置开始执行（observation 为启用时的观测值）"""
+        current = {joint: observation.get(key, 0.0) for joint, key in zip(ARM_JOINTS, self.keys)}
+        self._approach = self._build_approach(current)
+        # 程序中从未指定的关节整段保持开始时的位置
+        held = self._approach[-1]
+        self._trajectory = np.where(np.isnan(self.program.trajectory), held, self.program.trajectory)
+        self._late_ticks_at_start = self.controller.control_late_ticks
+        self.state = "running"
+        logger.info(f"开始执行运动程序 {self.program.name}（{self.program.arm}，{self.program.duration:.1f} 秒）")
+
+    def stop(self):
+        """从控制线程移除时调用：未结束的程序记为中止"""
+        with self._lock:
+            if self.is_active:
+                self.state = "aborted"
+        logger.info(f"运动程序 {self.program.name} 结束: {self.state}")
+        if self.on_finish:
+            self.on_finish(self)
+
+    def _build_approach(self, current: dict[str, float]) -> np.ndarray:
+        """接近段：从 current 到第一个路点（第一个路点未指定的关节保持当前值）"""
+        start = np.array([current.get(joint, 0.0) for joint in ARM_JOINTS], dtype=np.float64)
+        target = np.where(np.isnan(self.program.first_target), start, self.program.first_target)
+        n = max(1, int(round(self.program.first_duration * self.program.fps)))
+        s = min_jerk(np.arange(1, n + 1) / n)
+        return (start + (target - start) * s[:, None]).astype(np.float32)
+
+    def pause(self):
+        with self._lock:
+            if self.state == "running":
+                self.state = "paused"
+
+    def resume(self):
+        with self._lock:
+            if self.state == "paused":
+                self.state = "running"
+
+    def abort(self):
+        """中止（下一个控制周期起不再输出，随后由控制线程移除）"""
+        with self._lock:
+            if self.is_active:
+                self.state = "aborted"
+
+    def _row(self, tick: int) -> tuple[np.ndarray, int]:
+        """第 tick 个周期的关节目标与路点编号"""
+        if tick < len(self._approach):
+            return self._approach[tick], 0
+        i = tick - len(self._approach)
+        return self._trajectory[i], int(self.program.segment_index[i])
+
+    def compute(self, t: float, observation: Optional[dict[str, Any]],
+                frames: dict[str, np.ndarray]) -> Optional[dict[str, float]]:
+        with self._lock:
+            state = self.state
+        if state == "paused":
+            # 暂停时保持最后下发的位置，不让出机械臂
+            return dict(zip(self.keys, self.last_target.tolist())) if self.last_target is not None else None
+        if state != "running":
+            return None
+
+        try:
+            target, _ = self._row(self.tick)
+        except Exception as e:
+            logger.error(f"执行运动程序 {self.program.name} 时出错: {e}")
+            with self._lock:
+                self.state = "error"
+                self.error = str(e)
+            return None
+        self.last_target = target
+        self.tick += 1
+        if self.tick >= self.total_ticks:
+            self.iteration += 1
+            if self.iteration >= self.program.repeat:
+                with self._lock:
+                    if self.state == "running":
+                        self.state = "finished"
+            else:
+                # 下一遍：从最后一个路点接近第一个路点
+                self._approach = self._build_approach(dict(zip(ARM_JOINTS, target.tolist())))
+                self.tick = 0
+        return dict(zip(self.keys, target.tolist()))
+
+    def get_progress(self) -> dict[str, Any]:
+        """获取执行进度"""
+        total = self.total_ticks
+        tick = min(self.tick, max(total - 1, 0))
+        waypoint = self._row(tick)[1] if total and self._approach is not None else 0
+        return {
+            "name": self.program.name,
+            "arm": self.program.arm,
+            "state": self.state,
+            "error": self.error,
+            "iteration": self.iteration,
+            "repeat": self.program.repeat,
+            "waypoint": waypoint,
+            "waypoints": self.program.num_waypoints,
+            "progress": round(self.tick / total, 4) if total else 0.0,
+            "elapsed": round(self.tick / self.program.fps, 3),
+            "duration": round(total / self.program.fps, 3),
+            "late_ticks": self.controller.control_late_ticks - self._late_ticks_at_start,
+        }
+
+    def get_status(self) -> dict[str, Any]:
+        status = super().get_status()
+        status["program"] = self.get_progress()
+        return status
@@ -0,0 +1,181 @@
+"""
+配置持久化模块 - 去抖的后台写入（write-behind）+ 原子替换 + 有限备份轮转
+
+请求处理中只把配置序列化为 JSON 文本并登记为待写入（微秒级），后台线程在最后一次修改后
+等待 debounce 秒再写盘：界面上连续的多次编辑只产生一次磁盘写入，请求不会等待 fsync。
+
+写入时先写同目录的临时文件并 fsync，再用 os.replace 原子替换，进程崩溃或断电时
+文件要么是旧内容要么是新内容，不会出现写了一半的 JSON。每次真正写盘前把旧文件
+轮转为备份：<名称>.backup.json（最新）、<名称>.backup.2.json …，最多保留 backups 份。
+
+同一路径通过 get_store() 共用一个写入器。服务关闭时调用 flush_all() 把所有待写入的内容立即写盘（同时注册了 atexit）。
+"""
+import os
+import json
+import atexit
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_stores: dict[Path, "JsonFileStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class JsonFileStore:
+    """一个 JSON 配置文件的后台写入器"""
+
+    def __init__(self, path: Path, debounce: float = 0.5, backups: int = 3):
+        """
+        Args:
+            path: 配置文件路径
+            debounce: 最后一次修改后等待多久写盘（秒）
+            backups: 保留的备份份数（0 表示不备份）
+        """
+        self.path = Path(path)
+        self.debounce = debounce
+        self.backups = backups
+        self.writes = 0  # 实际写盘次数
+        self.saves = 0  # save() 调用次数
+        self.last_written: Optional[str] = None  # 最近一次写盘的内容（用于区分外部修改）
+
+        self._pending: Optional[str] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def backup_path(self, index: int = 1) -> Path:
+        """第 index 份备份的路径（1 为最新）"""
+        suffix = ".backup.json" if index == 1 else f".backup.{index}.json"
+        return self.path.with_name(self.path.stem + suffix)
+
+    def load(self) -> Optional[Any]:
+        """读取配置（有待写入的内容时返回待写入的版本），文件不存在时返回 None"""
+        with self._lock:
+            if self._pending is not None:
+                return json.loads(self._pending)
+        if not self.path.exists():
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, data: Any):
+        """
+        登记待写入的内容（立即序列化，调用方之后修改 data 不影响本次写入）
+
+        Raises:
+            TypeError / ValueError: data 无法序列化为 JSON
+        """
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        with self._lock:
+            self._pending = text
+            self.saves += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._writer_loop, name=f"store-{self.path.name}", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def _writer_loop(self):
+        while True:
+            # 去抖：debounce 秒内没有新的修改才写盘
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._wakeup.wait(self.debounce):
+                self._wakeup.clear()
+            self.flush()
+            with self._lock:
+                if self._pending is None and not self._wakeup.is_set():
+                    self._thread = None
+                    return
+
+    def flush(self) -> bool:
+        """立即写入待写入的内容，返回是否成功（没有待写入的内容时返回 True）"""
+        with self._write_lock:
+            with self._lock:
+                text, self._pending = self._pending, None
+            if text is None:
+                return True
+            try:
+                # 先登记再替换文件，检测外部修改的一方不会把本次写入误认为外部修改
+                self.last_written = text
+                self._write_atomic(text)
+                self.writes += 1
+                logger.info(f"配置已保存: {self.path}")
+                return True
+            except Exception as e:
+                logger.error(f"保存配置 {self.path} 失败: {e}")
+                with self._lock:
+                    # 写入失败时保留内容，下次修改或 flush 时重试（已有更新的内容则以新内容为准）
+                    if self._pending is None:
+                        self._pending = text
+                return False
+
+    def _write_atomic(self, text: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.path.exists() and self.backups > 0:
+                self._rotate_backups()
+            os.replace(tmp_name, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _rotate_backups(self):
+        """旧备份依次后移（超出份数的删除），当前文件成为最新备份"""
+        for index in range(self.backups, 1, -1):
+            older = self.backup_path(index - 1)
+            if older.exists():
+                os.replace(older, self.backup_path(index))
+        # 用硬链接保留当前文件，随后的 os.replace 不会修改它；不支持硬链接时退回复制
+        latest = self.backup_path(1)
+        try:
+            if latest.exists():
+                latest.unlink()
+            os.link(self.path, latest)
+        except OSError:
+            with open(self.path, "rb") as src, open(latest, "wb") as dst:
+                dst.write(src.read())
+
+    @property
+    def dirty(self) -> bool:
+        return self._pending is not None
+
+    def get_stats(self) -> dict[str, Any]:
+        return {"path": str(self.path), "saves": self.saves, "writes": self.writes, "dirty": self.dirty}
+
+
+def get_store(path: Path, debounce: float = 0.5, backups: int = 3) -> JsonFileStore:
+    """
+    获取某个文件的写入器（同一路径共用一个实例，重新创建使用者时不会读到尚未落盘的旧内容）
+    """
+    path = Path(path).expanduser().resolve()
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = JsonFileStore(path, debounce=debounce, backups=backups)
+        return store
+
+
+def flush_all():
+    """立即写入所有待写入的配置（服务关闭时调用）"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+
+atexit.register(flush_all)
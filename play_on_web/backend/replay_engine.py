@@ -0,0 +1,328 @@
+"""
+回合回放模块 - 按原始时间戳把录制的动作重新下发给机器人
+
+回合的各列以内存映射方式打开（见 episode_recorder.load_episode），
+启动时不读取任何数据：每个控制周期只用二分查找定位当前时刻，
+并读取上个周期以来的少量行，因此几 GB 的回合也能立即开始回放。
+
+回放在独立的控制循环线程中以 robot_fps 运行，支持变速、暂停、跳转和循环，
+并以每周期读取的观测值与上一周期下发的位置指令之差统计跟踪误差。
+开始和跳转时先从实际位置按最小加加速度曲线过渡到该时刻的关节目标，期间回放时钟不走。
+"""
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from config import settings
+from episode_recorder import BASE_ACTION_KEYS, load_episode
+from motion_program import min_jerk
+
+if TYPE_CHECKING:
+    from robot_controller import RobotController
+
+logger = logging.getLogger(__name__)
+
+# 跳转时向前回溯多少行以恢复各关节的目标位置
+SEEK_LOOKBACK_ROWS = 1000
+
+# 回放下发的动作在录制中的输入标签
+REPLAY_INPUT = "replay"
+
+# 过渡段最短时长（秒）
+APPROACH_MIN_DURATION = 0.2
+
+# 最小加加速度曲线的峰值速度 / 峰值加速度系数（相对 距离/T、距离/T²）
+MIN_JERK_PEAK_VELOCITY = 1.875
+MIN_JERK_PEAK_ACCELERATION = 5.774
+
+
+class ReplayEngine:
+    """回合回放控制循环"""
+
+    def __init__(self, controller: "RobotController", episode_dir: Path,
+                 speed: float = 1.0, loop: bool = False, fps: Optional[int] = None):
+        """
+        打开回合（内存映射，不加载数据）
+
+        Args:
+            controller: 机器人控制器（通过它下发动作和读取观测）
+            episode_dir: 回合目录
+            speed: 回放速度倍率
+            loop: 播放结束后是否从头循环
+            fps: 控制循环频率，默认 robot_fps
+        """
+        if speed <= 0:
+            raise ValueError(f"无效的回放速度: {speed}")
+
+        self.controller = controller
+        self.episode_dir = Path(episode_dir)
+        episode = load_episode(self.episode_dir, mmap=True)
+        self.meta = episode["meta"]
+        self.episode_id = self.meta.get("episode_id", self.episode_dir.name)
+        self.timestamps: np.ndarray = episode["timestamp"]
+        self.actions: np.ndarray = episode["action"]
+        self.action_keys: list[str] = self.meta["action_keys"]
+        if len(self.timestamps) == 0:
+            raise ValueError(f"回合 {self.episode_id} 没有数据")
+
+        self.t0 = float(self.timestamps[0])
+        self.duration = float(self.timestamps[-1]) - self.t0
+        self.speed = speed
+        self.loop = loop
+        self.period = 1.0 / (fps or settings.robot_fps)
+
+        self.state = "idle"  # idle / playing / paused / finished / stopped / error
+        self.error: Optional[str] = None
+        self.ticks = 0
+        self.late_ticks = 0
+        self.actions_sent = 0
+        self.loops_completed = 0
+
+        # 跟踪误差统计（观测位置 - 上一周期的位置指令）
+        self._last_command: dict[str, float] = {}
+        self._error_sq_sum = 0.0
+        self._error_count = 0
+        self._error_max = 0.0
+        self._joint_errors: dict[str, float] = {}
+
+        self._lock = threading.Lock()
+        self._position = 0.0  # 锚点时刻的回合内位置（秒）
+        self._anchor = time.monotonic()
+        self._cursor = 0  # 下一个尚未下发的行
+        self._seek_pending = True
+        self._approach: Optional[tuple[list[str], np.ndarray]] = None  # 过渡段（字段, 每周期一行）
+        self._approach_tick = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ==================== 播放控制 ====================
+
+    def start(self, position: float = 0.0):
+        """从 position 秒开始回放"""
+        self.seek(position)
+        with self._lock:
+            self._anchor = time.monotonic()
+            self.state = "playing"
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"replay-{self.episode_id}", daemon=True)
+        self._thread.start()
+        logger.info(f"开始回放回合 {self.episode_id}（{self.duration:.1f} 秒，{self.speed}x）")
+
+    def pause(self):
+        with self._lock:
+            if self.state == "playing":
+                self._position = self._current_position(time.monotonic())
+                self.state = "paused"
+        # 暂停时底盘停止，机械臂保持在当前指令位置
+        self._send({key: 0.0 for key in BASE_ACTION_KEYS})
+
+    def resume(self):
+        with self._lock:
+            if self.state == "paused":
+                self._anchor = time.monotonic()
+                self.state = "playing"
+
+    def seek(self, position: float):
+        """跳转到回合内 position 秒（下一周期起先从实际位置过渡到该时刻的关节目标位置）"""
+        position = min(max(position, 0.0), self.duration)
+        with self._lock:
+            self._position = position
+            self._anchor = time.monotonic()
+            self._cursor = self._index_at(position)
+            self._seek_pending = True
+
+    def set_speed(self, speed: float):
+        if speed <= 0:
+            raise ValueError(f"无效的回放速度: {speed}")
+        with self._lock:
+            now = time.monotonic()
+            self._position = self._current_position(now)
+            self._anchor = now
+            self.speed = speed
+
+    def stop(self):
+        """停止回放并让底盘停下"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        with self._lock:
+            if self.state in ["playing", "paused"]:
+                self.state = "stopped"
+
+    @property
+    def is_active(self) -> bool:
+        return self.state in ["playing", "paused"]
+
+    # ==================== 控制循环 ====================
+
+    def _current_position(self, now: float) -> float:
+        """当前回合内位置（调用时持有 self._lock）"""
+        if self.state != "playing":
+            return self._position
+        return self._position + (now - self._anchor) * self.speed
+
+    def _index_at(self, position: float) -> int:
+        """第一个时间戳晚于 position 的行（在内存映射上二分查找）"""
+        return int(np.searchsorted(self.timestamps, self.t0 + position, side="right"))
+
+    def _run(self):
+        next_tick = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                if now - next_tick > self.period:
+                    # 落后超过一个周期：计数后从当前时刻重新对齐，不补发
+                    self.late_ticks += 1
+                    next_tick = now
+                self._tick(now)
+                self.ticks += 1
+
+                next_tick += self.period
+                self._stop_event.wait(max(0.0, next_tick - time.monotonic()))
+        except Exception as e:
+            logger.error(f"回放回合 {self.episode_id} 时出错: {e}")
+            with self._lock:
+                self.state = "error"
+                self.error = str(e)
+        finally:
+            try:
+                self._send({key: 0.0 for key in BASE_ACTION_KEYS})
+            except Exception as e:
+                logger.error(f"回放结束时停止底盘失败: {e}")
+        logger.info(f"回合 {self.episode_id} 回放结束: {self.state}")
+
+    def _tick(self, now: float):
+        """一个控制周期：统计跟踪误差 → 下发过渡段或到期的动作"""
+        sample = self.controller.sample_observation()
+        if sample is not None:
+            self._update_tracking_error(sample[0])
+
+        with self._lock:
+            if self.state != "playing":
+                return
+            if self._seek_pending:
+                self._seek_pending = False
+                self._approach = self._build_approach(sample[0] if sample else {}, self._state_at(self._cursor))
+                self._approach_tick = 0
+            if self._approach is not None:
+                # 过渡中回放时钟不走
+                self._anchor = now
+                keys, rows = self._approach
+                action = dict(zip(keys, rows[self._approach_tick].tolist()))
+                self._approach_tick += 1
+                if self._approach_tick >= len(rows):
+                    self._approach = None
+            else:
+                action = None
+                position = self._current_position(now)
+                start = self._cursor
+                end = self._index_at(min(position, self.duration))
+                self._cursor = end
+
+        if action is not None:
+            self._send(action)
+            return
+
+        action = self._merge_rows(start, end)
+        if action:
+            self._send(action)
+
+        if position >= self.duration:
+            if self.loop:
+                self.loops_completed += 1
+                self.seek(0.0)
+            else:
+                with self._lock:
+                    self.state = "finished"
+                self._stop_event.set()
+
+    def _merge_rows(self, start: int, end: int) -> dict[str, float]:
+        """合并 [start, end) 行：每个字段取最后一个非 NaN 值"""
+        if end <= start:
+            return {}
+        block = np.asarray(self.actions[start:end])
+        valid = ~np.isnan(block)
+        last = block.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+        has_value = valid.any(axis=0)
+        return {
+            self.action_keys[j]: float(block[last[j], j])
+            for j in np.flatnonzero(has_value)
+        }
+
+    def _state_at(self, end: int) -> dict[str, float]:
+        """跳转后恢复 end 之前各关节最后的目标位置（底盘速度不恢复，保持停止）"""
+        action = self._merge_rows(max(0, end - SEEK_LOOKBACK_ROWS), end)
+        action = {key: value for key, value in action.items() if key.endswith(".pos")}
+        action.update({key: 0.0 for key in BASE_ACTION_KEYS})
+        return action
+
+    def _build_approach(self, current: dict[str, Any], target: dict[str, float]) -> tuple[list[str], np.ndarray]:
+        """
+        过渡段：从 current 到 target 的最小加加速度曲线（底盘速度保持为 0）
+
+        时长按最大关节位移和 arm_max_velocity / arm_max_acceleration 确定；
+        观测中没有的关节直接取目标值。
+        """
+        keys = list(target)
+        goal = np.array([target[key] for key in keys], dtype=np.float64)
+        start = np.array([
+            float(current[key]) if key.endswith(".pos") and current.get(key) is not None else target[key]
+            for key in keys
+        ], dtype=np.float64)
+        distance = float(np.max(np.abs(goal - start))) if keys else 0.0
+        duration = max(
+            APPROACH_MIN_DURATION,
+            MIN_JERK_PEAK_VELOCITY * distance / settings.arm_max_velocity,
+            (MIN_JERK_PEAK_ACCELERATION * distance / settings.arm_max_acceleration) ** 0.5,
+        )
+        n = max(1, int(round(duration / self.period)))
+        s = min_jerk(np.arange(1, n + 1) / n)
+        return keys, start + (goal - start) * s[:, None]
+
+    def _send(self, action: dict[str, float]):
+        self.controller._send_action(action, REPLAY_INPUT)
+        self.actions_sent += 1
+        for key, value in action.items():
+            if key.endswith(".pos"):
+                self._last_command[key] = value
+
+    def _update_tracking_error(self, obs: dict[str, Any]):
+        for key, command in self._last_command.items():
+            observed = obs.get(key)
+            if observed is None:
+                continue
+            error = float(observed) - command
+            self._joint_errors[key] = error
+            self._error_sq_sum += error * error
+            self._error_count += 1
+            self._error_max = max(self._error_max, abs(error))
+
+    def get_status(self) -> dict[str, Any]:
+        """获取回放状态"""
+        with self._lock:
+            position = min(self._current_position(time.monotonic()), self.duration)
+        rms = (self._error_sq_sum / self._error_count) ** 0.5 if self._error_count else 0.0
+        return {
+            "episode_id": self.episode_id,
+            "state": self.state,
+            "error": self.error,
+            "position": round(position, 3),
+            "duration": round(self.duration, 3),
+            "frames": len(self.timestamps),
+            "speed": self.speed,
+            "loop": self.loop,
+            "loops_completed": self.loops_completed,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "actions_sent": self.actions_sent,
+            "tracking_error": {
+                "rms": round(rms, 3),
+                "max": round(self._error_max, 3),
+                "joints": {key: round(value, 3) for key, value in self._joint_errors.items()},
+            },
+        }
@@ -2,14 +2,30 @@
 机器人控制模块 - 核心控制逻辑
 """
 import sys
+import time
+import bisect
 import logging
+import threading
 import numpy as np
-import json
+from collections import deque
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, NamedTuple, Optional, TYPE_CHECKING
 from dataclasses import dataclass
 
-from keymap_manager import KeymapManager
+from config import settings
+from keymap_manager import get_keymap_manager, ACTION_IDS, ACTION_LIST
+from episode_recorder import EpisodeRecorder, BASE_ACTION_KEYS
+from replay_engine import ReplayEngine
+from motion_program import ARM_JOINTS, CompiledProgram, ProgramError, ProgramRunner, compile_program
+from telemetry import TelemetryHistory
+from persistence import get_store
+from setpoint_interpolator import SetpointInterpolator
+from action_sources import (
+    TELEOP_SOURCE, ActionSource, ProcessActionSource, SinusoidSource, TeleopSource, arbitrate,
+)
+
+if TYPE_CHECKING:
+    from camera_manager import CameraManager
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +79,69 @@ class HeadState:
             }
 
 
+class KeyDispatch(NamedTuple):
+    """编译后的按键动作"""
+    category: str  # left_arm / right_arm / base
+    action: str  # 动作名（用作录制的输入标签）
+    target: str  # 关节名、"x"、"y"、"pitch"、"reset" 或底盘方向
+    delta: float  # 每次按键的增量（度或米）
+    needs_ik: bool  # 是否需要重新求逆解
+
+
+class ObservationHistory:
+    """
+    带时间戳的观测值短历史（time.monotonic()），用于按时间对齐查询
+
+    时间戳取 get_observation() 调用的中点，作为该观测的近似采样时刻。
+    """
+
+    def __init__(self, maxlen: int = 256):
+        self._samples: deque[tuple[float, dict[str, Any]]] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, obs: dict[str, Any]):
+        with self._lock:
+            self._samples.append((timestamp, obs))
+
+    def latest(self) -> Optional[tuple[float, dict[str, Any]]]:
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def interpolate(self, t: float, max_gap: float = 0.25) -> Optional[tuple[dict[str, Any], float]]:
+        """
+        获取 t 时刻的观测值：两侧都有样本且间隔不超过 max_gap 时对数值字段线性插值，
+        否则取最近样本
+
+        Returns:
+            (观测值, 偏差秒数)；偏差为 t 与最近真实样本的时间差，无样本时返回 None
+        """
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return None
+
+        times = [ts for ts, _ in samples]
+        i = bisect.bisect_left(times, t)
+        if i == 0 or i == len(samples):
+            ts, obs = samples[0] if i == 0 else samples[-1]
+            return dict(obs), abs(t - ts)
+
+        (t0, obs0), (t1, obs1) = samples[i - 1], samples[i]
+        if t1 - t0 > max_gap:
+            ts, obs = (t0, obs0) if t - t0 <= t1 - t else (t1, obs1)
+            return dict(obs), abs(t - ts)
+        alpha = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+        nearest = obs0 if alpha < 0.5 else obs1
+        result = {}
+        for key, value in nearest.items():
+            v0, v1 = obs0.get(key), obs1.get(key)
+            if isinstance(v0, (int, float)) and isinstance(v1, (int, float)):
+                result[key] = v0 + (v1 - v0) * alpha
+            else:
+                result[key] = value
+        return result, min(t - t0, t1 - t)
+
+
 class RobotController:
     """机器人控制器"""
     
@@ -107,12 +186,71 @@ class RobotController:
         
         self._is_connected = False
 
+        # 总线锁：遥操作处理与回放控制循环可能在不同线程中访问舵机总线
+        self._bus_lock = threading.RLock()
+
+        # 带时间戳的观测历史（用于相机/观测对齐快照）
+        self.observation_history = ObservationHistory()
+
+        # 回合录制器（控制线程每个周期记录一行：该周期的观测值及期间下发的动作）
+        self.recorder = EpisodeRecorder(
+            Path(settings.recordings_dir),
+            capacity=settings.recording_buffer_size,
+            flush_rows=settings.recording_flush_rows,
+        )
+        self._record_action: dict[str, Any] = {}  # 本周期内已下发、尚未录制的动作字段
+        self._record_input: tuple[Optional[str], float] = (None, 0.0)
+        self._record_lock = threading.Lock()
+
+        # 最近 N 秒的观测与指令历史（总线出错时自动转储）
+        self.telemetry = TelemetryHistory(
+            seconds=settings.telemetry_history_seconds,
+            max_rate=settings.telemetry_max_rate,
+            dump_dir=Path(settings.telemetry_dump_dir),
+            dump_min_interval=settings.telemetry_dump_min_interval,
+        )
+
+        # 当前回放（同一时间只有一个）
+        self.replay: Optional[ReplayEngine] = None
+
+        # 机械臂设定值插值：控制线程按控制频率让两臂平滑跟随 target_positions
+        self._servo_keys = [f"{prefix}_arm_{joint}" for prefix in ["left", "right"] for joint in ARM_JOINTS]
+        self.interpolator: Optional[SetpointInterpolator] = None
+        if settings.setpoint_interpolation:
+            self.interpolator = SetpointInterpolator(
+                len(self._servo_keys),
+                max_velocity=settings.arm_max_velocity,
+                max_acceleration=settings.arm_max_acceleration,
+                dt=1.0 / settings.robot_fps,
+            )
+        self._servo_input: Optional[tuple[str, float]] = None  # 尚未随指令记录的遥操作输入
+        self._servo_lock = threading.Lock()
+
+        # 动作源（遥操作、脚本、策略）：控制线程每个周期按优先级仲裁各动作源的输出
+        self.teleop_source = TeleopSource(self)
+        self.action_sources: dict[str, ActionSource] = {TELEOP_SOURCE: self.teleop_source}
+        self._sources_lock = threading.Lock()
+        self.camera_manager: Optional["CameraManager"] = None  # 由 main 注入，用于向动作源提供相机帧
+        self.control_late_ticks = 0
+        self._control_stop = threading.Event()
+        self._control_thread: Optional[threading.Thread] = None
+
+        # 已上传的运动程序（名称 → 预插值结果）及当前执行
+        self.programs: dict[str, CompiledProgram] = {}
+        self.program_runner: Optional[ProgramRunner] = None
+
         # 加载复位位置配置
+        self._reset_store = get_store(
+            RESET_POSITION_CONFIG, debounce=settings.config_write_debounce, backups=settings.config_backups
+        )
         self.reset_positions = self._load_reset_positions()
 
-        # 初始化键位映射管理器
-        self.keymap_manager = KeymapManager()
-        logger.info(f"键位映射管理器已初始化，当前预设: {self.keymap_manager.current_profile}")
+        # 键位映射管理器（进程内共享，切换 / 编辑预设由 /api/keymap 端点直接操作）
+        self.keymap_manager = get_keymap_manager()
+
+        # 按键动作分发表（动作编号 → KeyDispatch）
+        self._dispatch: list[Optional[KeyDispatch]] = []
+        self._build_dispatch_table()
     
     def connect(self) -> dict[str, Any]:
         """连接机器人"""
@@ -150,13 +288,17 @@ class RobotController:
             self.kinematics_right = SO101Kinematics()
             
             # 获取初始观测值
-            obs = self.robot.get_observation()
+            obs = self._read_observation()
+            self.telemetry.commands.set_keys(
+                [key for key in self.telemetry.observations.keys if key.endswith(".pos")] + BASE_ACTION_KEYS
+            )
             
             # 初始化状态（从实际观测值）
             self._init_arm_state(self.left_arm_state, obs, "left")
             self._init_arm_state(self.right_arm_state, obs, "right")
             
             self._is_connected = True
+            self._start_control_loop()
             
             logger.info("机器人连接成功")
             return {
@@ -174,6 +316,16 @@ class RobotController:
     def disconnect(self) -> dict[str, Any]:
         """断开机器人连接"""
         try:
+            if self.replay:
+                self.replay.stop()
+                self.replay = None
+            self._stop_control_loop()
+            # 运动程序也是动作源，在这里一并中止
+            for name in [name for name in self.action_sources if name != TELEOP_SOURCE]:
+                self.remove_action_source(name)
+            self.program_runner = None
+            if self.recorder.is_recording:
+                self.recorder.stop()
             if self.robot and self._is_connected:
                 self.robot.disconnect()
                 self._is_connected = False
@@ -190,6 +342,75 @@ class RobotController:
                 "message": str(e)
             }
     
+    def _read_observation(self) -> dict[str, Any]:
+        """读取观测值，并以调用中点为时间戳记入观测历史"""
+        return self._read_observation_stamped()[0]
+
+    def _read_observation_stamped(self) -> tuple[dict[str, Any], float]:
+        """读取观测值，返回 (观测值, 时间戳)"""
+        with self._bus_lock:
+            start = time.monotonic()
+            try:
+                obs = self.robot.get_observation()
+            except Exception as e:
+                self.telemetry.dump("get_observation", e)
+                raise
+            timestamp = (start + time.monotonic()) / 2
+        self.observation_history.append(timestamp, obs)
+        self.telemetry.record_observation(timestamp, obs)
+        return obs, timestamp
+
+    def _send_action(self, action: dict[str, Any], teleop_input: Optional[str] = None,
+                     input_value: float = 0.0):
+        """
+        下发动作（所有动作都经过这里），录制中时并入本周期待录制的动作
+
+        Args:
+            action: 传给 robot.send_action 的动作字典
+            teleop_input: 触发该动作的遥操作输入，如 "left:x+"、"base:forward"
+            input_value: 输入的数值
+        """
+        self.telemetry.record_command(time.monotonic(), action)
+        with self._bus_lock:
+            try:
+                self.robot.send_action(action)
+            except Exception as e:
+                self.telemetry.dump("send_action", e)
+                raise
+        if self.recorder.is_recording:
+            with self._record_lock:
+                self._record_action.update(action)
+                if teleop_input is not None:
+                    self._record_input = (teleop_input, input_value)
+
+    def _record_tick(self, t: float, observation: Optional[dict[str, Any]]):
+        """
+        录制一个控制周期：观测值取本周期读到的（没有任何路径读总线时由这里读取），
+        动作为本周期内各路径下发的字段合并，空闲周期也记录一行
+        """
+        with self._record_lock:
+            action, self._record_action = self._record_action, {}
+            (teleop_input, input_value), self._record_input = self._record_input, (None, 0.0)
+        if observation is None:
+            latest = self.observation_history.latest()
+            observation = latest[1] if latest is not None and latest[0] >= t else self._read_observation()
+        self.recorder.record(t, observation, action or None, teleop_input, input_value)
+
+    def sample_observation(self) -> Optional[tuple[dict[str, Any], float]]:
+        """
+        读取一次新的观测值（同时记入观测历史）
+
+        Returns:
+            (观测值, 时间戳)；未连接或读取失败时返回 None
+        """
+        if not self._is_connected:
+            return None
+        try:
+            return self._read_observation_stamped()
+        except Exception as e:
+            logger.error(f"读取观测值时出错: {e}")
+            return None
+
     def _init_arm_state(self, arm_state: ArmState, obs: dict, prefix: str):
         """初始化机械臂状态"""
         arm_state.target_positions = {
@@ -212,24 +433,24 @@ class RobotController:
             if not self._is_connected:
                 return {"status": "error", "message": "机器人未连接"}
             
-            actions = {}
+            arms = []
             
             if arm in ["left", "both"]:
                 self.left_arm_state.current_x = 0.1629
                 self.left_arm_state.current_y = 0.1131
                 self.left_arm_state.pitch = 0.0
                 self.left_arm_state.target_positions = {k: 0.0 for k in self.left_arm_state.target_positions}
-                actions.update(self._get_arm_action(self.left_arm_state, "left"))
+                arms.append("left")
             
             if arm in ["right", "both"]:
                 self.right_arm_state.current_x = 0.1629
                 self.right_arm_state.current_y = 0.1131
                 self.right_arm_state.pitch = 0.0
                 self.right_arm_state.target_positions = {k: 0.0 for k in self.right_arm_state.target_positions}
-                actions.update(self._get_arm_action(self.right_arm_state, "right"))
+                arms.append("right")
             
             # 发送动作
-            self.robot.send_action(actions)
+            self._command_arms(arms, f"zero:{arm}")
             
             return {
                 "status": "success",
@@ -239,9 +460,138 @@ class RobotController:
             logger.error(f"移动到零位时出错: {e}")
             return {"status": "error", "message": str(e)}
     
+    def _command_arms(self, arms: list[str], teleop_input: str, input_value: float = 0.0):
+        """
+        让机械臂跟随 target_positions
+
+        开启设定值插值时由控制线程在下一个周期开始平滑移动（输入标签随第一条指令记录），
+        否则立即下发一次 P 控制指令。
+        """
+        if self.interpolator is not None and self._control_thread is not None:
+            with self._servo_lock:
+                self._servo_input = (teleop_input, input_value)
+            return
+
+        actions = {}
+        for arm in arms:
+            actions.update(self._get_arm_action(self.left_arm_state if arm == "left" else self.right_arm_state, arm))
+        self._send_action(actions, teleop_input, input_value)
+
+    def _start_control_loop(self):
+        self._control_stop.clear()
+        self._control_thread = threading.Thread(target=self._control_loop, name="control-loop", daemon=True)
+        self._control_thread.start()
+
+    def _stop_control_loop(self):
+        if self._control_thread is None:
+            return
+        self._control_stop.set()
+        self._control_thread.join(timeout=2.0)
+        self._control_thread = None
+
+    def _control_loop(self):
+        """控制线程：按控制频率运行各动作源并仲裁下发（回放期间让出控制）"""
+        period = 1.0 / settings.robot_fps
+        next_tick = time.monotonic()
+        resync = True
+        while not self._control_stop.is_set():
+            now = time.monotonic()
+            if now - next_tick > period:
+                self.control_late_ticks += 1
+                next_tick = now
+            try:
+                observation = None
+                if self.replay and self.replay.is_active:
+                    resync = True
+                else:
+                    if resync:
+                        self._resync_control()
+                        resync = False
+                    observation = self._control_tick(now)
+                if self.recorder.is_recording:
+                    self._record_tick(now, observation)
+            except Exception as e:
+                logger.error(f"控制周期出错: {e}")
+                resync = True
+            next_tick += period
+            self._control_stop.wait(max(0.0, next_tick - time.monotonic()))
+
+    def _resync_control(self):
+        """从实际位置重新开始插值（启动时、回放结束后、出错后），目标也置为实际位置"""
+        obs = self._read_observation()
+        self._init_arm_state(self.left_arm_state, obs, "left")
+        self._init_arm_state(self.right_arm_state, obs, "right")
+        if self.interpolator is not None:
+            self.interpolator.reset(self._servo_targets())
+
+    def _servo_targets(self) -> np.ndarray:
+        return np.array([
+            state.target_positions[joint]
+            for state in [self.left_arm_state, self.right_arm_state]
+            for joint in ARM_JOINTS
+        ])
+
+    def _control_tick(self, t: float) -> Optional[dict[str, Any]]:
+        """一个控制周期：各动作源计算 → 按优先级合并 → 下发，返回本周期读取的观测值"""
+        with self._sources_lock:
+            sources = list(self.action_sources.values())
+
+        observation = None
+        if any(source.needs_observation for source in sources):
+            observation = self._read_observation()
+        frames = self._latest_frames({name for source in sources for name in source.cameras})
+
+        results = []
+        for source in sources:
+            try:
+                action = source.compute(t, observation, frames)
+            except Exception as e:
+                source.errors += 1
+                if source.errors == 1:
+                    logger.error(f"动作源 {source.name} 计算出错: {e}")
+                continue
+            if action:
+                source.ticks += 1
+                results.append((source, action))
+
+        # 已结束的动作源（如执行完毕的运动程序）在输出最后一个动作后移除
+        for source in sources:
+            if source.done:
+                self.remove_action_source(source.name)
+
+        with self._servo_lock:
+            pending, self._servo_input = self._servo_input, None
+        if not results:
+            return observation
+
+        action, owners = arbitrate(results)
+        # 遥操作跟随其他动作源下发的关节位置，操作员接管时不会跳回旧目标
+        self.teleop_source.follow({key: value for key, value in action.items() if owners[key] != TELEOP_SOURCE})
+
+        others = sorted(set(owners.values()) - {TELEOP_SOURCE})
+        if pending and len(others) < len(set(owners.values())):
+            teleop_input, input_value = pending
+        elif others:
+            teleop_input, input_value = f"source:{'+'.join(others)}", 0.0
+        else:
+            teleop_input, input_value = None, 0.0
+        self._send_action(action, teleop_input, input_value)
+        return observation
+
+    def _latest_frames(self, cameras: set[str]) -> dict[str, np.ndarray]:
+        """各相机共享缓冲中的最新帧（不等待新帧）"""
+        frames = {}
+        if not cameras or self.camera_manager is None:
+            return frames
+        for name in cameras:
+            packet = self.camera_manager.get_latest_packet(name)
+            if packet is not None:
+                frames[name] = packet.image
+        return frames
+
     def _get_arm_action(self, arm_state: ArmState, prefix: str) -> dict[str, float]:
         """获取机械臂动作（P控制）"""
-        obs = self.robot.get_observation()
+        obs = self._read_observation()
         joint_map = self.left_joint_map if prefix == "left" else self.right_joint_map
         
         current = {j: obs[f"{prefix}_arm_{j}.pos"] for j in joint_map}
@@ -254,53 +604,77 @@ class RobotController:
         
         return action
     
+    def _build_dispatch_table(self):
+        """
+        编译按键动作分发表：动作编号 → 预先算好的 (目标字段, 增量, 是否需要逆解)
+
+        增量取决于各臂的步长等级，因此在初始化和 set_step_level 时重建；
+        按键 → 动作编号的映射由 KeymapManager 在切换 / 更新预设时重建。
+        """
+        table: list[Optional[KeyDispatch]] = [None] * (len(ACTION_LIST) + 1)
+        for action_id, (category, action) in enumerate(ACTION_LIST, start=1):
+            if category == "base" or action == "reset":
+                table[action_id] = KeyDispatch(category, action, action, 0.0, False)
+                continue
+            arm_state = self.left_arm_state if category == "left_arm" else self.right_arm_state
+            target, sign = action[:-1], 1.0 if action.endswith("+") else -1.0
+            needs_ik = target in ["x", "y"]
+            step = arm_state.xy_step if needs_ik else arm_state.degree_step
+            table[action_id] = KeyDispatch(category, action, target, sign * step, needs_ik)
+        self._dispatch = table
+
+    def _resolve_action_id(self, key_action: dict[str, Any]) -> int:
+        """
+        解析动作编号，支持三种形式：
+        {"id": 7}、{"key": "W"}（按当前预设的反向键位映射）、{"arm": "left", "action": "x+"}
+        """
+        if "id" in key_action:
+            return int(key_action["id"])
+        if "key" in key_action:
+            return self.keymap_manager.get_key_action_id(str(key_action["key"])) or 0
+        arm = key_action.get("arm")
+        category = arm if arm in ["left_arm", "right_arm", "base"] else f"{arm}_arm"
+        return ACTION_IDS.get((category, key_action.get("action")), 0)
+
     def handle_keyboard_action(self, key_action: dict[str, Any]) -> dict[str, Any]:
         """
-        处理键盘动作
+        处理键盘动作（动作编号 → 分发表一次查找）
         
         Args:
-            key_action: 键盘动作字典，包含 arm, action, value 等
+            key_action: 键盘动作字典，包含 id、key 或 arm + action，以及可选的 value
         """
         try:
             if not self._is_connected:
                 return {"status": "error", "message": "机器人未连接"}
             
-            arm = key_action.get("arm")  # "left" 或 "right"
-            action_type = key_action.get("action")
-            value = key_action.get("value", 1.0)
+            action_id = self._resolve_action_id(key_action)
+            entry = self._dispatch[action_id] if 0 < action_id < len(self._dispatch) else None
+            if entry is None:
+                return {"status": "error", "message": f"未知的键盘动作: {key_action}"}
+            
+            if entry.category == "base":
+                return self.handle_base_action({"direction": entry.target})
+            
+            arm = "left" if entry.category == "left_arm" else "right"
+            busy = self._autonomous_busy(arm)
+            if busy:
+                return {"status": "error", "message": busy}
+            if entry.target == "reset":
+                return self.move_to_zero_position(arm)
             
+            value = key_action.get("value", 1.0)
             arm_state = self.left_arm_state if arm == "left" else self.right_arm_state
-            kinematics = self.kinematics_left if arm == "left" else self.kinematics_right
-            
-            # 处理不同的动作类型
-            if action_type == "shoulder_pan+":
-                arm_state.target_positions["shoulder_pan"] += arm_state.degree_step
-            elif action_type == "shoulder_pan-":
-                arm_state.target_positions["shoulder_pan"] -= arm_state.degree_step
-            elif action_type == "wrist_roll+":
-                arm_state.target_positions["wrist_roll"] += arm_state.degree_step
-            elif action_type == "wrist_roll-":
-                arm_state.target_positions["wrist_roll"] -= arm_state.degree_step
-            elif action_type == "gripper+":
-                arm_state.target_positions["gripper"] += arm_state.degree_step
-            elif action_type == "gripper-":
-                arm_state.target_positions["gripper"] -= arm_state.degree_step
-            elif action_type == "pitch+":
-                arm_state.pitch += arm_state.degree_step
-            elif action_type == "pitch-":
-                arm_state.pitch -= arm_state.degree_step
-            elif action_type == "x+":
-                arm_state.current_x += arm_state.xy_step
-                self._update_ik(arm_state, kinematics)
-            elif action_type == "x-":
-                arm_state.current_x -= arm_state.xy_step
-                self._update_ik(arm_state, kinematics)
-            elif action_type == "y+":
-                arm_state.current_y += arm_state.xy_step
-                self._update_ik(arm_state, kinematics)
-            elif action_type == "y-":
-                arm_state.current_y -= arm_state.xy_step
-                self._update_ik(arm_state, kinematics)
+            
+            if entry.target == "x":
+                arm_state.current_x += entry.delta
+            elif entry.target == "y":
+                arm_state.current_y += entry.delta
+            elif entry.target == "pitch":
+                arm_state.pitch += entry.delta
+            else:
+                arm_state.target_positions[entry.target] += entry.delta
+            if entry.needs_ik:
+                self._update_ik(arm_state, self.kinematics_left if arm == "left" else self.kinematics_right)
             
             # 更新 wrist_flex（耦合关系）
             arm_state.target_positions["wrist_flex"] = (
@@ -310,11 +684,10 @@ class RobotController:
             )
             
             # 获取动作并发送
-            action = self._get_arm_action(arm_state, arm)
-            self.robot.send_action(action)
+            self._command_arms([arm], f"{arm}:{entry.action}", value)
             
             # 获取最新观测
-            obs = self.robot.get_observation()
+            obs = self._read_observation()
             
             return {
                 "status": "success",
@@ -323,7 +696,39 @@ class RobotController:
         except Exception as e:
             logger.error(f"处理键盘动作时出错: {e}")
             return {"status": "error", "message": str(e)}
-    
+
+    def handle_key_event(self, event: dict[str, Any]) -> dict[str, Any]:
+        """
+        处理紧凑的按键消息：按下时分发动作，松开底盘按键时停止底盘
+
+        Args:
+            event: {"id": 动作编号} 或 {"key": 按键}，松开时带 "up": true
+        """
+        if not event.get("up"):
+            return self.handle_keyboard_action(event)
+        try:
+            action_id = self._resolve_action_id(event)
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "message": f"无效的动作编号: {e}"}
+        if 0 < action_id < len(self._dispatch) and self._dispatch[action_id].category == "base":
+            return self.stop_base()
+        return {"status": "success"}
+
+    def _autonomous_busy(self, part: Optional[str] = None) -> Optional[str]:
+        """
+        回放或运动程序占用时拒绝遥操作，返回原因
+
+        Args:
+            part: "left" / "right" / "base"，只检查该部位是否被占用；None 表示整机
+                  （回放占用整机，运动程序只占用所控制的机械臂）
+        """
+        if self.replay and self.replay.is_active:
+            return "正在回放，请先停止回放"
+        runner = self.program_runner
+        if runner and runner.is_active and part in [None, runner.program.arm]:
+            return f"正在执行运动程序 {runner.program.name}，请先中止"
+        return None
+
     def _update_ik(self, arm_state: ArmState, kinematics):
         """更新逆运动学解"""
         try:
@@ -373,6 +778,8 @@ class RobotController:
                 self.right_arm_state.step_level = level
                 arms_updated.append("右臂")
             
+            self._build_dispatch_table()
+            
             message = f"{' 和 '.join(arms_updated)}步长已设置为 {level}"
             logger.info(message)
             
@@ -396,6 +803,10 @@ class RobotController:
             if not self._is_connected:
                 return {"status": "error", "message": "机器人未连接"}
             
+            busy = self._autonomous_busy("base")
+            if busy:
+                return {"status": "error", "message": busy}
+            
             # 将底盘动作转换为键盘按键
             direction = base_action.get("direction")  # forward, backward, left, right, rotate_left, rotate_right
             
@@ -417,10 +828,10 @@ class RobotController:
             action = self.robot._from_keyboard_to_base_action(keyboard_keys) or {}
             
             if action:
-                self.robot.send_action(action)
+                self._send_action(action, f"base:{direction}")
             
             # 获取最新观测
-            obs = self.robot.get_observation()
+            obs = self._read_observation()
             
             return {
                 "status": "success",
@@ -446,7 +857,7 @@ class RobotController:
                 "theta.vel": 0.0
             }
             
-            self.robot.send_action(stop_action)
+            self._send_action(stop_action, "base:stop")
             logger.debug("底盘已停止")
             
             return {
@@ -463,7 +874,7 @@ class RobotController:
             if not self._is_connected:
                 return {"status": "error", "message": "机器人未连接"}
             
-            obs = self.robot.get_observation()
+            obs = self._read_observation()
             
             return {
                 "status": "success",
@@ -476,9 +887,8 @@ class RobotController:
     def _load_reset_positions(self) -> dict[str, dict[str, float]]:
         """从配置文件加载复位位置"""
         try:
-            if RESET_POSITION_CONFIG.exists():
-                with open(RESET_POSITION_CONFIG, 'r', encoding='utf-8') as f:
-                    positions = json.load(f)
+            if RESET_POSITION_CONFIG.exists() or self._reset_store.dirty:
+                positions = self._reset_store.load()
                 logger.info(f"已加载复位位置配置: {positions}")
                 return positions
             else:
@@ -507,15 +917,10 @@ class RobotController:
             return {}
     
     def _save_reset_positions(self) -> bool:
-        """保存复位位置到配置文件"""
+        """保存复位位置到配置文件（后台去抖写入，原子替换）"""
         try:
-            # 确保目录存在
-            RESET_POSITION_CONFIG.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(RESET_POSITION_CONFIG, 'w', encoding='utf-8') as f:
-                json.dump(self.reset_positions, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"复位位置已保存到: {RESET_POSITION_CONFIG}")
+            self._reset_store.save(self.reset_positions)
+            logger.info(f"复位位置将保存到: {RESET_POSITION_CONFIG}")
             return True
         except Exception as e:
             logger.error(f"保存复位位置配置失败: {e}")
@@ -532,7 +937,7 @@ class RobotController:
             if not self._is_connected:
                 return {"status": "error", "message": "机器人未连接"}
             
-            obs = self.robot.get_observation()
+            obs = self._read_observation()
             recorded_arms = []
             
             if arm in ["left", "both"]:
@@ -587,26 +992,26 @@ class RobotController:
             if not self.reset_positions:
                 return {"status": "error", "message": "未设置复位位置，请先记录复位位置"}
             
-            actions = {}
+            arms = []
             moved_arms = []
             
             if arm in ["left", "both"] and "left_arm" in self.reset_positions:
                 reset_pos = self.reset_positions["left_arm"]
                 self.left_arm_state.target_positions = reset_pos.copy()
-                actions.update(self._get_arm_action(self.left_arm_state, "left"))
+                arms.append("left")
                 moved_arms.append("左臂")
             
             if arm in ["right", "both"] and "right_arm" in self.reset_positions:
                 reset_pos = self.reset_positions["right_arm"]
                 self.right_arm_state.target_positions = reset_pos.copy()
-                actions.update(self._get_arm_action(self.right_arm_state, "right"))
+                arms.append("right")
                 moved_arms.append("右臂")
             
-            if not actions:
+            if not arms:
                 return {"status": "error", "message": "未找到对应机械臂的复位位置"}
             
             # 发送动作
-            self.robot.send_action(actions)
+            self._command_arms(arms, f"reset:{arm}")
             
             message = f"{' 和 '.join(moved_arms)}正在移动到复位位置"
             logger.info(message)
@@ -625,80 +1030,372 @@ class RobotController:
             "reset_positions": self.reset_positions
         }
 
-    # ==================== 键位映射配置管理 ====================
+    # ==================== 回合录制 ====================
 
-    def get_keymap_config(self) -> dict[str, Any]:
-        """获取完整的键位配置"""
-        return {
-            "status": "success",
-            "config": self.keymap_manager.get_full_config()
-        }
+    def start_recording(self, metadata: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        """
+        开始录制回合
 
-    def get_all_keymap_profiles(self) -> dict[str, Any]:
-        """获取所有配置预设"""
-        return {
-            "status": "success",
-            "profiles": self.keymap_manager.get_all_profiles(),
-            "current_profile": self.keymap_manager.current_profile
-        }
+        Args:
+            metadata: 附加元数据（如任务描述、操作员）
+        """
+        try:
+            if not self._is_connected:
+                return {"status": "error", "message": "机器人未连接"}
+            if self.recorder.is_recording:
+                return {"status": "error", "message": f"正在录制回合 {self.recorder.episode_id}"}
+
+            obs = self._read_observation()
+            with self._record_lock:
+                self._record_action, self._record_input = {}, (None, 0.0)
+            observation_keys = sorted(
+                key for key, value in obs.items() if isinstance(value, (int, float, np.number))
+            )
+            action_keys = [key for key in observation_keys if key.endswith(".pos")] + BASE_ACTION_KEYS
 
-    def get_current_keymap(self) -> dict[str, Any]:
-        """获取当前激活的键位配置"""
-        keymap = self.keymap_manager.get_current_keymap()
-        if keymap:
+            episode_id = self.recorder.start(observation_keys, action_keys, {
+                "robot_id": settings.robot_id,
+                "robot_fps": settings.robot_fps,
+                "keymap_profile": self.keymap_manager.current_profile,
+                "step_levels": {
+                    "left": self.left_arm_state.step_level,
+                    "right": self.right_arm_state.step_level,
+                },
+                **(metadata or {}),
+            })
             return {
                 "status": "success",
-                "keymap": keymap,
-                "profile": self.keymap_manager.current_profile
+                "message": f"开始录制回合 {episode_id}",
+                "episode_id": episode_id,
+                "episode_dir": str(self.recorder.episode_dir),
             }
-        else:
+        except Exception as e:
+            logger.error(f"开始录制时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def stop_recording(self) -> dict[str, Any]:
+        """停止录制并返回回合摘要"""
+        try:
+            if not self.recorder.is_recording:
+                return {"status": "error", "message": "当前没有正在录制的回合"}
+            summary = self.recorder.stop()
             return {
-                "status": "error",
-                "message": "无法获取当前键位配置"
+                "status": "success",
+                "message": f"回合 {summary['episode_id']} 录制完成",
+                "episode": summary,
+                "episode_dir": str(self.recorder.episode_dir),
             }
+        except Exception as e:
+            logger.error(f"停止录制时出错: {e}")
+            return {"status": "error", "message": str(e)}
 
-    def switch_keymap_profile(self, profile_name: str) -> dict[str, Any]:
-        """切换配置预设"""
-        success, message = self.keymap_manager.switch_profile(profile_name)
-        return {
-            "status": "success" if success else "error",
-            "message": message,
-            "current_profile": self.keymap_manager.current_profile if success else None
-        }
+    def get_recording_status(self) -> dict[str, Any]:
+        """获取录制状态"""
+        return {"status": "success", **self.recorder.get_status()}
 
-    def create_keymap_profile(self, profile_name: str, name: str,
-                             description: str, keymap: dict) -> dict[str, Any]:
-        """创建新的配置预设"""
-        success, message = self.keymap_manager.create_profile(
-            profile_name, name, description, keymap
-        )
-        return {
-            "status": "success" if success else "error",
-            "message": message
-        }
+    # ==================== 遥测历史 ====================
 
-    def update_keymap_profile(self, profile_name: str, keymap: dict) -> dict[str, Any]:
-        """更新配置预设"""
-        success, message = self.keymap_manager.update_profile(profile_name, keymap)
-        return {
-            "status": "success" if success else "error",
-            "message": message
-        }
+    def get_telemetry_history(self, since: Optional[float] = None, fields: Optional[list[str]] = None,
+                              buckets: Optional[int] = None) -> dict[str, Any]:
+        """
+        查询最近的观测与指令历史
 
-    def delete_keymap_profile(self, profile_name: str) -> dict[str, Any]:
-        """删除配置预设"""
-        success, message = self.keymap_manager.delete_profile(profile_name)
-        return {
-            "status": "success" if success else "error",
-            "message": message
-        }
+        Args:
+            since: 负数表示最近多少秒，正数为 time.monotonic() 时刻
+            fields: 字段列表，指令字段加 "cmd:" 前缀
+            buckets: 服务端降采样的桶数
+        """
+        try:
+            return {"status": "success", **self.telemetry.query(since, fields, buckets)}
+        except Exception as e:
+            logger.error(f"查询遥测历史时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    # ==================== 回合回放 ====================
+
+    def start_replay(self, episode_id: str, speed: float = 1.0, loop: bool = False,
+                     position: float = 0.0) -> dict[str, Any]:
+        """
+        开始回放回合
+
+        Args:
+            episode_id: 回合 ID（录制目录下的子目录名）
+            speed: 回放速度倍率
+            loop: 是否循环
+            position: 起始位置（秒）
+        """
+        try:
+            if not self._is_connected:
+                return {"status": "error", "message": "机器人未连接"}
+            busy = self._autonomous_busy()
+            if busy:
+                return {"status": "error", "message": busy}
+
+            episode_dir = Path(settings.recordings_dir).expanduser() / episode_id
+            if not (episode_dir / "meta.json").exists():
+                return {"status": "error", "message": f"回合不存在: {episode_id}"}
+
+            self.replay = ReplayEngine(self, episode_dir, speed=speed, loop=loop)
+            self.replay.start(position)
+            return {
+                "status": "success",
+                "message": f"开始回放回合 {episode_id}",
+                "replay": self.replay.get_status(),
+            }
+        except Exception as e:
+            logger.error(f"开始回放时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def control_replay(self, command: str, value: Optional[float] = None) -> dict[str, Any]:
+        """
+        控制当前回放
+
+        Args:
+            command: "pause" / "resume" / "seek" / "speed" / "stop"
+            value: seek 的目标位置（秒）或 speed 的速度倍率
+        """
+        try:
+            if not self.replay:
+                return {"status": "error", "message": "当前没有回放"}
+
+            if command == "pause":
+                self.replay.pause()
+            elif command == "resume":
+                self.replay.resume()
+            elif command == "seek" and value is not None:
+                self.replay.seek(value)
+            elif command == "speed" and value is not None:
+                self.replay.set_speed(value)
+            elif command == "stop":
+                self.replay.stop()
+            else:
+                return {"status": "error", "message": f"无效的回放命令: {command}"}
+
+            return {"status": "success", "replay": self.replay.get_status()}
+        except Exception as e:
+            logger.error(f"控制回放时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def get_replay_status(self) -> dict[str, Any]:
+        """获取回放状态（含跟踪误差）"""
+        if not self.replay:
+            return {"status": "success", "replay": None}
+        return {"status": "success", "replay": self.replay.get_status()}
 
-    def validate_keymap(self, keymap: dict) -> dict[str, Any]:
-        """验证键位配置"""
-        valid, message = self.keymap_manager.validate_keymap(keymap)
+    # ==================== 动作源 ====================
+
+    def add_action_source(self, source: ActionSource) -> dict[str, Any]:
+        """启用动作源（从下一个控制周期开始参与仲裁）"""
+        try:
+            if not self._is_connected:
+                return {"status": "error", "message": "机器人未连接"}
+            if source.name in self.action_sources:
+                return {"status": "error", "message": f"动作源已存在: {source.name}"}
+            for name in source.cameras:
+                if self.camera_manager is None or not self.camera_manager.acquire(name, f"source:{source.name}"):
+                    return {"status": "error", "message": f"相机不存在: {name}"}
+
+            source.start(self._read_observation())
+            with self._sources_lock:
+                self.action_sources[source.name] = source
+            logger.info(f"动作源已启用: {source.name}（优先级 {source.priority}）")
+            return {"status": "success", "message": f"动作源 {source.name} 已启用", "source": source.get_status()}
+        except Exception as e:
+            try:
+                source.stop()
+            except Exception:
+                pass
+            if self.camera_manager:
+                for name in source.cameras:
+                    self.camera_manager.release(name, f"source:{source.name}")
+            logger.error(f"启用动作源时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def create_action_source(self, kind: str, name: str, priority: int = 0,
+                             params: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        """
+        按类型创建并启用动作源
+
+        Args:
+            kind: "sinusoid"（joints、amplitude、frequency、phase_step）或
+                  "process"（factory、factory_kwargs、observation_keys、action_keys、cameras、max_age）
+            name: 动作源名称
+            priority: 仲裁优先级（遥操作为 100）
+            params: 各类型的参数
+        """
+        params = dict(params or {})
+        try:
+            if kind == "sinusoid":
+                source = SinusoidSource(name, priority=priority, **params)
+            elif kind == "process":
+                if not self._is_connected:
+                    return {"status": "error", "message": "机器人未连接"}
+                cameras = params.pop("cameras", None) or []
+                camera_shapes = {}
+                for camera in cameras:
+                    capture = self.camera_manager.captures.get(camera) if self.camera_manager else None
+                    if capture is None:
+                        return {"status": "error", "message": f"相机不存在: {camera}"}
+                    capture.acquire(f"source:{name}")
+                    try:
+                        packet = capture.wait_for_frame(0, timeout=2.0)
+                    finally:
+                        capture.release(f"source:{name}")
+                    if packet is None:
+                        return {"status": "error", "message": f"相机 {camera} 没有画面"}
+                    camera_shapes[camera] = packet.image.shape
+                observation = self._read_observation()
+                params.setdefault("observation_keys", [k for k, v in observation.items() if isinstance(v, (int, float))])
+                params.setdefault("action_keys", [f"{key}.pos" for key in self._servo_keys] + BASE_ACTION_KEYS)
+                source = ProcessActionSource(name, priority=priority, cameras=cameras,
+                                             camera_shapes=camera_shapes, **params)
+            else:
+                return {"status": "error", "message": f"未知的动作源类型: {kind}"}
+        except (TypeError, ValueError) as e:
+            return {"status": "error", "message": f"动作源参数无效: {e}"}
+        return self.add_action_source(source)
+
+    def remove_action_source(self, name: str) -> dict[str, Any]:
+        """停用动作源（遥操作不能移除）"""
+        if name == TELEOP_SOURCE:
+            return {"status": "error", "message": "遥操作动作源不能移除"}
+        with self._sources_lock:
+            source = self.action_sources.pop(name, None)
+        if source is None:
+            return {"status": "error", "message": f"动作源不存在: {name}"}
+        try:
+            source.stop()
+        except Exception as e:
+            logger.error(f"停止动作源 {name} 时出错: {e}")
+        if self.camera_manager:
+            for camera in source.cameras:
+                self.camera_manager.release(camera, f"source:{name}")
+        logger.info(f"动作源已停用: {name}")
+        return {"status": "success", "message": f"动作源 {name} 已停用"}
+
+    def set_source_priority(self, name: str, priority: int) -> dict[str, Any]:
+        """调整动作源的仲裁优先级"""
+        source = self.action_sources.get(name)
+        if source is None:
+            return {"status": "error", "message": f"动作源不存在: {name}"}
+        source.priority = priority
+        return {"status": "success", "source": source.get_status()}
+
+    def list_action_sources(self) -> dict[str, Any]:
+        """列出动作源及其状态"""
+        with self._sources_lock:
+            sources = [source.get_status() for source in self.action_sources.values()]
         return {
-            "status": "success" if valid else "error",
-            "message": message,
-            "valid": valid
+            "status": "success",
+            "sources": sorted(sources, key=lambda item: item["priority"], reverse=True),
+            "control_loop": {
+                "running": self._control_thread is not None,
+                "fps": settings.robot_fps,
+                "late_ticks": self.control_late_ticks,
+            },
         }
 
+    # ==================== 运动程序 ====================
+
+    def upload_program(self, spec: dict[str, Any]) -> dict[str, Any]:
+        """
+        上传运动程序（校验并预插值，同名程序被替换）
+
+        Args:
+            spec: 程序定义，格式见 motion_program 模块
+        """
+        try:
+            kinematics = self.kinematics_left if spec.get("arm") == "left" else self.kinematics_right
+            program = compile_program(spec, kinematics)
+            if self.program_runner and self.program_runner.is_active and self.program_runner.program.name == program.name:
+                return {"status": "error", "message": f"运动程序 {program.name} 正在执行，无法替换"}
+            self.programs[program.name] = program
+            logger.info(f"运动程序已上传: {program.summary()}")
+            return {"status": "success", "message": f"运动程序 {program.name} 已上传", "program": program.summary()}
+        except ProgramError as e:
+            return {"status": "error", "message": str(e)}
+        except Exception as e:
+            logger.error(f"上传运动程序时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def list_programs(self) -> dict[str, Any]:
+        """列出已上传的运动程序"""
+        return {"status": "success", "programs": [program.summary() for program in self.programs.values()]}
+
+    def delete_program(self, name: str) -> dict[str, Any]:
+        """删除运动程序"""
+        if name not in self.programs:
+            return {"status": "error", "message": f"运动程序不存在: {name}"}
+        if self.program_runner and self.program_runner.is_active and self.program_runner.program.name == name:
+            return {"status": "error", "message": f"运动程序 {name} 正在执行，无法删除"}
+        del self.programs[name]
+        return {"status": "success", "message": f"运动程序 {name} 已删除"}
+
+    def run_program(self, name: str) -> dict[str, Any]:
+        """从当前位置开始执行运动程序"""
+        try:
+            if not self._is_connected:
+                return {"status": "error", "message": "机器人未连接"}
+            busy = self._autonomous_busy()
+            if busy:
+                return {"status": "error", "message": busy}
+            program = self.programs.get(name)
+            if program is None:
+                return {"status": "error", "message": f"运动程序不存在: {name}"}
+
+            # 程序作为动作源在控制线程中执行，只占用所控制的机械臂
+            runner = ProgramRunner(self, program, on_finish=self._on_program_finished)
+            result = self.add_action_source(runner)
+            if result["status"] != "success":
+                return result
+            self.program_runner = runner
+            return {
+                "status": "success",
+                "message": f"开始执行运动程序 {name}",
+                "program": self.program_runner.get_progress(),
+            }
+        except Exception as e:
+            logger.error(f"执行运动程序时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def _on_program_finished(self, runner: ProgramRunner):
+        """程序结束（动作源移除）后把遥操作目标同步到最后下发的位置，避免恢复遥操作时跳变"""
+        if runner.last_target is None:
+            return
+        arm_state = self.left_arm_state if runner.program.arm == "left" else self.right_arm_state
+        arm_state.target_positions = {joint: float(runner.last_target[i]) for i, joint in enumerate(ARM_JOINTS)}
+        if runner.state == "finished" and runner.program.final_cartesian is not None:
+            arm_state.current_x, arm_state.current_y, arm_state.pitch = runner.program.final_cartesian
+
+    def control_program(self, command: str) -> dict[str, Any]:
+        """
+        控制当前运动程序
+
+        Args:
+            command: "pause" / "resume" / "abort"
+        """
+        try:
+            if not self.program_runner:
+                return {"status": "error", "message": "当前没有运动程序"}
+
+            if command == "pause":
+                self.program_runner.pause()
+            elif command == "resume":
+                self.program_runner.resume()
+            elif command == "abort":
+                self.program_runner.abort()
+                if self.program_runner.name in self.action_sources:
+                    self.remove_action_source(self.program_runner.name)
+            else:
+                return {"status": "error", "message": f"无效的程序命令: {command}"}
+
+            return {"status": "success", "program": self.program_runner.get_progress()}
+        except Exception as e:
+            logger.error(f"控制运动程序时出错: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def get_program_status(self) -> dict[str, Any]:
+        """获取运动程序执行进度"""
+        if not self.program_runner:
+            return {"status": "success", "program": None}
+        return {"status": "success", "program": self.program_runner.get_progress()}
@@ -0,0 +1,71 @@
+"""
+设定值插值模块 - 把低频、阶跃式的遥操作目标平滑为控制频率下的舵机指令
+
+键盘每次按键让目标跳变 degree_step（2-5°）或 xy_step（5-12 mm），直接下发时机械臂
+会一格一格地动。插值器在每个控制周期把设定值向目标推进一步，速度与加速度受限
+（梯形速度曲线，按剩余距离提前减速，恰好停在目标处，不超调），所有关节一次向量化计算。
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class SetpointInterpolator:
+    """速度 / 加速度受限的设定值插值器（所有关节向量化）"""
+
+    def __init__(self, num_joints: int, max_velocity: float, max_acceleration: float, dt: float):
+        """
+        Args:
+            num_joints: 关节数
+            max_velocity: 最大速度（度/秒，标量或每关节数组）
+            max_acceleration: 最大加速度（度/秒²，标量或每关节数组）
+            dt: 控制周期（秒）
+        """
+        self.dt = dt
+        self.max_velocity = np.broadcast_to(np.asarray(max_velocity, dtype=np.float64), (num_joints,)).copy()
+        self.max_acceleration = np.broadcast_to(np.asarray(max_acceleration, dtype=np.float64), (num_joints,)).copy()
+        self.position = np.zeros(num_joints)
+        self.velocity = np.zeros(num_joints)
+        self.target = np.zeros(num_joints)
+
+    def reset(self, position: np.ndarray):
+        """把设定值和目标都置为 position，速度清零"""
+        self.position[:] = position
+        self.target[:] = position
+        self.velocity.fill(0.0)
+
+    def set_target(self, target: np.ndarray):
+        self.target[:] = target
+
+    @property
+    def settled(self) -> bool:
+        """设定值已到达目标且静止"""
+        return bool(np.array_equal(self.position, self.target) and not self.velocity.any())
+
+    def step(self, dt: Optional[float] = None) -> np.ndarray:
+        """
+        推进一个控制周期
+
+        Args:
+            dt: 本周期时长，默认构造时的 dt（周期延误时可传实际间隔）
+
+        Returns:
+            新的设定值（内部数组，调用方不要修改）
+        """
+        dt = dt or self.dt
+        error = self.target - self.position
+        # 以最大减速度恰好停在目标处所允许的速度
+        v_allowed = np.sign(error) * np.minimum(
+            self.max_velocity, np.sqrt(2.0 * self.max_acceleration * np.abs(error))
+        )
+        dv_max = self.max_acceleration * dt
+        self.velocity += np.clip(v_allowed - self.velocity, -dv_max, dv_max)
+
+        step = self.velocity * dt
+        # 朝目标运动且本周期会到达或越过目标的关节直接落在目标上并停止
+        # （目标反向跳到身后时仍按加速度限制先减速）
+        arrived = (step * error >= 0) & (np.abs(step) >= np.abs(error))
+        self.position += step
+        self.position[arrived] = self.target[arrived]
+        self.velocity[arrived] = 0.0
+        return self.position
@@ -0,0 +1,114 @@
+"""
+快照模块 - 时间对齐的多相机帧 + 机器人观测值
+
+以请求时刻为参考时间：每路相机从短历史中取采集时刻最接近参考时间的帧
+（必要时等待参考时刻之后的下一帧，保证两侧都有候选），
+机器人观测值在参考时刻读取一次新样本，并与观测历史插值到参考时间。
+返回结果包含每一项相对参考时间的偏差（毫秒）。
+"""
+import time
+import asyncio
+import base64
+import logging
+from typing import Any, Optional
+
+from camera_manager import CameraManager
+from robot_controller import RobotController
+
+logger = logging.getLogger(__name__)
+
+# 快照持有相机引用时使用的标识
+SNAPSHOT_HOLDER = "snapshot"
+
+
+async def capture_snapshot(
+    camera_manager: CameraManager,
+    robot_controller: Optional[RobotController],
+    camera_names: Optional[list[str]] = None,
+    width: Optional[int] = None,
+    quality: Optional[int] = None,
+    timeout: float = 1.0
+) -> dict[str, Any]:
+    """
+    采集时间对齐的快照
+
+    Args:
+        camera_manager: 相机管理器
+        robot_controller: 机器人控制器（未连接时为 None，快照中不含观测值）
+        camera_names: 相机名称列表（None 表示所有相机）
+        width: 可选缩略图宽度
+        quality: 可选 JPEG 质量
+        timeout: 等待每路相机下一帧的最长时间（秒）
+    """
+    if camera_names is None:
+        camera_names = list(camera_manager.captures.keys())
+    unknown = [name for name in camera_names if name not in camera_manager.captures]
+    if unknown:
+        return {"status": "error", "message": f"相机不存在: {unknown}"}
+
+    captures = {name: camera_manager.captures[name] for name in camera_names}
+    for capture in captures.values():
+        capture.acquire(SNAPSHOT_HOLDER)
+
+    try:
+        reference_time = time.monotonic()
+        seq_at_reference = {
+            name: capture.latest.seq if capture.latest else 0
+            for name, capture in captures.items()
+        }
+
+        # 等待每路相机在参考时刻之后的下一帧；观测值在参考时刻附近读取一次新样本
+        # （总线读取放到线程中，与等待相机帧并行，不阻塞事件循环）
+        waits = [
+            capture.wait_for_frame_async(seq_at_reference[name], timeout)
+            for name, capture in captures.items()
+        ]
+        if robot_controller:
+            waits.append(asyncio.to_thread(robot_controller.sample_observation))
+        await asyncio.gather(*waits)
+        packets = {name: capture.nearest_frame(reference_time) for name, capture in captures.items()}
+    finally:
+        for capture in captures.values():
+            capture.release(SNAPSHOT_HOLDER)
+
+    available = {name: packet for name, packet in packets.items() if packet is not None}
+    encoded = await asyncio.gather(*(
+        camera_manager.encode_jpeg_async(
+            packet, quality, camera_manager.resolve_size(name, width)
+        )
+        for name, packet in available.items()
+    ))
+
+    frames = {}
+    skews = []
+    for (name, packet), jpeg in zip(available.items(), encoded):
+        if not jpeg:
+            continue
+        skew_ms = (packet.timestamp - reference_time) * 1000
+        skews.append(abs(skew_ms))
+        frames[name] = {
+            "seq": packet.seq,
+            "timestamp": packet.timestamp,
+            "skew_ms": round(skew_ms, 2),
+            "image": base64.b64encode(jpeg).decode('utf-8'),
+        }
+    missing = [name for name in camera_names if name not in frames]
+
+    observation = None
+    observation_skew_ms = None
+    if robot_controller:
+        result = robot_controller.observation_history.interpolate(reference_time)
+        if result is not None:
+            observation, skew = result
+            observation_skew_ms = round(skew * 1000, 2)
+            skews.append(observation_skew_ms)
+
+    return {
+        "status": "success" if not missing else "partial",
+        "reference_time": reference_time,
+        "frames": frames,
+        "missing_cameras": missing,
+        "observation": observation,
+        "observation_skew_ms": observation_skew_ms,
+        "max_skew_ms": round(max(skews), 2) if skews else None,
+    }
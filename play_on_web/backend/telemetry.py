@@ -0,0 +1,242 @@
+"""
+遥测历史模块 - 最近 N 秒观测值与下发指令的内存环形缓冲
+
+RobotController 每次读取观测、下发动作时各追加一行（定长 NumPy 数组，覆盖最旧的行，
+内存不随运行时间增长）。查询按时间范围与字段返回列式数组，可在服务端按时间分桶降采样
+（每桶 mean / min / max，保留峰值），用于前端绘图。
+
+get_observation / send_action 抛出异常时，把当前缓冲连同异常信息自动转储到磁盘
+（.npz），无需常开录制也能事后分析故障。
+"""
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryRing:
+    """定长的带时间戳数值环形缓冲（字段在首次追加时确定）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.keys: list[str] = []
+        self._index: dict[str, int] = {}
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._values: Optional[np.ndarray] = None
+        self._count = 0  # 累计追加的行数
+        self._lock = threading.Lock()
+
+    def set_keys(self, keys: list[str]):
+        """设置字段并清空缓冲"""
+        with self._lock:
+            self.keys = list(keys)
+            self._index = {key: i for i, key in enumerate(self.keys)}
+            self._values = np.full((self.capacity, len(self.keys)), np.nan, dtype=np.float32)
+            self._count = 0
+
+    def append(self, timestamp: float, values: dict[str, Any]):
+        """追加一行，只记录已知的数值字段"""
+        if self._values is None:
+            self.set_keys(sorted(k for k, v in values.items() if isinstance(v, (int, float, np.number))))
+        with self._lock:
+            row = self._count % self.capacity
+            self._times[row] = timestamp
+            out = self._values[row]
+            out.fill(np.nan)
+            for key, value in values.items():
+                i = self._index.get(key)
+                if i is not None:
+                    out[i] = value
+            self._count += 1
+
+    def snapshot(self, since: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        按时间顺序复制缓冲中的行
+
+        Args:
+            since: 只返回时间戳晚于该值的行
+
+        Returns:
+            (时间戳 (N,), 数值 (N, 字段数))
+        """
+        with self._lock:
+            if self._values is None or self._count == 0:
+                return np.zeros(0), np.zeros((0, len(self.keys)), dtype=np.float32)
+            n = min(self._count, self.capacity)
+            start = (self._count - n) % self.capacity
+            order = (start + np.arange(n)) % self.capacity
+            times = self._times[order]
+            if since is not None:
+                first = int(np.searchsorted(times, since, side="right"))
+                order, times = order[first:], times[first:]
+            values = self._values[order]
+        return times, values
+
+
+def decimate(times: np.ndarray, values: np.ndarray, buckets: int) -> dict[str, np.ndarray]:
+    """
+    按时间等分为 buckets 个桶，每桶计算 mean / min / max（忽略 NaN）
+
+    Returns:
+        {"t": 桶内首个样本时刻, "mean": (B, F), "min": (B, F), "max": (B, F)}
+    """
+    edges = np.linspace(times[0], times[-1], buckets + 1)[:-1]
+    starts = np.unique(np.searchsorted(times, edges, side="left"))
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+    return {
+        "t": times[starts],
+        "mean": mean,
+        "min": np.fmin.reduceat(values, starts, axis=0),
+        "max": np.fmax.reduceat(values, starts, axis=0),
+    }
+
+
+def _to_list(array: np.ndarray) -> list:
+    """转为 JSON 列表（NaN → None）"""
+    return [None if np.isnan(v) else round(float(v), 4) for v in array]
+
+
+class TelemetryHistory:
+    """观测值与下发指令的遥测历史，以及出错时的自动转储"""
+
+    def __init__(self, seconds: float, max_rate: float, dump_dir: Path, dump_min_interval: float = 10.0):
+        """
+        Args:
+            seconds: 保留的时长（秒）
+            max_rate: 每秒最多的行数（用于确定缓冲容量）
+            dump_dir: 故障转储目录
+            dump_min_interval: 两次转储的最小间隔（秒），避免连续故障刷满磁盘
+        """
+        self.seconds = seconds
+        capacity = max(1, int(seconds * max_rate))
+        self.observations = TelemetryRing(capacity)
+        self.commands = TelemetryRing(capacity)
+        self.dump_dir = Path(dump_dir).expanduser()
+        self.dump_min_interval = dump_min_interval
+        self.dumps_written = 0
+        self._last_dump = 0.0
+        self._dump_lock = threading.Lock()
+
+    def record_observation(self, timestamp: float, obs: dict[str, Any]):
+        self.observations.append(timestamp, obs)
+
+    def record_command(self, timestamp: float, action: dict[str, Any]):
+        self.commands.append(timestamp, action)
+
+    def query(self, since: Optional[float] = None, fields: Optional[list[str]] = None,
+              buckets: Optional[int] = None) -> dict[str, Any]:
+        """
+        查询历史
+
+        Args:
+            since: 负数表示最近多少秒；正数为 time.monotonic() 时刻（可用上次返回的 t_end 增量轮询）
+            fields: 字段名列表（指令字段加 "cmd:" 前缀），None 表示全部字段
+            buckets: 降采样桶数，None 或样本数不超过桶数时返回原始数据
+
+        Returns:
+            {"t_now", "observation": {...}, "command": {...}}，
+            每部分为 {"count", "t_end", "decimated", "t": [...], "fields": {...}}
+        """
+        now = time.monotonic()
+        if since is None:
+            since = -self.seconds
+        if since < 0:
+            since = now + since
+
+        obs_fields = cmd_fields = None
+        if fields is not None:
+            obs_fields = [f for f in fields if not f.startswith("cmd:")]
+            cmd_fields = [f[len("cmd:"):] for f in fields if f.startswith("cmd:")]
+
+        return {
+            "t_now": now,
+            "observation": self._query_ring(self.observations, since, obs_fields, buckets),
+            "command": self._query_ring(self.commands, since, cmd_fields, buckets),
+        }
+
+    @staticmethod
+    def _query_ring(ring: TelemetryRing, since: float, fields: Optional[list[str]],
+                    buckets: Optional[int]) -> dict[str, Any]:
+        times, values = ring.snapshot(since)
+        names = ring.keys if fields is None else [f for f in fields if f in ring.keys]
+        columns = [ring.keys.index(name) for name in names]
+        values = values[:, columns]
+
+        result: dict[str, Any] = {
+            "count": len(times),
+            "t_end": float(times[-1]) if len(times) else since,
+            "decimated": False,
+        }
+        if buckets and len(times) > buckets:
+            reduced = decimate(times, values, buckets)
+            result["decimated"] = True
+            result["t"] = [round(float(t), 4) for t in reduced["t"]]
+            result["fields"] = {
+                name: {stat: _to_list(reduced[stat][:, j]) for stat in ["mean", "min", "max"]}
+                for j, name in enumerate(names)
+            }
+        else:
+            result["t"] = [round(float(t), 4) for t in times]
+            result["fields"] = {name: _to_list(values[:, j]) for j, name in enumerate(names)}
+        return result
+
+    def dump(self, reason: str, error: Optional[BaseException] = None) -> Optional[Path]:
+        """
+        把当前缓冲转储到磁盘（后台线程写入，调用方不等待）
+
+        Returns:
+            转储文件路径；距上次转储不足 dump_min_interval 时返回 None
+        """
+        now = time.monotonic()
+        with self._dump_lock:
+            if now - self._last_dump < self.dump_min_interval:
+                return None
+            self._last_dump = now
+
+        obs_times, obs_values = self.observations.snapshot()
+        cmd_times, cmd_values = self.commands.snapshot()
+        path = self.dump_dir / f"crash_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{reason}.npz"
+        error_text = "".join(traceback.format_exception(error)) if error else ""
+        arrays = {
+            "observation_t": obs_times,
+            "observation": obs_values,
+            "observation_keys": np.array(self.observations.keys),
+            "command_t": cmd_times,
+            "command": cmd_values,
+            "command_keys": np.array(self.commands.keys),
+            "dump_time": np.array(now),
+            "reason": np.array(reason),
+            "error": np.array(error_text),
+        }
+
+        def write():
+            try:
+                self.dump_dir.mkdir(parents=True, exist_ok=True)
+                np.savez_compressed(path, **arrays)
+                self.dumps_written += 1
+                logger.warning(f"遥测历史已转储: {path}")
+            except Exception as e:
+                logger.error(f"转储遥测历史失败: {e}")
+
+        threading.Thread(target=write, name="telemetry-dump", daemon=True).start()
+        return path
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "capacity": self.observations.capacity,
+            "observation_fields": self.observations.keys,
+            "command_fields": self.commands.keys,
+            "dumps_written": self.dumps_written,
+        }
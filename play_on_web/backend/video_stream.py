@@ -0,0 +1,237 @@
+"""
+视频编码流模块 - 可选的帧间编码（H.264 / VP8）相机流
+
+每路相机每种编码格式只有一个编码线程（VideoStream），从共享采集缓冲取帧，
+编码一次后分发给所有订阅者，因此观看者增加只增加带宽。
+新订阅者加入时强制下一帧为关键帧，订阅者在收到关键帧之前不会收到任何数据。
+
+输出为裸码流分片：H.264 为 Annex-B NAL 单元（SPS/PPS 随关键帧内联），
+VP8 为逐帧裸数据。依赖 PyAV（pip install av），不可用时调用方应回退到 JPEG。
+"""
+import time
+import asyncio
+import logging
+import threading
+from fractions import Fraction
+from dataclasses import dataclass
+from typing import Any, Optional, TYPE_CHECKING
+
+from config import settings
+
+if TYPE_CHECKING:
+    from camera_manager import CameraCapture
+
+logger = logging.getLogger(__name__)
+
+# 编码格式 → PyAV 编码器名称
+VIDEO_CODECS = {
+    "h264": "libx264",
+    "vp8": "libvpx",
+}
+
+# 每个订阅者最多缓存的分片数，超过则丢弃并等待下一个关键帧
+SUBSCRIBER_QUEUE_SIZE = 30
+CAPTURE_STOPPED_BACKOFF = 0.5  # 采集线程未运行（如重连失败）时再次检查的间隔（秒）
+
+
+def is_video_codec_available(codec: str) -> bool:
+    """检查 PyAV 及对应编码器是否可用"""
+    if codec not in VIDEO_CODECS:
+        return False
+    try:
+        import av
+        av.codec.Codec(VIDEO_CODECS[codec], "w")
+        return True
+    except Exception:
+        return False
+
+
+@dataclass
+class VideoChunk:
+    """一个编码后的码流分片"""
+    camera: str
+    codec: str
+    data: bytes
+    keyframe: bool
+    pts: int  # 毫秒
+    seq: int  # 对应的采集帧序号
+
+
+class VideoSubscriber:
+    """视频流订阅者（通常对应一个相机会话）"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+        self.waiting_for_keyframe = True
+        self.dropped = 0
+
+    def offer(self, chunk: VideoChunk) -> bool:
+        """
+        在事件循环线程中投递分片
+
+        Returns:
+            False 表示队列已满、已丢弃并需要新的关键帧
+        """
+        if self.waiting_for_keyframe:
+            if not chunk.keyframe:
+                return True
+            self.waiting_for_keyframe = False
+
+        try:
+            self.queue.put_nowait(chunk)
+            return True
+        except asyncio.QueueFull:
+            # 丢弃帧间分片后解码会出错，必须从下一个关键帧重新开始
+            self.dropped += 1
+            self.waiting_for_keyframe = True
+            return False
+
+
+class VideoStream:
+    """单路相机的视频编码流，所有订阅者共享一次编码"""
+
+    def __init__(self, name: str, capture: "CameraCapture", codec: str):
+        self.name = name
+        self.capture = capture
+        self.codec = codec
+        self.frames_encoded = 0
+        self.bytes_encoded = 0
+        self._subscribers: list[VideoSubscriber] = []
+        self._lock = threading.Lock()
+        self._force_keyframe = True
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, subscriber: VideoSubscriber):
+        """添加订阅者，并请求关键帧"""
+        with self._lock:
+            self._subscribers.append(subscriber)
+            self._force_keyframe = True
+            start = not self._running
+            self._running = True
+        if start:
+            self._start()
+
+    def unsubscribe(self, subscriber: VideoSubscriber):
+        """移除订阅者，没有订阅者时编码线程自动退出"""
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def request_keyframe(self):
+        """请求下一帧编码为关键帧"""
+        self._force_keyframe = True
+
+    def stop(self):
+        """停止编码线程"""
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"video-{self.codec}-{self.name}", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"相机 {self.name} 的 {self.codec} 编码流已启动")
+
+    def _create_encoder(self, width: int, height: int):
+        """创建 PyAV 编码器（低延迟配置）"""
+        import av
+
+        fps = self.capture.config.fps
+        ctx = av.CodecContext.create(VIDEO_CODECS[self.codec], "w")
+        ctx.width = width
+        ctx.height = height
+        ctx.pix_fmt = "yuv420p"
+        ctx.time_base = Fraction(1, 1000)
+        ctx.framerate = Fraction(fps, 1)
+        ctx.bit_rate = settings.camera_video_bitrate
+        ctx.gop_size = max(1, int(fps * settings.camera_video_gop_seconds))
+        if self.codec == "h264":
+            ctx.options = {"preset": "ultrafast", "tune": "zerolatency"}
+        else:
+            ctx.options = {"deadline": "realtime", "cpu-used": "8", "lag-in-frames": "0"}
+        return ctx
+
+    def _run(self):
+        """编码循环：等待新帧 → 编码 → 分发"""
+        import av
+
+        encoder = None
+        start_ts = None
+        last_seq = 0
+
+        try:
+            while True:
+                with self._lock:
+                    # 在锁内判断退出，保证与 subscribe 的启动判断不冲突
+                    if not self._running or not self._subscribers:
+                        self._running = False
+                        break
+
+                packet = self.capture.wait_for_frame(last_seq, timeout=0.5)
+                if packet is None:
+                    if not self.capture.is_running:
+                        # 采集未运行时 wait_for_frame 立即返回，退避以免空转占满一个核心
+                        time.sleep(CAPTURE_STOPPED_BACKOFF)
+                    continue
+                last_seq = packet.seq
+
+                image = packet.image
+                if encoder is None:
+                    encoder = self._create_encoder(image.shape[1], image.shape[0])
+                    start_ts = packet.timestamp
+
+                frame = av.VideoFrame.from_ndarray(image, format="rgb24").reformat(format="yuv420p")
+                frame.pts = int((packet.timestamp - start_ts) * 1000)
+                if self._force_keyframe:
+                    self._force_keyframe = False
+                    frame.pict_type = "I"
+
+                for encoded in encoder.encode(frame):
+                    data = bytes(encoded)
+                    self.frames_encoded += 1
+                    self.bytes_encoded += len(data)
+                    self._dispatch(VideoChunk(
+                        camera=self.name,
+                        codec=self.codec,
+                        data=data,
+                        keyframe=encoded.is_keyframe,
+                        pts=int(encoded.pts or 0),
+                        seq=packet.seq,
+                    ))
+        except Exception as e:
+            logger.error(f"相机 {self.name} 的 {self.codec} 编码出错: {e}")
+            with self._lock:
+                self._running = False
+        logger.info(f"相机 {self.name} 的 {self.codec} 编码流已停止")
+
+    def _dispatch(self, chunk: VideoChunk):
+        """把分片投递给所有订阅者（在各自的事件循环线程中执行）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(self._offer, subscriber, chunk)
+
+    def _offer(self, subscriber: VideoSubscriber, chunk: VideoChunk):
+        if not subscriber.offer(chunk):
+            self.request_keyframe()
+
+    def get_stats(self) -> dict[str, Any]:
+        """获取编码统计"""
+        return {
+            "camera": self.name,
+            "codec": self.codec,
+            "running": self._running,
+            "subscribers": self.subscriber_count,
+            "frames_encoded": self.frames_encoded,
+            "bytes_encoded": self.bytes_encoded,
+        }
@@ -28,11 +28,11 @@ apiClient.interceptors.response.use(
 
 // 设备扫描 API
 export const deviceApi = {
-  getPorts: () => apiClient.get('/devices/ports'),
-  startPortDetection: () => apiClient.get('/devices/ports/detect/start'),
-  completePortDetection: (portsBefore: string[]) => 
-    apiClient.post('/devices/ports/detect/complete', { ports_before: portsBefore }),
-  getCameras: () => apiClient.get('/devices/cameras'),
+  getPorts: (refresh = false) => apiClient.get('/devices/ports', { params: refresh ? { refresh } : undefined }),
+  // 长轮询：拔出 USB 后立即返回识别的端口（timeout 秒内无变化返回 status=timeout）
+  identifyPort: (timeout = 30, signal?: AbortSignal) =>
+    apiClient.get('/devices/ports/identify', { params: { timeout }, timeout: (timeout + 5) * 1000, signal }),
+  getCameras: (refresh = false) => apiClient.get('/devices/cameras', { params: refresh ? { refresh } : undefined }),
 }
 
 // 机器人控制 API
@@ -51,6 +51,11 @@ export const robotApi = {
     apiClient.post('/robot/set_step_level', { arm, level }),
   stopBase: () => apiClient.post('/robot/stop_base'),
   getObservation: () => apiClient.get('/robot/observation'),
+  // 最近的观测与指令历史（since 为负数表示最近多少秒，decimate 为降采样桶数）
+  getHistory: (params: { since?: number; fields?: string[]; decimate?: number } = {}) =>
+    apiClient.get('/robot/history', {
+      params: { ...params, fields: params.fields?.join(',') },
+    }),
 }
 
 // 相机管理 API
@@ -65,8 +70,8 @@ export const cameraApi = {
   }) => apiClient.post('/cameras/add', data),
   removeCamera: (name: string) =>
     apiClient.delete(`/cameras/${name}`),
-  getFrame: (name: string) =>
-    apiClient.get(`/cameras/${name}/frame`, { responseType: 'blob' }),
+  getFrame: (name: string, width?: number) =>
+    apiClient.get(`/cameras/${name}/frame`, { params: { width }, responseType: 'blob' }),
 }
 
 // 键位配置管理 API
@@ -170,3 +175,26 @@ export const createCameraWebSocket = (
   return ws
 }
 
+// 设备热插拔 WebSocket：先推送 inventory，之后推送 device_added / device_removed
+export const createDeviceWebSocket = (
+  onMessage: (data: any) => void,
+  onClose?: () => void
+): WebSocket => {
+  const wsUrl = `ws://${window.location.hostname}:8000/ws/devices`
+  const ws = new WebSocket(wsUrl)
+
+  ws.onmessage = (event) => {
+    const data = JSON.parse(event.data)
+    onMessage(data)
+  }
+
+  ws.onerror = (error) => {
+    console.error('Device WebSocket error:', error)
+  }
+
+  ws.onclose = () => {
+    onClose?.()
+  }
+
+  return ws
+}
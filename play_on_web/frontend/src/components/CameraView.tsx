@@ -8,7 +8,7 @@ interface CameraFrame {
 }
 
 function CameraView() {
-  const { robotConfig, setCameraWs } = useRobotStore()
+  const { robotConfig, cameraWs, setCameraWs } = useRobotStore()
   const [frames, setFrames] = useState<CameraFrame>({})
   const [selectedCamera, setSelectedCamera] = useState<string | null>(null)
   
@@ -22,7 +22,8 @@ function CameraView() {
       cameraNames,
       (data) => {
         if (data.type === 'camera_frames') {
-          setFrames(data.data)
+          // 每条消息只包含本次到期的相机，合并到已有画面
+          setFrames((prev) => ({ ...prev, ...data.data }))
         }
       },
       (error) => {
@@ -47,6 +48,24 @@ function CameraView() {
     }
   }, [cameraNames.length])
   
+  // 网格视图只需要缩略图；单个视图时选中的相机使用原始尺寸
+  useEffect(() => {
+    if (!cameraWs) return
+
+    const sizes: Record<string, string> = {}
+    cameraNames.forEach((name) => {
+      sizes[name] = name === selectedCamera ? 'full' : 'thumb'
+    })
+    const subscribe = () => cameraWs.send(JSON.stringify({ type: 'subscribe', sizes }))
+
+    if (cameraWs.readyState === WebSocket.OPEN) {
+      subscribe()
+    } else if (cameraWs.readyState === WebSocket.CONNECTING) {
+      cameraWs.addEventListener('open', subscribe, { once: true })
+      return () => cameraWs.removeEventListener('open', subscribe)
+    }
+  }, [cameraWs, selectedCamera, cameraNames.length])
+  
   if (cameraNames.length === 0) {
     return (
       <div className="camera-view empty">
@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import './DeviceSetup.css'
-import { deviceApi, robotApi, cameraApi } from '../api/client'
+import { deviceApi, robotApi, cameraApi, createDeviceWebSocket } from '../api/client'
 import { useRobotStore, Camera } from '../stores/robotStore'
 
 interface DeviceSetupProps {
@@ -18,7 +18,7 @@ function DeviceSetup({ onComplete }: DeviceSetupProps) {
   const [selectedPort1, setSelectedPort1] = useState('')
   const [selectedPort2, setSelectedPort2] = useState('')
   const [detectingPort, setDetectingPort] = useState<'port1' | 'port2' | null>(null)
-  const [portsBefore, setPortsBefore] = useState<string[]>([])
+  const detectionAbort = useRef<AbortController | null>(null)
   
   // Camera 相关状态
   const [selectedCameras, setSelectedCameras] = useState<Map<string, Camera>>(new Map())
@@ -32,11 +32,11 @@ function DeviceSetup({ onComplete }: DeviceSetupProps) {
     setIsConnected,
   } = useRobotStore()
   
-  // 加载可用串口
-  const loadPorts = async () => {
+  // 加载可用串口（refresh 为 true 时后端立即重新扫描）
+  const loadPorts = async (refresh = false) => {
     try {
       setError(null) // 清除之前的错误
-      const response = await deviceApi.getPorts()
+      const response = await deviceApi.getPorts(refresh)
       setAvailablePorts(response.data.ports)
       console.log(`✅ 已加载 ${response.data.ports.length} 个串口`)
     } catch (err: any) {
@@ -57,53 +57,68 @@ function DeviceSetup({ onComplete }: DeviceSetupProps) {
   useEffect(() => {
     loadPorts()
     loadCameras()
+
+    // 设备热插拔时更新列表（后端返回缓存结果，开销很小）
+    const ws = createDeviceWebSocket((message) => {
+      if (message.type === 'device_added' || message.type === 'device_removed') {
+        if (message.data.kind === 'port') {
+          loadPorts()
+        } else {
+          loadCameras()
+        }
+      }
+    })
+    return () => ws.close()
   }, [])
   
-  // 开始端口检测
+  // 端口检测：请求发出后用户拔出 USB，后端检测到端口消失立即返回
   const startPortDetection = async (portNum: 'port1' | 'port2') => {
+    const controller = new AbortController()
+    detectionAbort.current = controller
+    setDetectingPort(portNum)
+    setError(null)
+
     try {
-      setDetectingPort(portNum)
-      const response = await deviceApi.startPortDetection()
-      setPortsBefore(response.data.ports_before)
-    } catch (err: any) {
-      setError('开始端口检测失败: ' + err.message)
-      setDetectingPort(null)
-    }
-  }
-  
-  // 完成端口检测
-  const completePortDetection = async () => {
-    try {
-      const response = await deviceApi.completePortDetection(portsBefore)
+      const response = await deviceApi.identifyPort(30, controller.signal)
       if (response.data.status === 'success') {
         const detectedPort = response.data.port
-        if (detectingPort === 'port1') {
+        if (portNum === 'port1') {
           setSelectedPort1(detectedPort)
-        } else if (detectingPort === 'port2') {
+        } else {
           setSelectedPort2(detectedPort)
         }
         
         // 将检测到的端口添加到可用端口列表中（如果不存在）
         // 因为此时 USB 可能还没重新插回，所以手动添加
-        if (!availablePorts.includes(detectedPort)) {
-          setAvailablePorts([...availablePorts, detectedPort].sort())
+        const { availablePorts: currentPorts } = useRobotStore.getState()
+        if (!currentPorts.includes(detectedPort)) {
+          setAvailablePorts([...currentPorts, detectedPort].sort())
         }
         
-        setDetectingPort(null)
-        setError(null) // 清除错误信息
-        
         // 显示成功提示
         console.log(`✅ 成功识别端口: ${detectedPort}`)
       } else {
         setError(response.data.message)
-        setDetectingPort(null)
       }
     } catch (err: any) {
-      setError('完成端口检测失败: ' + err.message)
-      setDetectingPort(null)
+      if (!controller.signal.aborted) {
+        setError('端口检测失败: ' + err.message)
+      }
+    } finally {
+      if (detectionAbort.current === controller) {
+        detectionAbort.current = null
+        setDetectingPort(null)
+      }
     }
   }
   
+  // 取消端口检测
+  const cancelPortDetection = () => {
+    detectionAbort.current?.abort()
+    detectionAbort.current = null
+    setDetectingPort(null)
+  }
+  
   // 连接机器人
   const connectRobot = async () => {
     if (!selectedPort1 || !selectedPort2) {
@@ -209,7 +224,7 @@ function DeviceSetup({ onComplete }: DeviceSetupProps) {
               <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '1rem' }}>
                 <h3 style={{ margin: 0 }}>选择串口 {availablePorts.length > 0 && <span style={{ fontSize: '0.875rem', color: 'var(--gray-600)', fontWeight: 'normal' }}>({availablePorts.length} 个可用)</span>}</h3>
                 <button 
-                  onClick={loadPorts} 
+                  onClick={() => loadPorts(true)} 
                   className="btn btn-text"
                   style={{ fontSize: '0.875rem' }}
                   disabled={detectingPort !== null}
@@ -290,15 +305,12 @@ function DeviceSetup({ onComplete }: DeviceSetupProps) {
               
               {detectingPort && (
                 <div className="detection-prompt">
-                  <p>👉 请拔出 USB 线缆，然后点击"完成检测"</p>
+                  <p>👉 请拔出 USB 线缆，拔出后会自动识别端口</p>
                   <p style={{ fontSize: '0.875rem', marginTop: '0.5rem', color: 'var(--gray-600)' }}>
                     💡 提示：检测完成后可以重新插入 USB，或稍后手动选择
                   </p>
                   <div style={{ display: 'flex', gap: '0.5rem', marginTop: '1rem' }}>
-                    <button onClick={completePortDetection} className="btn btn-primary">
-                      完成检测
-                    </button>
-                    <button onClick={() => setDetectingPort(null)} className="btn btn-text">
+                    <button onClick={cancelPortDetection} className="btn btn-text">
                       取消
                     </button>
                   </div>
@@ -101,11 +101,8 @@ function KeyboardControl() {
       if (mapping) {
         setPressedKeys((prev) => new Set(prev).add(key))
 
-        if (mapping.category === 'base') {
-          sendBaseAction(mapping.action)
-        } else {
-          sendAction(mapping.category, mapping.action)
-        }
+        // 按键由后端按当前预设的反向键位映射解析
+        sendKey(key)
 
         e.preventDefault()
       }
@@ -122,7 +119,7 @@ function KeyboardControl() {
       // 如果是底盘控制键，发送停止命令
       const mapping = reverseKeymap[key]
       if (mapping && mapping.category === 'base') {
-        sendBaseStop()
+        sendKey(key, true)
         e.preventDefault()
       }
     }
@@ -136,28 +133,11 @@ function KeyboardControl() {
     }
   }, [teleopWs, reverseKeymap])
   
-  const sendAction = (arm: string, action: string) => {
-    if (teleopWs && teleopWs.readyState === WebSocket.OPEN) {
-      teleopWs.send(JSON.stringify({
-        type: 'keyboard_action',
-        data: { arm, action }
-      }))
-    }
-  }
-  
-  const sendBaseAction = (direction: string) => {
-    if (teleopWs && teleopWs.readyState === WebSocket.OPEN) {
-      teleopWs.send(JSON.stringify({
-        type: 'base_action',
-        data: { direction }
-      }))
-    }
-  }
-  
-  const sendBaseStop = () => {
+  const sendKey = (key: string, up = false) => {
     if (teleopWs && teleopWs.readyState === WebSocket.OPEN) {
       teleopWs.send(JSON.stringify({
-        type: 'base_stop'
+        type: 'key',
+        data: up ? { key, up } : { key }
       }))
     }
   }